@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Compare the cost per element of checking NumPy arrays with the helpers of nose2pytest.assert_tools, versus the
+element by element Python loops they replace:
+
+- almost equal: a loop calling assert_almost_equal() (unittest's assertAlmostEqual(), as in nose) on each pair of
+  elements, versus assert_all_almost_equal() without NumPy (one by one) and with NumPy (vectorized);
+- dict of arrays: assert_dict_contains_subset() on a dict whose values are arrays, versus a loop comparing
+  the elements of each array.
+
+Usage:
+
+    python benchmarks/bench_assert_tools.py [num_elements] [num_repeats]
+"""
+
+import sys
+import time
+import unittest
+
+import numpy
+
+from nose2pytest import assert_tools
+from nose2pytest.assert_tools import assert_all_almost_equal, assert_dict_contains_subset
+
+
+class _Dummy(unittest.TestCase):
+    def do_nothing(self):
+        pass
+
+
+assert_almost_equal = _Dummy('do_nothing').assertAlmostEqual
+
+
+def best_time(func: callable, num_repeats: int) -> float:
+    best = None
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def almost_equal_loop(first, second):
+    for a, b in zip(first, second):
+        assert_almost_equal(a, b)
+
+
+def assert_all_almost_equal_python(first, second):
+    get_numpy = assert_tools._get_numpy
+    assert_tools._get_numpy = lambda: None
+    try:
+        assert_all_almost_equal(first, second)
+    finally:
+        assert_tools._get_numpy = get_numpy
+
+
+def dict_subset_loop(subset, dictionary):
+    for key, value in subset.items():
+        assert key in dictionary
+        for a, b in zip(value, dictionary[key]):
+            assert a == b
+
+
+def main():
+    num_elements = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    first = numpy.linspace(0, 1, num_elements)
+    second = first + 1e-9
+    first_list, second_list = first.tolist(), second.tolist()
+    dictionary = {'array_{}'.format(index): numpy.arange(num_elements // 10) for index in range(10)}
+    subset = {key: value.copy() for key, value in dictionary.items()}
+
+    cases = [
+        ('almost equal, loop', lambda: almost_equal_loop(first_list, second_list)),
+        ('almost equal, helper without NumPy', lambda: assert_all_almost_equal_python(first_list, second_list)),
+        ('almost equal, helper with NumPy', lambda: assert_all_almost_equal(first, second)),
+        ('dict of arrays, loop', lambda: dict_subset_loop(subset, dictionary)),
+        ('dict of arrays, assert_dict_contains_subset', lambda: assert_dict_contains_subset(subset, dictionary)),
+    ]
+    print('{} elements, best of {} runs'.format(num_elements, num_repeats))
+    for name, func in cases:
+        elapsed = best_time(func, num_repeats)
+        print('{:45} {:10.3f} ms {:10.1f} ns/element'.format(name, elapsed * 1000, elapsed / num_elements * 1e9))
+
+
+if __name__ == '__main__':
+    main()
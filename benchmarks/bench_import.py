@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Measure what the nose2pytest.assert_tools pytest plugin costs each pytest session: the time taken to import it and
+run its pytest_configure() hook in a fresh interpreter in which pytest is already imported (as it is when pytest
+loads its plugins), whether that imports unittest, and the time taken to get one of the assert_ functions taken
+from unittest.TestCase on first access. It also times whole pytest sessions that collect nothing, with and without
+the plugin.
+
+Usage:
+
+    python benchmarks/bench_import.py [num_repeats]
+"""
+
+import sys
+import time
+import tempfile
+import subprocess
+
+
+PLUGIN_NAME = 'pytest_nose_assert_tools'
+
+PROBE = '''
+import sys, time
+import pytest
+unittest_imported = 'unittest' in sys.modules
+start = time.perf_counter()
+import nose2pytest.assert_tools
+nose2pytest.assert_tools.pytest_configure()
+configured = time.perf_counter()
+unittest_imported_by_plugin = not unittest_imported and 'unittest' in sys.modules
+pytest.assert_raises_regex
+first_access = time.perf_counter()
+print(configured - start, first_access - configured, unittest_imported_by_plugin)
+'''
+
+
+def time_plugin(num_repeats: int) -> (float, float, bool):
+    """
+    Time the plugin in fresh interpreters.
+    :return: triple (best time to import and configure, best time of the first access to an assert_ function of
+        unittest, whether importing and configuring the plugin imported unittest)
+    """
+    best_load = best_access = None
+    for _ in range(num_repeats):
+        output = subprocess.run([sys.executable, '-c', PROBE], stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout
+        load, access, unittest_imported = output.split()
+        best_load = float(load) if best_load is None else min(best_load, float(load))
+        best_access = float(access) if best_access is None else min(best_access, float(access))
+    return best_load, best_access, unittest_imported == 'True'
+
+
+def time_sessions(num_repeats: int, plugin_args: [str]) -> float:
+    """Get the best time of a pytest session that collects nothing, run with plugin_args"""
+    best = None
+    with tempfile.TemporaryDirectory() as empty_dir:
+        for _ in range(num_repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider'] + plugin_args,
+                           cwd=empty_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    load, access, unittest_imported = time_plugin(num_repeats)
+    with_plugin = time_sessions(num_repeats, [])
+    without_plugin = time_sessions(num_repeats, ['-p', 'no:' + PLUGIN_NAME])
+
+    print('best of {} runs'.format(num_repeats))
+    print('import and pytest_configure(): {:8.2f} ms{}'.format(
+        load * 1000, ' (imports unittest)' if unittest_imported else ''))
+    print('first access to a function:    {:8.2f} ms'.format(access * 1000))
+    print('empty pytest session:          {:8.2f} ms with the plugin, {:.2f} ms without'.format(
+        with_plugin * 1000, without_plugin * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Compare the time taken by NoseConversionRefactoringTool to convert a module when the assertion fixers are
+dispatched by fissix's bottom matcher (the default) versus when the same fixers are not BM_compatible, so fissix
+tries each of them on every node of the tree. This only measures the cost of the dispatch of the current fixers
+(a few fixers, each handling several nose functions), not that of the original fixers (one per nose function)
+before they were made BM_compatible: the difference is within the noise between runs, as parsing and transform()
+dominate.
+
+Usage:
+
+    python benchmarks/bench_matching.py [num_repeats]
+"""
+
+import gc
+import sys
+import time
+import logging
+
+from nose2pytest.script import NoseConversionRefactoringTool
+
+
+class NoBottomMatcherTool(NoseConversionRefactoringTool):
+    """Same fixers, but not given to the bottom matcher so fissix tries each of them on every node."""
+
+    def get_fixers(self):
+        pre_fixers, post_fixers = super().get_fixers()
+        for fixer in pre_fixers + post_fixers:
+            fixer.BM_compatible = False
+        return pre_fixers, post_fixers
+
+
+SOURCE_TEMPLATE = '''
+def test_{index}(self):
+    obj = make_object({index}, name="obj{index}")
+    result = [process(x, obj) for x in range(10) if x % 2]
+    log.debug("result %s", result)
+    assert_equal(obj.value, {index})
+    assert_true(result, "empty result")
+    assert_in(obj.name, names + ["other"])
+    assert_almost_equal(obj.ratio, 0.5, places=3)
+    other = {{"a": 1, "b": [1, 2, 3], "c": obj.children[0].value}}
+    assert_is_instance(other, dict)
+'''
+
+
+def make_source(num_tests: int = 200) -> str:
+    return ''.join(SOURCE_TEMPLATE.format(index=index) for index in range(num_tests))
+
+
+def time_tool(refac: NoseConversionRefactoringTool, source: str, num_repeats: int) -> (float, float):
+    """
+    Time the conversion of source by refac.
+    :return: pair (best total time, best time spent in refactor_tree(), i.e. excluding parsing)
+    """
+    tree = refac.driver.parse_string(source)
+    best_total = best_matching = None
+    for _ in range(num_repeats):
+        gc.collect()
+        start = time.perf_counter()
+        refac.refactor_string(source, 'bench')
+        total = time.perf_counter() - start
+
+        tree_copy = tree.clone()
+        tree_copy.used_names = tree.used_names
+        tree_copy.future_features = frozenset()
+        start = time.perf_counter()
+        refac.refactor_tree(tree_copy, 'bench')
+        matching = time.perf_counter() - start
+
+        best_total = total if best_total is None else min(best_total, total)
+        best_matching = matching if best_matching is None else min(best_matching, matching)
+
+    return best_total, best_matching
+
+
+def main():
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    source = make_source()
+
+    logging.getLogger('nose2pytest').setLevel(logging.WARNING)
+    bottom_matcher = NoseConversionRefactoringTool()
+    per_node = NoBottomMatcherTool()
+    assert str(bottom_matcher.refactor_string(source, 'bench')) == str(per_node.refactor_string(source, 'bench'))
+
+    gc.disable()
+    bm_total, bm_matching = time_tool(bottom_matcher, source, num_repeats)
+    traversal_total, traversal_matching = time_tool(per_node, source, num_repeats)
+    gc.enable()
+    print('{} lines, best of {} runs'.format(source.count('\n'), num_repeats))
+    print('                    {:>10} {:>10}'.format('total', 'matching'))
+    print('no bottom matcher:  {:8.3f} s {:8.3f} s'.format(traversal_total, traversal_matching))
+    print('bottom matcher:     {:8.3f} s {:8.3f} s'.format(bm_total, bm_matching))
+    print('speedup:            {:8.2f}x  {:8.2f}x'.format(traversal_total / bm_total,
+                                                         traversal_matching / bm_matching))
+
+
+if __name__ == '__main__':
+    main()
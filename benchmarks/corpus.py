@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Deterministic generator of synthetic Nose test modules, used by the benchmarks. The same parameters (including
+the seed) always generate the same files, so that timings of different versions of nose2pytest can be compared.
+
+Usage:
+
+    python -m benchmarks.corpus OUTPUT_DIR [--files N] [--lines N] [--density D] [--complexity C]
+                                           [--multiline M] [--seed S]
+"""
+
+import json
+import random
+import argparse
+from pathlib import Path
+
+
+class CorpusSpec:
+    """Parameters of a generated corpus"""
+
+    def __init__(self, num_files: int = 100, lines_per_file: int = 300, call_density: float = 0.3,
+                 arg_complexity: int = 1, multiline_ratio: float = 0.1, seed: int = 0):
+        """
+        :param num_files: number of test modules to generate
+        :param lines_per_file: approximate number of lines of each module
+        :param call_density: fraction of the statements in test functions that are calls to nose functions
+        :param arg_complexity: 0 for names and numbers as arguments of nose functions, 1 to also have
+            attributes, calls and subscripts, 2 to also have operators, comparisons and comprehensions
+        :param multiline_ratio: fraction of the nose function calls that have one argument per line
+        :param seed: seed of the random number generator
+        """
+        self.num_files = num_files
+        self.lines_per_file = lines_per_file
+        self.call_density = call_density
+        self.arg_complexity = arg_complexity
+        self.multiline_ratio = multiline_ratio
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+# nose function name -> number of (positional) arguments, not counting the optional message
+NOSE_FUNCS = dict(
+    assert_equal=2,
+    eq_=2,
+    assert_not_equal=2,
+    ok_=1,
+    assert_true=1,
+    assert_false=1,
+    assert_is_none=1,
+    assert_is_not_none=1,
+    assert_in=2,
+    assert_not_in=2,
+    assert_is=2,
+    assert_is_instance=2,
+    assert_greater=2,
+    assert_less_equal=2,
+    assert_dict_equal=2,
+    assert_almost_equal=2,
+    assert_regex=2,
+)
+
+NAMES = ['result', 'expected', 'value', 'obj', 'items', 'count', 'name', 'data', 'response', 'other']
+ATTRS = ['value', 'name', 'children', 'status', 'size', 'parent']
+FUNCS = ['len', 'sorted', 'make_object', 'compute', 'str', 'process']
+OPERATORS = ['+', '-', '*', '//', '%', '|', '&']
+COMPARISONS = ['==', '!=', '<', '>=', 'in', 'not in']
+
+
+class _ModuleGenerator:
+    """Generates the source of one module; num_calls is the number of nose function calls generated"""
+
+    def __init__(self, rng: random.Random, spec: CorpusSpec):
+        self.rng = rng
+        self.spec = spec
+        self.num_calls = 0
+
+    def generate(self) -> str:
+        lines = [
+            'import re',
+            'from nose.tools import {}'.format(', '.join(sorted(NOSE_FUNCS))),
+            '',
+        ]
+        test_index = 0
+        while len(lines) < self.spec.lines_per_file:
+            lines.append('')
+            lines.extend(self._test_function(test_index))
+            test_index += 1
+
+        return '\n'.join(lines) + '\n'
+
+    def _test_function(self, test_index: int) -> [str]:
+        lines = ['def test_{}():'.format(test_index)]
+        for _ in range(self.rng.randint(3, 12)):
+            if self.rng.random() < self.spec.call_density:
+                lines.extend(self._nose_call())
+            else:
+                lines.append('    {} = {}'.format(self.rng.choice(NAMES), self._arg(self.spec.arg_complexity)))
+        return lines
+
+    def _nose_call(self) -> [str]:
+        self.num_calls += 1
+        func_name = self.rng.choice(sorted(NOSE_FUNCS))
+        args = [self._arg(self.spec.arg_complexity) for _ in range(NOSE_FUNCS[func_name])]
+        if func_name == 'assert_almost_equal' and self.rng.random() < 0.5:
+            args.append('places={}'.format(self.rng.randint(1, 7)))
+        if func_name == 'assert_regex':
+            args[1] = repr('^{}[0-9]+$'.format(self.rng.choice(NAMES)))
+        if self.rng.random() < 0.2:
+            msg = '"check {}"'.format(self.num_calls)
+            # the third positional argument of assert_almost_equal is places, so its message must be named
+            args.append('msg=' + msg if func_name == 'assert_almost_equal' else msg)
+
+        if self.rng.random() < self.spec.multiline_ratio:
+            indent = ' ' * (4 + len(func_name) + 1)
+            lines = ['    {}({},'.format(func_name, args[0])]
+            lines.extend('{}{},'.format(indent, arg) for arg in args[1:-1])
+            lines.append('{}{})'.format(indent, args[-1]) if len(args) > 1 else lines.pop()[:-1] + ')')
+            return lines
+
+        return ['    {}({})'.format(func_name, ', '.join(args))]
+
+    def _arg(self, complexity: int) -> str:
+        kind = self.rng.randint(0, complexity)
+        if kind == 0:
+            return self.rng.choice(NAMES) if self.rng.random() < 0.7 else str(self.rng.randint(0, 1000))
+
+        if kind == 1:
+            choice = self.rng.randint(0, 2)
+            if choice == 0:
+                return '{}.{}'.format(self.rng.choice(NAMES), self.rng.choice(ATTRS))
+            if choice == 1:
+                return '{}({})'.format(self.rng.choice(FUNCS), self._arg(0))
+            return '{}[{}]'.format(self.rng.choice(NAMES), self._arg(0))
+
+        choice = self.rng.randint(0, 3)
+        if choice == 0:
+            return '{} {} {}'.format(self._arg(1), self.rng.choice(OPERATORS), self._arg(1))
+        if choice == 1:
+            return '{} {} {}'.format(self._arg(1), self.rng.choice(COMPARISONS), self._arg(1))
+        if choice == 2:
+            return '[{} for i in range({})]'.format(self._arg(1), self.rng.randint(1, 10))
+        return '{}({}, key={})'.format(self.rng.choice(FUNCS), self._arg(1), self._arg(1))
+
+
+def generate_module(rng: random.Random, spec: CorpusSpec) -> (str, int):
+    """
+    Generate the source of one test module.
+    :return: pair (source, number of nose function calls in it)
+    """
+    generator = _ModuleGenerator(rng, spec)
+    source = generator.generate()
+    return source, generator.num_calls
+
+
+def generate_corpus(output_dir: str, spec: CorpusSpec) -> dict:
+    """
+    Generate spec.num_files test modules in output_dir (which is created if necessary); modules are spread
+    over sub-folders of at most 50 modules each, like a real code base.
+    :return: manifest of the corpus: spec, number of files, lines and nose function calls
+    """
+    rng = random.Random(spec.seed)
+    output_path = Path(output_dir)
+    num_lines = num_calls = 0
+    for file_index in range(spec.num_files):
+        package_path = output_path / 'pkg_{}'.format(file_index // 50)
+        package_path.mkdir(parents=True, exist_ok=True)
+        source, module_calls = generate_module(rng, spec)
+        (package_path / 'test_module_{}.py'.format(file_index)).write_text(source)
+        num_lines += source.count('\n')
+        num_calls += module_calls
+
+    return dict(spec=spec.as_dict(), num_files=spec.num_files, num_lines=num_lines, num_calls=num_calls)
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser):
+    default = CorpusSpec()
+    parser.add_argument('--files', dest='num_files', type=int, default=default.num_files,
+                        help='number of modules (default: %(default)s)')
+    parser.add_argument('--lines', dest='lines_per_file', type=int, default=default.lines_per_file,
+                        help='approximate number of lines per module (default: %(default)s)')
+    parser.add_argument('--density', dest='call_density', type=float, default=default.call_density,
+                        help='fraction of test statements that are nose calls (default: %(default)s)')
+    parser.add_argument('--complexity', dest='arg_complexity', type=int, choices=(0, 1, 2),
+                        default=default.arg_complexity,
+                        help='complexity of the arguments of nose calls (default: %(default)s)')
+    parser.add_argument('--multiline', dest='multiline_ratio', type=float, default=default.multiline_ratio,
+                        help='fraction of nose calls spread over several lines (default: %(default)s)')
+    parser.add_argument('--seed', dest='seed', type=int, default=default.seed,
+                        help='random seed (default: %(default)s)')
+
+
+def get_spec(args: argparse.Namespace) -> CorpusSpec:
+    return CorpusSpec(args.num_files, args.lines_per_file, args.call_density, args.arg_complexity,
+                      args.multiline_ratio, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a corpus of synthetic nose test modules')
+    parser.add_argument('output_dir', help='folder in which to generate the modules')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output_dir, get_spec(args))
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
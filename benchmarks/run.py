@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Benchmark runner: generates a corpus of synthetic nose test modules (see benchmarks.corpus), then times the
+conversion of the corpus by NoseConversionRefactoringTool using refactor_string(), refactor_file() and
+refactor() on the whole folder, serially and with several processes, and with the tokenize and ast engines. Files are
+never overwritten. For each case, it reports files/s, nose call sites/s and the peak resident set size. Each
+case runs in a fresh process so that its peak RSS is not inflated by the previous cases.
+
+The results can be saved as JSON, and compared to the JSON saved by another run (eg with another version
+of nose2pytest) to spot regressions.
+
+Usage:
+
+    python -m benchmarks.run [--output results.json] [--compare previous.json] [--jobs N] [--repeat N]
+                             [corpus options, see --help]
+"""
+
+import sys
+import json
+import time
+import logging
+import tempfile
+import platform
+import argparse
+import multiprocessing
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus, add_spec_arguments, get_spec
+from nose2pytest import script
+from nose2pytest.script import NoseConversionRefactoringTool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+CASES = ('refactor_string', 'refactor_file', 'refactor_dir', 'refactor_dir_parallel', 'refactor_dir_tokenize',
+         'refactor_dir_ast')
+# engine of each case, if not fissix
+CASE_ENGINES = dict(refactor_dir_tokenize='tokenize', refactor_dir_ast='ast')
+
+
+def get_peak_rss_kb(who: int) -> int or None:
+    """Get the peak RSS in kB of this process (who=RUSAGE_SELF) or of its terminated children"""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(who).ru_maxrss
+    # bytes on macOS, kB elsewhere:
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def run_case(case: str, corpus_dir: str, num_processes: int, num_repeats: int) -> dict:
+    """
+    Run one benchmark case, in the current process.
+    :return: dict with best time in seconds and peak RSS in kB (maximum of this process and its children)
+    """
+    logging.getLogger('nose2pytest').setLevel(logging.WARNING)
+    logging.getLogger('RefactoringTool').setLevel(logging.WARNING)
+    paths = sorted(str(path) for path in Path(corpus_dir).glob('**/*.py'))
+    sources = [Path(path).read_text() for path in paths] if case == 'refactor_string' else None
+
+    best_time = None
+    for _ in range(num_repeats):
+        refac = NoseConversionRefactoringTool(engine=CASE_ENGINES.get(case, 'fissix'))
+        start = time.perf_counter()
+        if case == 'refactor_string':
+            for path, source in zip(paths, sources):
+                refac.refactor_string(source, path)
+        elif case == 'refactor_file':
+            for path in paths:
+                refac.refactor_file(path, write=False)
+        elif case == 'refactor_dir' or case in CASE_ENGINES:
+            refac.refactor([corpus_dir], write=False)
+        else:
+            refac.refactor([corpus_dir], write=False, num_processes=num_processes)
+        elapsed = time.perf_counter() - start
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    peak_rss_kb = get_peak_rss_kb(resource.RUSAGE_SELF) if resource else None
+    if peak_rss_kb is not None:
+        peak_rss_kb = max(peak_rss_kb, get_peak_rss_kb(resource.RUSAGE_CHILDREN))
+    return dict(seconds=best_time, peak_rss_kb=peak_rss_kb)
+
+
+def run_case_in_new_process(*args) -> dict:
+    # a pool worker cannot have children, so use a plain process that sends back its result
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_send_case_result, args=(sender,) + args)
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def _send_case_result(sender, *args):
+    sender.send(run_case(*args))
+
+
+def run_benchmarks(corpus_dir: str, manifest: dict, num_processes: int, num_repeats: int) -> dict:
+    results = dict(
+        nose2pytest_version=script.__version__,
+        python_version=platform.python_version(),
+        platform=platform.platform(),
+        corpus=manifest,
+        num_processes=num_processes,
+        num_repeats=num_repeats,
+        cases={},
+    )
+    for case in CASES:
+        case_result = run_case_in_new_process(case, corpus_dir, num_processes, num_repeats)
+        seconds = case_result['seconds']
+        case_result['files_per_s'] = manifest['num_files'] / seconds
+        case_result['call_sites_per_s'] = manifest['num_calls'] / seconds
+        results['cases'][case] = case_result
+
+    return results
+
+
+def print_results(results: dict, previous: dict = None):
+    corpus = results['corpus']
+    print('corpus: {num_files} files, {num_lines} lines, {num_calls} nose calls'.format(**corpus))
+    header = '{:<24} {:>10} {:>10} {:>14} {:>12}'.format('case', 'seconds', 'files/s', 'call sites/s', 'peak RSS MB')
+    if previous is not None:
+        header += ' {:>12}'.format('vs previous')
+    print(header)
+
+    for case, case_result in results['cases'].items():
+        peak_rss_kb = case_result['peak_rss_kb']
+        line = '{:<24} {:>10.3f} {:>10.1f} {:>14.1f} {:>12}'.format(
+            case, case_result['seconds'], case_result['files_per_s'], case_result['call_sites_per_s'],
+            '-' if peak_rss_kb is None else '{:.1f}'.format(peak_rss_kb / 1024))
+        if previous is not None and case in previous['cases']:
+            # > 1 means faster than previous
+            line += ' {:>11.2f}x'.format(previous['cases'][case]['seconds'] / case_result['seconds'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark nose2pytest on a synthetic corpus of nose tests')
+    parser.add_argument('--output', help='file in which to save the results as JSON')
+    parser.add_argument('--compare', help='JSON file saved by a previous run, to compare results with')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of processes for the parallel case (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times each case is run, the best time is kept (default: %(default)s)')
+    parser.add_argument('--corpus-dir', help='folder in which to generate the corpus (default: temp folder)')
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+
+    with tempfile.TemporaryDirectory(prefix='nose2pytest-bench-') as temp_dir:
+        corpus_dir = args.corpus_dir or temp_dir
+        manifest = generate_corpus(corpus_dir, get_spec(args))
+        results = run_benchmarks(corpus_dir, manifest, args.jobs, args.repeat)
+
+    print_results(results, previous)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,13 +10,14 @@ introspection for error reporting.  When combined with running nose2pytest.py on
 module may be sufficient to decrease your test suite's third-party dependencies by 1.
 """
 
-import pytest
-import unittest
+import sys
+
 import pytest
 
 
 __all__ = [
     'assert_dict_contains_subset',
+    'assert_all_almost_equal',
 
     'assert_raises_regex',
     'assert_raises_regexp',
@@ -24,53 +25,235 @@ __all__ = [
     'assert_warns_regex',
 ]
 
+# dtype kinds of NumPy arrays of signed and unsigned integers, floats and complex numbers:
+_NUMERIC_KINDS = 'iufc'
 
-def assert_dict_contains_subset(subset, dictionary, msg=None):
+
+def assert_dict_contains_subset(subset, dictionary, msg=None, max_reported=None):
     """
     Checks whether dictionary is a superset of subset. If not, the assertion message will have useful details,
-    unless msg is given, then msg is output.
+    unless msg is given, then msg is output. The items are compared with dict item views, which stops at the first
+    missing key or mismatched value (as for dict items, a value is equal to itself, eg a NaN); the details are
+    only computed if the check fails. Values that are NumPy arrays are compared as whole arrays.
+    :param max_reported: if not None, at most this many missing keys (or mismatched values) are listed in the
+        assertion message, followed by the number of those not listed
     """
-    dictionary = dictionary
-    missing_keys = sorted(list(set(subset.keys()) - set(dictionary.keys())))
-    mismatch_vals = {k: (subset[k], dictionary[k]) for k in subset if k in dictionary and subset[k] != dictionary[k]}
-    if msg is None:
-        assert missing_keys == [], 'Missing keys = {}'.format(missing_keys)
-        assert mismatch_vals == {}, 'Mismatched values (s, d) = {}'.format(mismatch_vals)
+    try:
+        if subset.items() <= dictionary.items():
+            return
+    except ValueError:
+        # the comparison of NumPy arrays gives an array, which has no truth value
+        pass
+
+    missing_keys = sorted(key for key in subset if key not in dictionary)
+    if missing_keys:
+        reported, num_not_reported = _truncate(missing_keys, max_reported)
+        raise AssertionError(msg if msg is not None else 'Missing keys = {}{}'.format(reported, num_not_reported))
+
+    mismatch_keys = [k for k in subset if _values_differ(subset[k], dictionary[k])]
+    if not mismatch_keys:
+        # values that are neither equal nor different
+        return
+    reported, num_not_reported = _truncate(mismatch_keys, max_reported)
+    mismatch_vals = {k: (subset[k], dictionary[k]) for k in reported}
+    raise AssertionError(msg if msg is not None else
+                         'Mismatched values (s, d) = {}{}'.format(mismatch_vals, num_not_reported))
+
+
+def assert_all_almost_equal(first, second, places=None, msg=None, delta=None, max_reported=None):
+    """
+    Checks whether each element of first is almost equal to the element of second at the same position, as
+    assert_almost_equal(a, b, places, msg, delta) checks two numbers: they are equal, or their difference rounded
+    to places decimal places (7 if neither places nor delta is given) is 0, or is at most delta if given. If not,
+    the assertion message lists the positions and values of the elements that are not, unless msg is given, then
+    msg is output. first and second are sequences of the same length, checked one by one, unless one of them is a
+    NumPy array of numbers (not bool or object) and the other converts to one: then they can be broadcast together,
+    and all elements are checked in one vectorized operation, their difference computed in floating point. If the
+    lengths differ, or the shapes cannot be broadcast together, the assertion fails with a message that says so.
+    :param max_reported: if not None, at most this many elements are listed in the assertion message, followed by
+        the number of those not listed
+    """
+    if places is not None and delta is not None:
+        raise TypeError('specify delta or places not both')
+    if delta is None and places is None:
+        places = 7
+
+    arrays = _get_numeric_arrays(first, second)
+    if arrays is None:
+        first, second = _to_list(first), _to_list(second)
+        if len(first) != len(second):
+            raise AssertionError(msg if msg is not None else
+                                 'Lengths differ (first, second) = {}'.format((len(first), len(second))))
+        mismatches = _get_almost_equal_mismatches(first, second, places, delta)
+        num_mismatches = len(mismatches)
     else:
-        assert missing_keys == [], msg
-        assert mismatch_vals == {}, msg
+        numpy = _get_numpy()
+        first, second = arrays
+        try:
+            numpy.broadcast(first, second)
+        except ValueError:
+            raise AssertionError(msg if msg is not None else
+                                 'Shapes differ (first, second) = {}'.format((first.shape, second.shape))) from None
+        with numpy.errstate(invalid='ignore'):
+            # in floating point, so that unsigned integers do not wrap around:
+            diff = numpy.abs(numpy.subtract(first, second, dtype=numpy.result_type(first, second, float)))
+            close = diff <= delta if delta is not None else numpy.round(diff, places) == 0
+            close |= first == second
+        if close.all():
+            return
+        # the positions and values are only needed for the message:
+        positions = numpy.argwhere(~close)
+        num_mismatches = len(positions)
+        first, second = numpy.broadcast_arrays(first, second)
+        mismatches = [(position, first.item(position), second.item(position))
+                      for position in map(tuple, positions[:max_reported].tolist())]
 
+    if num_mismatches:
+        reported, num_not_reported = _truncate(mismatches, max_reported, num_mismatches)
+        mismatch_vals = {_format_position(position): (a, b) for position, a, b in reported}
+        raise AssertionError(msg if msg is not None else
+                             'Values not almost equal (first, second) = {}{}'.format(mismatch_vals, num_not_reported))
 
-# make other unittest.TestCase methods available as-is as functions; trick taken from Nose
 
-class _Dummy(unittest.TestCase):
-    def do_nothing(self):
-        pass
+def _get_almost_equal_mismatches(first: list, second: list, places: int or None, delta: float or None) -> [tuple]:
+    """Get the triples (index, a, b) of the elements of two lists of the same length that are not almost equal"""
+    pairs = enumerate(zip(first, second))
+    if delta is not None:
+        return [((index,), a, b) for index, (a, b) in pairs if not (a == b or abs(a - b) <= delta)]
+    return [((index,), a, b) for index, (a, b) in pairs if not (a == b or round(abs(a - b), places) == 0)]
 
-_t = _Dummy('do_nothing')
 
-assert_raises_regex=_t.assertRaisesRegex,
-assert_raises_regexp=_t.assertRaisesRegex,
-assert_regexp_matches=_t.assertRegex,
-assert_warns_regex=_t.assertWarnsRegex,
+def _get_numeric_arrays(first, second) -> tuple or None:
+    """
+    Get first and second as NumPy arrays if one of them is an array and both are of numbers, else None: other
+    elements, such as Fraction or Decimal objects, or bools, do not support the vectorized operations
+    """
+    numpy = _get_numpy()
+    if numpy is None or not (isinstance(first, numpy.ndarray) or isinstance(second, numpy.ndarray)):
+        return None
+    first, second = numpy.asarray(first), numpy.asarray(second)
+    if first.dtype.kind not in _NUMERIC_KINDS or second.dtype.kind not in _NUMERIC_KINDS:
+        return None
+    return first, second
 
-del _Dummy
-del _t
 
+def _to_list(values) -> list:
+    """Get values as a list, of Python scalars if values is a NumPy array, since NumPy bools cannot be subtracted"""
+    numpy = _get_numpy()
+    return values.tolist() if numpy is not None and isinstance(values, numpy.ndarray) else list(values)
+
+
+def _format_position(position: tuple) -> int or tuple:
+    return position[0] if len(position) == 1 else position
+
+
+def _get_numpy():
+    """
+    Get the numpy module if it is imported, else None: arrays can only be given by code that imported NumPy, and
+    this plugin does not import it, which would slow down every pytest session
+    """
+    return sys.modules.get('numpy')
+
+
+def _values_differ(first, second) -> bool:
+    """
+    Test if two values differ, comparing them as whole arrays if one of them is a NumPy array. As for dict items,
+    a value does not differ from itself (eg a NaN).
+    """
+    if first is second:
+        return False
+    numpy = _get_numpy()
+    if numpy is not None and (isinstance(first, numpy.ndarray) or isinstance(second, numpy.ndarray)):
+        return not numpy.array_equal(first, second)
+    return first != second
 
-# pytest integration: add all assert_ function to the pytest package namespace
 
-# Use similar trick as Nose to bring in bound methods from unittest.TestCase as free functions:
+def _truncate(items: list, max_items: int or None, num_items: int = None) -> (list, str):
+    """
+    Keep the first max_items items (all if None); return them, and the suffix of the message about the others.
+    :param num_items: number of items, if items only has the first ones
+    """
+    num_items = len(items) if num_items is None else num_items
+    items = items if max_items is None else items[:max_items]
+    if len(items) == num_items:
+        return items, ''
+    return items, ' (and {} more)'.format(num_items - len(items))
+
+
+# make other unittest.TestCase methods available as-is as functions; trick taken from Nose. This module is
+# loaded by every pytest session as a plugin, so they are only looked up when first used, by the module
+# __getattr__ below (PEP 562): sessions that do not use them do not pay for creating a TestCase.
+
+_TEST_CASE_METHODS = dict(
+    assert_raises_regex='assertRaisesRegex',
+    assert_raises_regexp='assertRaisesRegex',
+    assert_regexp_matches='assertRegex',
+    assert_warns_regex='assertWarnsRegex',
+)
+
+_test_case = None
+
+
+def _get_test_case_method(name: str):
+    """Get the bound method of a unittest.TestCase to use as the assert_ function name"""
+    global _test_case
+    if _test_case is None:
+        import unittest
+
+        class _Dummy(unittest.TestCase):
+            def do_nothing(self):
+                pass
+
+        _test_case = _Dummy('do_nothing')
+
+    return getattr(_test_case, _TEST_CASE_METHODS[name])
+
+
+def __getattr__(name: str):
+    if name not in _TEST_CASE_METHODS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    # so that this is only called on first access:
+    func = globals()[name] = _get_test_case_method(name)
+    return func
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_TEST_CASE_METHODS))
+
+
+# pytest integration: add all assert_ function to the pytest package namespace
 
 
 def _supported_nose_name(name):
     return name.startswith('assert_') or name in ('ok_', 'eq_')
 
 
+def _pytest_getattr(name: str):
+    """
+    Module __getattr__ of the pytest package, installed by pytest_configure(): gets the functions of this module
+    that are looked up on first access, and sets them in the pytest package, so that it is called once per name
+    """
+    if name in _TEST_CASE_METHODS:
+        func = __getattr__(name)
+        setattr(pytest, name, func)
+        return func
+    if _pytest_getattr.previous is not None:
+        return _pytest_getattr.previous(name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(pytest.__name__, name))
+
+
+_pytest_getattr.previous = None
+
+
 def pytest_configure():
-    for name, obj in globals().items():
-        if _supported_nose_name(name):
-            setattr(pytest, name, obj)
+    for name in __all__:
+        if name in globals():
+            setattr(pytest, name, globals()[name])
+
+    previous = vars(pytest).get('__getattr__')
+    if previous is not _pytest_getattr:
+        _pytest_getattr.previous = previous
+        pytest.__getattr__ = _pytest_getattr
 
 
 # licensing
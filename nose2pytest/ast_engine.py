@@ -0,0 +1,145 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the "ast" conversion engine. Like the "tokenize" engine (see token_engine), it converts
+the statements of a module that are calls to nose functions one at a time, with the fixers, and splices the
+converted text into the source; but the statements are found with the standard library's ast module, whose
+parser is written in C and gives the position of each statement (lineno, col_offset, end_lineno, end_col_offset).
+Compared to the tokenize engine:
+
+- only the statements that are calls to nose functions are tokenized, to give the simple calls to the fixers;
+- a call to a nose function can be anywhere a statement can, eg "if a: ok_(b)" or after a ";";
+- a call to a nose function that is not a whole statement (eg "x = ok_(a)", or in a lambda) is left alone and
+  reported as such, instead of being converted to invalid code as fissix does, except in the arguments of a
+  statement that is a call to a nose function (eg "assert_equal(ok_(a), b)"): the statement is then converted by
+  fissix, with the calls in its arguments, as when the whole module is;
+- a module only has to be valid for the Python that runs nose2pytest, so it can use syntax that fissix does not
+  support, as long as the statements that fissix has to parse (the calls that are not simple) do not.
+
+A statement that fissix cannot parse on its own, even in an async function (for "await"), is left alone: it has
+syntax that fissix does not support, so fissix could not convert the module either. If a module cannot be parsed by ast,
+AstEngine.convert() returns None and the caller converts it with fissix, which reports the error.
+"""
+
+import io
+import ast
+import tokenize
+
+from fissix.pytree import Leaf as PyLeaf
+from fissix.pgen2 import token
+
+from nose2pytest.token_engine import TokenEngine, get_line_offsets
+
+
+# tokens at the end of the tokens of a statement on its own
+_END_TOKENS = (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)
+
+
+class AstEngine(TokenEngine):
+    """Converts the statements of a module that are nose function calls, found with ast, using the fixers of a tool"""
+
+    def convert(self, source: str, name: str) -> (bool, str) or None:
+        """
+        Convert the nose function calls of a module that are statements.
+        :param source: source of the module
+        :param name: name of the module, for log messages
+        :return: None if the module must be converted by fissix; otherwise, pair (changed, output) where output
+            is the converted source
+        """
+        try:
+            tree = compile(source, name, 'exec', ast.PyCF_ONLY_AST, dont_inherit=True)
+        except (SyntaxError, ValueError):
+            return None
+
+        line_offsets = get_line_offsets(source)
+
+        def get_position(lineno: int, col_offset: int) -> (int, int):
+            # ast gives column offsets in bytes of UTF-8, the fixers in characters:
+            line_start = line_offsets[lineno - 1]
+            line_prefix = source[line_start:line_start + col_offset]
+            if not line_prefix.isascii():
+                col_offset = len(line_prefix.encode('utf-8')[:col_offset].decode('utf-8'))
+            return lineno, col_offset
+
+        def get_offset(position: (int, int)) -> int:
+            row, col = position
+            return line_offsets[row - 1] + col
+
+        statement_nodes, other_calls = self._find_nose_calls(tree)
+        statements = []
+        for node in statement_nodes:
+            call = node.value
+            position = get_position(call.lineno, call.col_offset)
+            text = source[get_offset(position):get_offset(get_position(call.end_lineno, call.end_col_offset))]
+            statement_tokens = args = None
+            if call.lineno == call.end_lineno:
+                statement_tokens = self._get_statement_tokens(text, position, source, line_offsets)
+                if statement_tokens is not None:
+                    args = self._get_simple_call_args(statement_tokens)
+            # the converted call replaces the whole statement, which can have parentheses around the call:
+            start = get_offset(get_position(node.lineno, node.col_offset))
+            end = get_offset(get_position(node.end_lineno, node.end_col_offset))
+            statements.append((position, start, end, text, call.func.id, statement_tokens, args))
+
+        result = self._convert_statements(source, name, statements)
+        if result is not None:
+            for call in other_calls:
+                position = get_position(call.func.lineno, call.func.col_offset)
+                self._record_left_alone(self.fixers_by_name[call.func.id], call.func.id, position)
+        return result
+
+    def _find_nose_calls(self, tree: ast.AST) -> ([ast.Expr], [ast.Call]):
+        """
+        Find the calls to nose functions in a module.
+        :return: pair (statements that are a call to a nose function, in the order of the module; other calls to
+            nose functions, not including those in the arguments of the statements, which are converted with them)
+        """
+        statement_nodes = []
+        other_calls = []
+        nodes = [tree]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, ast.Expr) and self._is_nose_call(node.value):
+                statement_nodes.append(node)
+                continue
+            if self._is_nose_call(node):
+                other_calls.append(node)
+            nodes.extend(ast.iter_child_nodes(node))
+
+        statement_nodes.sort(key=lambda node: (node.lineno, node.col_offset))
+        return statement_nodes, other_calls
+
+    def _is_nose_call(self, node: ast.AST) -> bool:
+        return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in self.fixers_by_name
+
+    @staticmethod
+    def _get_statement_tokens(text: str, position: (int, int), source: str,
+                              line_offsets: [int]) -> [tokenize.TokenInfo] or None:
+        """
+        Get the tokens of a statement on one line, with their position in the module.
+        :return: the tokens, or None if the statement cannot be tokenized on its own
+        """
+        row, col = position
+        line = source[line_offsets[row - 1]:line_offsets[row] if row < len(line_offsets) else len(source)]
+        try:
+            tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+        except (tokenize.TokenError, SyntaxError):
+            return None
+
+        while tokens and tokens[-1].type in _END_TOKENS:
+            tokens.pop()
+        return [tok._replace(start=(row, tok.start[1] + col), end=(row, tok.end[1] + col), line=line)
+                for tok in tokens]
+
+    def _leave_unparsable_statement(self, position: (int, int), func_name: str, call_sites: dict) -> bool:
+        self._record_left_alone(self.fixers_by_name[func_name], func_name, position, call_sites)
+        return True
+
+    @staticmethod
+    def _record_left_alone(fixer, func_name: str, position: (int, int), call_sites: dict = None):
+        """Record a call to a nose function that is not converted, in call_sites if given, else in its fixer"""
+        from nose2pytest.script import CALL_LEFT_ALONE
+        if call_sites is None:
+            fixer._record_call_site(PyLeaf(token.NAME, func_name, context=('', position)), CALL_LEFT_ALONE)
+        else:
+            call_sites.setdefault(fixer, {})[position] = (func_name, CALL_LEFT_ALONE)
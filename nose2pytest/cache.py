@@ -0,0 +1,139 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the on-disk cache used by the nose2pytest script to avoid re-parsing files that it
+already processed in a previous run. Each entry is keyed by a hash of the file's content and of a "salt" that
+identifies the conversions done (nose2pytest version, conversion tables, options), and records the nose function
+call sites found in the file (so that --report is complete even for cached files) and either that the file
+needs no change or the converted source. Entries are files in the cache folder; the modification
+time of an entry is updated whenever it is used, so that the least recently used entries can be evicted
+when the cache grows beyond its maximum size.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+
+
+log = logging.getLogger('nose2pytest')
+
+DEFAULT_CACHE_DIR = '.nose2pytest_cache'
+DEFAULT_MAX_CACHE_SIZE = 100 * 1024 * 1024
+
+# An entry file is: one byte that says whether the file needs no change or is converted, the call sites as a
+# JSON list on one line (empty line if no call sites), then the converted source. The format is part of the key
+# so that entries stored in another format are never read.
+_ENTRY_FORMAT = b'2'
+_UNCHANGED = b'='
+_CONVERTED = b'+'
+
+
+class ConversionCache:
+    """
+    Cache of conversion results. Entries are written atomically, so several processes can use the same
+    cache folder concurrently.
+    """
+
+    def __init__(self, cache_dir: str, salt: str, max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        """
+        :param cache_dir: folder where entries are stored; it is created when the first entry is stored
+        :param salt: string that identifies the conversions done; entries stored with a different salt are
+            never found, and eventually get evicted
+        :param max_size: evict() removes least recently used entries until the cache is smaller than this
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self._salt = salt.encode('utf-8')
+
+    def get_key(self, data: bytes) -> str:
+        """Get the cache key for a file that contains given data"""
+        hasher = hashlib.sha256(_ENTRY_FORMAT)
+        hasher.update(self._salt)
+        hasher.update(b'\0')
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> (bool, str or None, list):
+        """
+        Get the entry for key.
+        :return: triplet (found, converted source, call sites); converted source is None if the entry says no
+            change needed
+        """
+        entry_path = self._get_entry_path(key)
+        try:
+            entry = entry_path.read_bytes()
+            os.utime(entry_path)
+        except OSError:
+            return False, None, []
+
+        marker = entry[:1]
+        call_sites_json, _, converted = entry[1:].partition(b'\n')
+        try:
+            call_sites = [tuple(call_site) for call_site in json.loads(call_sites_json.decode('utf-8') or '[]')]
+        except ValueError:
+            return False, None, []
+
+        if marker == _CONVERTED:
+            return True, converted.decode('utf-8'), call_sites
+        if marker == _UNCHANGED:
+            return True, None, call_sites
+        return False, None, []
+
+    def put(self, key: str, converted: str or None, call_sites: list = ()):
+        """
+        Store the result of converting a file.
+        :param converted: the converted source, or None if the file needed no change
+        :param call_sites: the nose function call sites found in the file, as tuples of JSON-compatible values
+        """
+        marker = _UNCHANGED if converted is None else _CONVERTED
+        entry = marker + (json.dumps(call_sites).encode('utf-8') if call_sites else b'') + b'\n'
+        if converted is not None:
+            entry += converted.encode('utf-8')
+        entry_path = self._get_entry_path(key)
+        try:
+            self._make_cache_dir()
+            fd, temp_path = tempfile.mkstemp(dir=str(entry_path.parent), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(entry)
+            os.replace(temp_path, str(entry_path))
+        except OSError as exc:
+            log.warning('Could not store cache entry %s: %s', entry_path, exc)
+
+    def clear(self):
+        """Remove all entries"""
+        shutil.rmtree(str(self.cache_dir), ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used entries until the total size of entries is below max_size"""
+        entry_stats = []
+        try:
+            for entry in os.scandir(str(self.cache_dir)):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    entry_stats.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+
+        total_size = sum(size for _, size, _ in entry_stats)
+        for _, size, path in sorted(entry_stats):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    def _get_entry_path(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def _make_cache_dir(self):
+        if self.cache_dir.is_dir():
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # same as pytest's cache: the cache folder should never be committed
+        (self.cache_dir / '.gitignore').write_text('# created by nose2pytest\n*\n')
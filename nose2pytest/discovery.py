@@ -0,0 +1,218 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the FileFinder used by NoseConversionRefactoringTool to find the .py files to convert under a
+folder. Like fissix's RefactoringTool.refactor_dir(), it yields the files of each folder sorted by name before those
+of its sub-folders, and skips files and folders whose name starts with "."; but it uses os.scandir(), and it prunes
+folders as early as possible, so that nothing under a folder that is not wanted is listed or opened:
+
+- folders that are virtual environments (they have a pyvenv.cfg file);
+- files and folders that match an exclude pattern;
+- files and folders ignored by git, according to the .gitignore files of the folders walked, of the folders above
+  them up to the root of the git repository, and the repository's .git/info/exclude. The files are parsed here,
+  git is not run.
+
+Exclude and include patterns have the syntax of .gitignore patterns, relative to the folder walked: a pattern
+without "/" (eg "test_*.py" or "build") matches a name at any depth, a pattern with a "/" (eg "tests/**/*.py")
+matches a path from the folder walked, and a pattern that ends with "/" only matches folders. If there are include
+patterns, only the files that match one of them, or are under a folder that matches one of them, are yielded.
+"""
+
+import os
+import re
+
+
+class IgnorePattern:
+    """A pattern of a .gitignore file, or of the include and exclude options"""
+
+    def __init__(self, pattern: str, base: str = '', prefix: str = ''):
+        """
+        :param pattern: the pattern, in the syntax of .gitignore files (a line that is not blank or a comment)
+        :param base: path, relative to the folder walked and ending with "/", of the folder of the .gitignore file
+            if it is under the folder walked; the pattern only applies to paths under it
+        :param prefix: path, relative to the folder of the .gitignore file and ending with "/", of the folder
+            walked if the .gitignore file is in a folder above it
+        """
+        self.base = base
+        self.prefix = prefix
+        self.negate = pattern.startswith('!')
+        if self.negate or pattern.startswith('\\!') or pattern.startswith('\\#'):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        # a pattern with a "/" other than at its end is relative to the folder of the .gitignore file
+        anchored = '/' in pattern
+        self.regex = re.compile(('' if anchored else '(?:.*/)?') + _translate(pattern.lstrip('/')), re.DOTALL)
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        """Test if the pattern matches a path relative to the folder walked (with "/" as separator)"""
+        if self.dir_only and not is_dir:
+            return False
+        if not path.startswith(self.base):
+            return False
+        return self.regex.fullmatch(self.prefix + path[len(self.base):]) is not None
+
+
+def _translate(pattern: str) -> str:
+    """Translate a .gitignore pattern, without leading and trailing "/", to a regular expression"""
+    parts = []
+    pos = 0
+    while pos < len(pattern):
+        if pattern.startswith('**/', pos) and (pos == 0 or pattern[pos - 1] == '/'):
+            parts.append('(?:.*/)?')
+            pos += 3
+        elif pattern.startswith('**', pos) and pos + 2 == len(pattern) and (pos == 0 or pattern[pos - 1] == '/'):
+            parts.append('.*')
+            pos += 2
+        elif pattern[pos] == '*':
+            parts.append('[^/]*')
+            pos += 1
+        elif pattern[pos] == '?':
+            parts.append('[^/]')
+            pos += 1
+        elif pattern[pos] == '[' and ']' in pattern[pos + 2:]:
+            end = pattern.index(']', pos + 2)
+            chars = pattern[pos + 1:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            parts.append('[' + chars.replace('\\', '\\\\') + ']')
+            pos = end + 1
+        elif pattern[pos] == '\\' and pos + 1 < len(pattern):
+            parts.append(re.escape(pattern[pos + 1]))
+            pos += 2
+        else:
+            parts.append(re.escape(pattern[pos]))
+            pos += 1
+    return ''.join(parts)
+
+
+def read_gitignore(path: str, base: str = '', prefix: str = '') -> [IgnorePattern]:
+    """
+    Read the patterns of a .gitignore file (or of a .git/info/exclude file).
+    :param base: see IgnorePattern
+    :param prefix: see IgnorePattern
+    :return: the patterns, in the order of the file; an empty list if it cannot be read
+    """
+    try:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return []
+
+    patterns = []
+    for line in lines:
+        # trailing spaces are ignored, unless escaped:
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        if stripped and not stripped.startswith('#'):
+            patterns.append(IgnorePattern(stripped, base, prefix))
+    return patterns
+
+
+class FileFinder:
+    """Finds the .py files to convert under a folder"""
+
+    def __init__(self, include: [str] = (), exclude: [str] = (), use_gitignore: bool = True):
+        """
+        :param include: if not empty, only the files that match one of these patterns, or are under a folder that
+            matches one of them, are found
+        :param exclude: the files and folders that match one of these patterns are skipped
+        :param use_gitignore: if True, the files and folders ignored by git are skipped
+        """
+        self.include = [IgnorePattern(pattern) for pattern in include]
+        self.exclude = [IgnorePattern(pattern) for pattern in exclude]
+        self.use_gitignore = use_gitignore
+
+    def find(self, dir_name: str):
+        """
+        Find the .py files under a folder.
+        :return: iterator of the paths of the files, which start with dir_name
+        """
+        ignore_patterns = self._get_parent_ignore_patterns(dir_name) if self.use_gitignore else []
+        return self._walk(dir_name, '', ignore_patterns, not self.include)
+
+    def is_selected(self, rel_path: str) -> bool:
+        """
+        Test if the include and exclude patterns select a .py file, for the lists of files that are not found by
+        walking a folder (eg those reported by git, which applies the .gitignore files itself).
+        :param rel_path: path of the file relative to the folder the patterns are relative to, with "/" as separator
+        """
+        parts = rel_path.split('/')
+        rel_dirs = ['/'.join(parts[:index]) for index in range(1, len(parts))]
+        if any(self._is_excluded(rel_dir, True, []) for rel_dir in rel_dirs) or self._is_excluded(rel_path, False, []):
+            return False
+        return self._is_included(rel_path, False) or any(self._is_included(rel_dir, True) for rel_dir in rel_dirs)
+
+    def _walk(self, dir_path: str, rel_dir: str, ignore_patterns: [IgnorePattern], included: bool):
+        """:param included: True if the files under dir_path are included, because a folder above them matches"""
+        try:
+            with os.scandir(dir_path) as scanned:
+                entries = sorted(scanned, key=lambda entry: entry.name)
+        except OSError:
+            return
+
+        names = {entry.name for entry in entries}
+        if rel_dir and 'pyvenv.cfg' in names:
+            # a virtual environment
+            return
+        if self.use_gitignore and '.gitignore' in names:
+            ignore_patterns = ignore_patterns + read_gitignore(os.path.join(dir_path, '.gitignore'), rel_dir)
+
+        sub_dirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            rel_path = rel_dir + entry.name
+            # like os.walk(), symbolic links to folders are not followed
+            is_dir = entry.is_dir()
+            if is_dir and entry.is_symlink():
+                continue
+            if not is_dir and not entry.name.endswith('.py'):
+                continue
+            if self._is_excluded(rel_path, is_dir, ignore_patterns):
+                continue
+            if is_dir:
+                sub_dirs.append((entry.path, rel_path + '/', included or self._is_included(rel_path, True)))
+            elif included or self._is_included(rel_path, False):
+                yield entry.path
+
+        for sub_dir_path, sub_rel_dir, sub_included in sub_dirs:
+            yield from self._walk(sub_dir_path, sub_rel_dir, ignore_patterns, sub_included)
+
+    def _is_included(self, rel_path: str, is_dir: bool) -> bool:
+        return not self.include or any(pattern.matches(rel_path, is_dir) for pattern in self.include)
+
+    def _is_excluded(self, rel_path: str, is_dir: bool, ignore_patterns: [IgnorePattern]) -> bool:
+        if any(pattern.matches(rel_path, is_dir) for pattern in self.exclude):
+            return True
+        # the last pattern that matches decides:
+        for pattern in reversed(ignore_patterns):
+            if pattern.matches(rel_path, is_dir):
+                return not pattern.negate
+        return False
+
+    @staticmethod
+    def _get_parent_ignore_patterns(dir_name: str) -> [IgnorePattern]:
+        """
+        Get the patterns of the .gitignore files of the folders above dir_name, up to the root of its git
+        repository, and of the repository's .git/info/exclude; none if dir_name is not in a git repository
+        """
+        found = []
+        prefix = ''
+        path = os.path.abspath(dir_name)
+        while True:
+            if os.path.exists(os.path.join(path, '.git')):
+                break
+            parent = os.path.dirname(path)
+            if parent == path:
+                # not in a git repository
+                return []
+            prefix = os.path.basename(path) + '/' + prefix
+            path = parent
+            found.append((os.path.join(path, '.gitignore'), prefix))
+
+        ignore_patterns = read_gitignore(os.path.join(path, '.git', 'info', 'exclude'), prefix=prefix)
+        for gitignore_path, gitignore_prefix in reversed(found):
+            ignore_patterns.extend(read_gitignore(gitignore_path, prefix=gitignore_prefix))
+        return ignore_patterns
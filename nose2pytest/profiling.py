@@ -0,0 +1,127 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the Profiler used by the nose2pytest script when run with --profile. The profiler
+records the number of calls and the wall time spent in functions and methods of interest, grouped in
+categories: phase of the conversion (reading, parsing, matching, transforming, writing, etc), fixer class,
+nose function converted, and file. Instrumentation is done by wrapping the functions of interest when a
+profiler is given to the conversion tool, so that there is no overhead at all when profiling is off.
+
+Times are inclusive: for instance, the time of the "transform" phase includes the time of the precedence
+helpers (like has_weak_op_for_comparison) called while transforming.
+"""
+
+import json
+import time
+import types
+import functools
+
+
+CATEGORIES = ('phase', 'fixer', 'nose_function', 'file')
+
+# file in which the script saves the profile, unless given with --profile-output
+DEFAULT_PROFILE_OUTPUT = 'nose2pytest-profile.json'
+
+
+class Profiler:
+    """Accumulates call counts and wall times, per category and key within category"""
+
+    def __init__(self):
+        # category -> key -> [number of calls, total seconds]
+        self.stats = None
+        self.reset()
+        self._patched = []
+
+    def reset(self):
+        """Forget all stats recorded so far"""
+        self.stats = {category: {} for category in CATEGORIES}
+
+    def add(self, category: str, key: str, seconds: float, calls: int = 1):
+        """Record calls to key of category that took given time in total"""
+        key_stats = self.stats[category].setdefault(key, [0, 0.0])
+        key_stats[0] += calls
+        key_stats[1] += seconds
+
+    def wrap(self, func: callable, category: str, key: str or callable, extra: callable = None) -> callable:
+        """
+        Get a function that calls func and records the call.
+        :param key: the key under which calls are recorded; if callable, it is given the call's arguments and
+            returns the key
+        :param extra: if not None, called with the call's arguments, and returns an iterable of additional
+            (category, key) pairs under which the call is also recorded
+        :return: the wrapper
+
+        Recursive calls of func are counted, but only the outermost call is timed, so that time is not counted
+        more than once.
+        """
+        depth = 0
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            nonlocal depth
+            if depth:
+                self.stats[category].setdefault(key if isinstance(key, str) else key(*args, **kwargs),
+                                                [0, 0.0])[0] += 1
+                return func(*args, **kwargs)
+
+            depth += 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                depth -= 1
+                self.add(category, key if isinstance(key, str) else key(*args, **kwargs), elapsed)
+                if extra is not None:
+                    for extra_category, extra_key in extra(*args, **kwargs):
+                        self.add(extra_category, extra_key, elapsed)
+
+        return wrapper
+
+    def wrap_attr(self, obj, attr_name: str, category: str, key: str or callable = None, extra: callable = None):
+        """
+        Replace obj.attr_name by a wrapper that records calls (see wrap()). If obj is a module, the original
+        is restored by restore(); attributes of other objects are set on the object itself (shadowing methods
+        of its class) and are not restored.
+        :param key: as for wrap(); defaults to attr_name
+        """
+        original = getattr(obj, attr_name)
+        setattr(obj, attr_name, self.wrap(original, category, attr_name if key is None else key, extra))
+        if isinstance(obj, types.ModuleType):
+            self._patched.append((obj, attr_name, original))
+
+    def restore(self):
+        """Restore the module attributes replaced by wrap_attr()"""
+        for obj, attr_name, original in reversed(self._patched):
+            setattr(obj, attr_name, original)
+        self._patched = []
+
+    def as_dict(self) -> dict:
+        """Get the stats as dict of category -> key -> dict(calls=..., seconds=...)"""
+        return {category: {key: dict(calls=calls, seconds=seconds) for key, (calls, seconds) in stats.items()}
+                for category, stats in self.stats.items()}
+
+    def merge(self, profile: dict):
+        """Add the stats of a profile obtained from as_dict() (for instance in a worker process) to these"""
+        for category, stats in profile.items():
+            for key, key_stats in stats.items():
+                self.add(category, key, key_stats['seconds'], key_stats['calls'])
+
+    def save(self, path: str):
+        """Save the stats as JSON"""
+        with open(path, 'w') as file:
+            json.dump(self.as_dict(), file, indent=2, sort_keys=True)
+
+    def format_summary(self, top: int = 10) -> str:
+        """Get a text summary of the stats: for each category, the top keys by decreasing total time"""
+        lines = []
+        for category in CATEGORIES:
+            stats = self.stats[category]
+            if not stats:
+                continue
+            lines.append('{:<60} {:>10} {:>12}'.format('{} (top {} of {})'.format(category, top, len(stats)),
+                                                       'calls', 'seconds'))
+            ranked = sorted(stats.items(), key=lambda item: (-item[1][1], item[0]))
+            for key, (calls, seconds) in ranked[:top]:
+                lines.append('    {:<56} {:>10} {:>12.4f}'.format(key[-56:], calls, seconds))
+        return '\n'.join(lines)
@@ -0,0 +1,201 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the WorkerPool used by NoseConversionRefactoringTool to convert files with several processes.
+Unlike the queue of fissix's MultiprocessRefactoringTool, which hands files to the workers in the order of the
+walk of the folders, the pool knows the size of each task before starting, and hands out the largest first: a few
+very large files found at the end of the walk then no longer leave all the workers idle but one while they are
+converted. Each worker is given one task at a time, and sends back its result as soon as the task is done, so the
+main process can record it right away and nothing piles up in memory.
+
+Workers are recycled: a worker exits after a maximum number of tasks, or as soon as its resident set size goes
+over a ceiling after a task, and a new worker, forked from the main process, takes its place. A worker that dies
+while running a task (eg killed by the OOM killer) is also replaced, and the task is reported as failed.
+
+Each task can also be given a budget: a maximum time, and a maximum resident set size of the worker while it runs
+the task (checked every MEMORY_POLL_INTERVAL seconds; only on Linux, where /proc gives the RSS of other processes,
+so the memory budget is ignored elsewhere). A worker that goes over the budget is killed, the task is reported as
+over budget, and the other tasks go on.
+
+Workers are started with fork where the platform has it, whatever the default start method of multiprocessing
+(spawn on macOS and Windows): the function run by the workers is usually a bound method of an object of the main
+process, which is not picklable. Where fork is not available (Windows), the function and its object must be
+picklable.
+"""
+
+import os
+import sys
+import time
+import collections
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# seconds between two checks of the RSS of the workers, when tasks have a memory budget
+MEMORY_POLL_INTERVAL = 0.1
+
+# context used to start the workers (see module docstring):
+if 'fork' in multiprocessing.get_all_start_methods():
+    _mp_context = multiprocessing.get_context('fork')
+else:
+    _mp_context = multiprocessing.get_context()
+
+
+class TaskFailure(collections.namedtuple('TaskFailure', ['message', 'over_budget'])):
+    """Why a task has no result: over_budget is True if its worker was killed for exceeding the task budget"""
+
+
+def get_rss_mb(pid: int = None) -> float or None:
+    """
+    Get the resident set size of a process in MB.
+    :param pid: the process; if None, this process, for which the peak RSS is returned if the current one is not
+        available
+    :return: the RSS, or None if not available
+    """
+    try:
+        with open('/proc/{}/statm'.format('self' if pid is None else pid)) as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if resource is None or pid is not None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB elsewhere:
+    return peak_rss / 2 ** 20 if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def _work(func: callable, conn, max_tasks_per_child: int or None, max_rss_mb: float or None):
+    """Main function of a worker: run the tasks received on conn and send back (result, error, retiring)"""
+    num_tasks = 0
+    task = conn.recv()
+    while task is not None:
+        try:
+            result, error = func(task), None
+        except Exception as exc:
+            result, error = None, '{}: {}'.format(exc.__class__.__name__, exc)
+        num_tasks += 1
+        retiring = ((max_tasks_per_child is not None and num_tasks >= max_tasks_per_child)
+                    or (max_rss_mb is not None and (get_rss_mb() or 0) > max_rss_mb))
+        conn.send((result, error, retiring))
+        if retiring:
+            break
+        task = conn.recv()
+    conn.close()
+
+
+class WorkerPool:
+    """Runs a function on tasks in worker processes, largest task first, and streams back the results"""
+
+    def __init__(self, func: callable, num_processes: int, max_tasks_per_child: int = None,
+                 max_rss_mb: float = None, task_timeout: float = None, max_task_rss_mb: float = None):
+        """
+        :param func: function called in the workers with each task; workers are forked where possible, so it can be
+            a bound method of an object of the main process, used as it was when the worker was started
+        :param num_processes: maximum number of workers running at the same time
+        :param max_tasks_per_child: if not None, a worker is replaced after running this many tasks
+        :param max_rss_mb: if not None, a worker is replaced after a task that leaves its RSS above this many MB
+        :param task_timeout: if not None, a worker is killed if a task takes more than this many seconds
+        :param max_task_rss_mb: if not None, a worker is killed if its RSS goes above this many MB during a task
+            (only on Linux: the RSS of the workers is not available elsewhere)
+        """
+        self.func = func
+        self.num_processes = num_processes
+        self.max_tasks_per_child = max_tasks_per_child
+        self.max_rss_mb = max_rss_mb
+        self.task_timeout = task_timeout
+        self.max_task_rss_mb = max_task_rss_mb
+        self.num_workers_started = 0
+
+    def run(self, tasks: [(int, object)]):
+        """
+        Run the function on each task, largest first.
+        :param tasks: pairs (size, task); tasks must be picklable
+        :return: iterator of triples (task, result, failure) in the order in which tasks finish: failure is None
+            if the function returned result, otherwise a TaskFailure about the exception it raised, the death of
+            the worker running it, or the budget it exceeded
+        """
+        pending = collections.deque(task for _, task in sorted(tasks, key=lambda item: item[0], reverse=True))
+        # connection to worker -> [worker process, task it is running, time the task started]
+        workers = {}
+
+        def start_task(conn, task):
+            conn.send(task)
+            workers[conn][1:] = [task, time.monotonic()]
+
+        def stop_worker(conn, kill=False):
+            process = workers.pop(conn)[0]
+            if kill:
+                process.kill()
+            conn.close()
+            process.join()
+
+        try:
+            while pending or workers:
+                while pending and len(workers) < self.num_processes:
+                    conn, process = self._start_worker()
+                    workers[conn] = [process, None, None]
+                    start_task(conn, pending.popleft())
+
+                for conn in wait(list(workers), self._get_wait_timeout(workers)):
+                    process, task, _ = workers[conn]
+                    try:
+                        result, error, retiring = conn.recv()
+                        failure = None if error is None else TaskFailure(error, False)
+                    except EOFError:
+                        process.join()
+                        result, retiring = None, True
+                        failure = TaskFailure('worker process died (exit code {})'.format(process.exitcode), False)
+                    yield task, result, failure
+
+                    if pending and not retiring:
+                        start_task(conn, pending.popleft())
+                    else:
+                        if not retiring:
+                            conn.send(None)
+                        stop_worker(conn)
+
+                for conn, (process, task, start_time) in list(workers.items()):
+                    message = self._check_budget(process, start_time)
+                    if message is not None:
+                        stop_worker(conn, kill=True)
+                        yield task, None, TaskFailure(message, True)
+
+        finally:
+            # only if the caller stopped iterating, or on error:
+            for conn in list(workers):
+                stop_worker(conn, kill=True)
+
+    def _get_wait_timeout(self, workers: dict) -> float or None:
+        """Get how long to wait for results before checking the budget of the tasks being run"""
+        timeout = None
+        if self.task_timeout is not None:
+            first_start_time = min(start_time for _, _, start_time in workers.values())
+            timeout = max(0.0, first_start_time + self.task_timeout - time.monotonic())
+        if self.max_task_rss_mb is not None:
+            timeout = MEMORY_POLL_INTERVAL if timeout is None else min(timeout, MEMORY_POLL_INTERVAL)
+        return timeout
+
+    def _check_budget(self, process: multiprocessing.Process, start_time: float) -> str or None:
+        """Get a message if the task run by a worker is over budget, or None"""
+        if self.task_timeout is not None and time.monotonic() - start_time > self.task_timeout:
+            return 'took more than {} s'.format(self.task_timeout)
+        if self.max_task_rss_mb is not None and (get_rss_mb(process.pid) or 0) > self.max_task_rss_mb:
+            return 'used more than {} MB'.format(self.max_task_rss_mb)
+        return None
+
+    def _start_worker(self) -> tuple:
+        """Start a worker process; return the connection to it, and the process"""
+        parent_conn, child_conn = _mp_context.Pipe()
+        process = _mp_context.Process(target=_work, daemon=True,
+                                      args=(self.func, child_conn, self.max_tasks_per_child, self.max_rss_mb))
+        process.start()
+        # so that the parent gets EOF from its end of the pipe if the worker dies:
+        child_conn.close()
+        self.num_workers_started += 1
+        return parent_conn, process
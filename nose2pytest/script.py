@@ -14,15 +14,36 @@ code nodes back into Python source code. The following article was very useful:
 http://python3porting.com/fixers.html#find-pattern.
 """
 
+import io
+import os
+import json
+import re
 import sys
+import mmap
+import difflib
+import stat
+import tokenize
 import argparse
 import logging
+import tempfile
+import subprocess
+from itertools import chain
+from contextlib import closing
+from collections import namedtuple
 from pathlib import Path
 
 from fissix import refactor, fixer_base, pygram, pytree, pgen2
 from fissix.pytree import Node as PyNode, Leaf as PyLeaf
 from fissix.pgen2 import token
 from fissix.fixer_util import parenthesize
+from fissix.patcomp import PatternCompiler
+
+from nose2pytest.cache import ConversionCache, DEFAULT_CACHE_DIR
+from nose2pytest.discovery import FileFinder
+from nose2pytest.profiling import Profiler, DEFAULT_PROFILE_OUTPUT
+from nose2pytest.scheduler import WorkerPool
+from nose2pytest.token_engine import TokenEngine
+from nose2pytest.ast_engine import AstEngine
 
 __version__ = "1.0.12"
 
@@ -75,21 +96,21 @@ PATTERN_TWO_ARGS_OR_KWARGS = """
     ')' > >"""
 
 PATTERN_1_OR_2_ARGS = """
-    power< '{}' trailer< '('
+    power< ({}) trailer< '('
         ( not(arglist | argument<any '=' any>) test=any
         | arglist< test=any ',' msg=any > )
     ')' > >
     """
 
 PATTERN_2_OR_3_ARGS = """
-    power< '{}' trailer< '('
+    power< ({}) trailer< '('
         ( arglist< lhs=any ',' rhs=any [','] >
         | arglist< lhs=any ',' rhs=any ',' msg=any > )
     ')' > >
     """
 
 PATTERN_ALMOST_ARGS = """
-    power< '{}' trailer< '('
+    power< ({}) trailer< '('
         ( arglist< aaa=any ',' bbb=any [','] >
         | arglist< aaa=any ',' bbb=any ',' arg3=any [','] >
         | arglist< aaa=any ',' bbb=any ',' arg3=any ',' arg4=any > )
@@ -122,7 +143,23 @@ BOOLEAN_OPS = (
     (py_grammar_symbols['and_test'], 1, 'and'),
     (py_grammar_symbols['or_test'], 1, 'or')
 )
-GENERATOR_TYPE = py_grammar_symbols['argument']
+# type of an argument node of a call that is not a plain expression: a keyword argument (name=value), or a
+# generator expression
+ARGUMENT_TYPE = py_grammar_symbols['argument']
+# type of an implicit concatenation of string literals
+ATOM_TYPE = py_grammar_symbols['atom']
+SIMPLE_STMT_TYPE = py_grammar_symbols['simple_stmt']
+IMPORT_NAME_TYPE = py_grammar_symbols['import_name']
+IMPORT_FROM_TYPE = py_grammar_symbols['import_from']
+DOTTED_AS_NAMES_TYPE = py_grammar_symbols['dotted_as_names']
+
+# status of a nose function call site, recorded by the fixers for the --report option:
+CALL_CONVERTED = 'converted'
+# the arguments do not match the pattern of the fixer (eg too many, or *args):
+CALL_UNSUPPORTED_ARGS = 'unsupported_args'
+# the arguments match the pattern but the fixer cannot convert them (eg positional places of assert_almost_equal):
+CALL_LEFT_ALONE = 'left_alone'
+CALL_STATUSES = (CALL_CONVERTED, CALL_UNSUPPORTED_ARGS, CALL_LEFT_ALONE)
 
 # these operators require parens around function arg if binop is + or -
 ADD_SUB_GROUP_TOKENS = (
@@ -132,21 +169,132 @@ ADD_SUB_GROUP_TOKENS = (
 )
 
 
-def contains_newline(node: PyNode) -> bool:
+# result of analyze_precedence(): whether a node has an operator as weak as a comparison, or an operator of the
+# + - group (in which case it needs parentheses as argument of + or -), and a newline, outside of brackets
+PrecedenceInfo = namedtuple('PrecedenceInfo', ['weak_op_for_comparison', 'addsub_group_op', 'newline'])
+
+# symbols (node type, operator type, operator) of operators that are as weak as comparisons
+WEAK_OP_SYMBOLS = frozenset(BOOLEAN_OPS + MEMBERSHIP_SYMBOLS + IDENTITY_SYMBOLS)
+
+NO_PRECEDENCE_INFO = PrecedenceInfo(False, False, False)
+
+# bit flags of _find_precedence_flags(), one per field of PrecedenceInfo:
+_WEAK_OP_FOR_COMPARISON, _ADDSUB_GROUP_OP, _NEWLINE = 1, 2, 4
+# type of child -> its flag, or _BRACKET for the brackets that end the scan of the children, or _NAMED_OP for the
+# operators made of names (except the single NAME ones, of _WEAK_OP_NAMES):
+_BRACKET, _NAMED_OP = 8, 16
+_TOKEN_FLAGS = dict([(token_type, _WEAK_OP_FOR_COMPARISON) for token_type in COMPARISON_TOKENS] +
+                    [(token_type, _ADDSUB_GROUP_OP) for token_type in ADD_SUB_GROUP_TOKENS] +
+                    [(token_type, _BRACKET) for token_type in NEWLINE_OK_TOKENS] +
+                    [(COMP_OP, _NAMED_OP)])
+# names of the operators of WEAK_OP_SYMBOLS that are single NAME tokens:
+_WEAK_OP_NAMES = frozenset(name for _, op_type, name in WEAK_OP_SYMBOLS if op_type == token.NAME)
+
+
+def _find_precedence_flags(node: PyNode or PyLeaf, infos: dict = None, stop_flags: int = 0) -> int:
+    """
+    Find the precedence flags of a node, in a single iterative pass over its subtree, so the analysis of large or
+    deeply nested arguments is not limited by recursion depth. Each node is checked before its children, and the
+    pass stops as soon as one of stop_flags is found, so eg 'a == <large expression>' is found to have an
+    operator as weak as a comparison without visiting the large expression.
+
+    The children of each node are scanned in order, up to the first bracket ( [ or {, so that operators and
+    newlines inside or after brackets do not count: eg 'a\n  in b' has a newline, whereas '(a\n   b)' does not.
+
+    :param infos: if not None, the flags of the nodes already analyzed completely, by id of node (with the node, to
+        keep it alive so its id is not reused): these nodes are not visited again, and the nodes analyzed
+        completely by this call are added. The flags kept there leave out the prefix of the node itself, so the
+        prefix of a node can change while it is in infos (eg an argument moved to the destination of a
+        conversion), but not the rest of its subtree.
+    :param stop_flags: the flags whose presence is enough to know; if the pass stops early, the flags found
+        are not all set
+    :return: the flags found
+    """
+    if not isinstance(node, PyNode):
+        return 0
+
+    # the prefix of a node is the one of its first child, which its parent checks (see below):
+    first_child = node.children[0] if node.children else None
+    found = _NEWLINE if first_child and first_child.type not in NEWLINE_OK_TOKENS and '\n' in node.prefix else 0
+    if infos is not None and id(node) in infos:
+        return found | infos[id(node)][1]
+    if found & stop_flags:
+        return found
+
+    # nodes to visit; when recording in infos, the nodes are visited again once their children have been visited,
+    # as triplets (node, its scanned children, its own flags), to record their flags:
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.__class__ is tuple:
+            current, scanned_children, flags = current
+            for child in scanned_children:
+                if isinstance(child, PyNode):
+                    flags |= infos[id(child)][1]
+            infos[id(current)] = (current, flags)
+            continue
+
+        if infos is not None:
+            # replaced by the triplet once the children are scanned, so it is visited after them:
+            triplet_index = len(stack)
+            stack.append(None)
+
+        scanned_children = current.children
+        flags = _WEAK_OP_FOR_COMPARISON if len(scanned_children) == 5 and is_if_else_op(current) else 0
+        for index, child in enumerate(scanned_children):
+            child_type = child.type
+            if child_type in _TOKEN_FLAGS:
+                token_flags = _TOKEN_FLAGS[child_type]
+                if token_flags == _BRACKET:
+                    scanned_children = scanned_children[:index]
+                    break
+                if token_flags == _NAMED_OP:
+                    # membership, identity and boolean operators:
+                    if (current.type, child_type, str(child).strip()) in WEAK_OP_SYMBOLS:
+                        flags |= _WEAK_OP_FOR_COMPARISON
+                else:
+                    flags |= token_flags
+            elif child_type == token.NAME:
+                if child.value in _WEAK_OP_NAMES and (current.type, child_type, child.value) in WEAK_OP_SYMBOLS:
+                    flags |= _WEAK_OP_FOR_COMPARISON
+            # the prefix of the first child is the one of the current node, left out:
+            if index and '\n' in child.prefix:
+                flags |= _NEWLINE
+
+            if isinstance(child, PyNode):
+                if infos is not None and id(child) in infos:
+                    found |= infos[id(child)][1]
+                else:
+                    stack.append(child)
+
+        found |= flags
+        if found & stop_flags:
+            return found
+        if infos is not None:
+            stack[triplet_index] = (current, scanned_children, flags)
+
+    return found
+
+
+def analyze_precedence(node: PyNode or PyLeaf, infos: dict = None) -> PrecedenceInfo:
+    """
+    Analyze a node that represents an argument of an assert_ function, in a single pass over its subtree.
+    :param infos: see _find_precedence_flags(); the same dict can be given for the nodes of a transformation, so
+        that a node that contains nodes already analyzed (eg the arguments of an assertion) does not visit them again
+    """
+    flags = _find_precedence_flags(node, infos)
+    return PrecedenceInfo(bool(flags & _WEAK_OP_FOR_COMPARISON), bool(flags & _ADDSUB_GROUP_OP),
+                          bool(flags & _NEWLINE))
+
+
+def contains_newline(node: PyNode, infos: dict = None) -> bool:
     """
     Returns True if any of the children of node have a prefix containing \n, or any of their children recursively.
     Returns False if no non-bracketed children are found that have such prefix. Example: node of 'a\n  in b' would
     return True, whereas '(a\n   b)' would return False.
+    :param infos: see _find_precedence_flags()
     """
-    for child in node.children:
-        if child.type in NEWLINE_OK_TOKENS:
-            return False
-        if '\n' in child.prefix:
-            return True
-        if isinstance(child, PyNode) and contains_newline(child):
-            return True
-
-    return False
+    return bool(_find_precedence_flags(node, infos, _NEWLINE) & _NEWLINE)
 
 
 def wrap_parens(arg_node: PyNode, checker_fn: callable) -> PyNode or PyLeaf:
@@ -181,35 +329,12 @@ def is_if_else_op(node: PyNode) -> bool:
             )
 
 
-def has_weak_op_for_comparison(node: PyNode) -> bool:
+def has_weak_op_for_comparison(node: PyNode, infos: dict = None) -> bool:
     """Test if node contains operators that are weaking than comparison operators"""
+    return bool(_find_precedence_flags(node, infos, _WEAK_OP_FOR_COMPARISON) & _WEAK_OP_FOR_COMPARISON)
 
-    if is_if_else_op(node):
-        return True
 
-    for child in node.children:
-        if child.type in NEWLINE_OK_TOKENS:
-            return False
-
-        # comparisons and boolean combination:
-        binop_type = child.type
-        if binop_type in COMPARISON_TOKENS:
-            return True
-
-        # membership and identity tests:
-        binop_name = str(child).strip()
-        symbol = (node.type, binop_type, binop_name)
-        if symbol in BOOLEAN_OPS or symbol in MEMBERSHIP_SYMBOLS or symbol in IDENTITY_SYMBOLS:
-            return True
-
-        # continue into children that are nodes:
-        if isinstance(child, PyNode) and has_weak_op_for_comparison(child):
-            return True
-
-    return False
-
-
-def wrap_parens_for_comparison(arg_node: PyNode or PyLeaf) -> PyNode or PyLeaf:
+def wrap_parens_for_comparison(arg_node: PyNode or PyLeaf, infos: dict = None) -> PyNode or PyLeaf:
     """
     Assuming arg_node represents an argument to an assert_ function that uses comparison operators, then if
     arg_node has any operators that have equal or weaker precedence than those operators (including
@@ -217,47 +342,36 @@ def wrap_parens_for_comparison(arg_node: PyNode or PyLeaf) -> PyNode or PyLeaf:
     Otherwise, return arg_node.
 
     :param arg_node: the arg_node to parenthesize
+    :param infos: see _find_precedence_flags()
     :return: the arg_node for the parenthesized expression, or the arg_node itself
     """
-    return wrap_parens(arg_node, has_weak_op_for_comparison)
+    return wrap_parens(arg_node, lambda node: has_weak_op_for_comparison(node, infos))
 
 
-def has_weak_op_for_addsub(node: PyNode, check_comparison: bool = True) -> bool:
-    if check_comparison and has_weak_op_for_comparison(node):
-        return True
+def has_weak_op_for_addsub(node: PyNode, check_comparison: bool = True, infos: dict = None) -> bool:
+    flags = _ADDSUB_GROUP_OP | _WEAK_OP_FOR_COMPARISON if check_comparison else _ADDSUB_GROUP_OP
+    return bool(_find_precedence_flags(node, infos, flags) & flags)
 
-    for child in node.children:
-        if child.type in NEWLINE_OK_TOKENS:
-            return False
 
-        if child.type in ADD_SUB_GROUP_TOKENS:
-            return True
-
-        # continue into children that are nodes:
-        if isinstance(child, PyNode) and has_weak_op_for_addsub(child, check_comparison=False):
-            return True
-
-    return False
-
-
-def wrap_parens_for_addsub(arg_node: PyNode or PyLeaf) -> PyNode or PyLeaf:
+def wrap_parens_for_addsub(arg_node: PyNode or PyLeaf, infos: dict = None) -> PyNode or PyLeaf:
     """
     Assuming arg_node represents an argument to an assert_ function that uses + or - operators, then if
     arg_node has any operators that have equal or weaker precedence than those operators, return a new node
     that adds parentheses around arg_node. Otherwise, return arg_node.
 
     :param arg_node: the arg_node to parenthesize
+    :param infos: see _find_precedence_flags()
     :return: the arg_node for the parenthesized expression, or the arg_node itself
     """
-    return wrap_parens(arg_node, has_weak_op_for_addsub)
+    return wrap_parens(arg_node, lambda node: has_weak_op_for_addsub(node, infos=infos))
 
 
 def get_prev_sibling(node: PyNode) -> PyNode:
-    if node is None:
-        return None  # could not find
-    if node.prev_sibling is not None:
-        return node.prev_sibling
-    return get_prev_sibling(node.parent)
+    while node is not None:
+        if node.prev_sibling is not None:
+            return node.prev_sibling
+        node = node.parent
+    return None  # could not find
 
 
 def adjust_prefix_first_arg(node: PyNode or PyLeaf, orig_prefix: str):
@@ -267,56 +381,182 @@ def adjust_prefix_first_arg(node: PyNode or PyLeaf, orig_prefix: str):
         node.prefix = orig_prefix or " "
 
 
+def is_string_literal(node: PyNode or PyLeaf) -> bool:
+    """Test if a node is a string literal, or an implicit concatenation of string literals, without f-strings"""
+    if node.type == token.STRING:
+        leaves = [node]
+    elif node.type == ATOM_TYPE:
+        leaves = node.children
+    else:
+        return False
+    return all(leaf.type == token.STRING and 'f' not in re.match('[a-zA-Z]*', leaf.value).group().lower()
+               for leaf in leaves)
+
+
+def insert_regex_constants(tree: PyNode, constants: [(str, str)]):
+    """
+    Insert the definitions of compiled regular expressions at the top of a module: after its docstring and the
+    imports that follow it, with "import re" if these imports do not include it.
+    :param constants: pairs (name of the constant, source of the pattern)
+    """
+    def is_import_stmt(node):
+        return node.type == SIMPLE_STMT_TYPE and node.children[0].type in (IMPORT_NAME_TYPE, IMPORT_FROM_TYPE)
+
+    def imports_re(stmt):
+        # "import re" or "import os, re", but not "import re as regex":
+        re_leaf = PyLeaf(token.NAME, 're')
+        for child in stmt.children:
+            if child.type == IMPORT_NAME_TYPE:
+                names = child.children[1]
+                if names == re_leaf or (names.type == DOTTED_AS_NAMES_TYPE and re_leaf in names.children):
+                    return True
+        return False
+
+    children = tree.children
+    pos = 0
+    if children and children[0].type == SIMPLE_STMT_TYPE and children[0].children[0].type == token.STRING:
+        pos += 1
+    while pos < len(children) and is_import_stmt(children[pos]):
+        pos += 1
+
+    lines = ['{} = re.compile({})\n'.format(name, pattern) for name, pattern in constants]
+    if not any(imports_re(stmt) for stmt in children[:pos]):
+        lines.insert(0, 'import re\n')
+    new_stmts = driver.parse_string(''.join(lines)).children[:-1]
+
+    if pos == 0:
+        # the comments at the top of the module (eg #! line, license) stay at the top:
+        new_stmts[0].prefix = children[0].prefix
+        children[0].prefix = ''
+    elif not is_import_stmt(children[pos - 1]):
+        new_stmts[0].prefix = '\n'
+    constants_start = len(new_stmts) - len(constants)
+    if constants_start > 0 or pos > 0:
+        new_stmts[constants_start].prefix += '\n'
+    if not children[pos].prefix.startswith('\n'):
+        children[pos].prefix = '\n' + children[pos].prefix
+    for offset, stmt in enumerate(new_stmts):
+        tree.insert_child(pos + offset, stmt)
+
+
+# conversion engines of NoseConversionRefactoringTool:
+ENGINE_FISSIX = 'fissix'
+ENGINE_TOKENIZE = 'tokenize'
+ENGINE_AST = 'ast'
+ENGINES = (ENGINE_FISSIX, ENGINE_TOKENIZE, ENGINE_AST)
+
+# conversions of assert_almost_equal() and assert_not_almost_equal(), see FixAssertAlmostEq:
+ALMOST_STYLE_APPROX = 'approx'
+ALMOST_STYLE_ABS = 'abs'
+ALMOST_STYLES = (ALMOST_STYLE_APPROX, ALMOST_STYLE_ABS)
+
+# templates of the fixers, see FixAssertBase._get_templates()
+_fixer_templates = {}
+
+
 class FixAssertBase(fixer_base.BaseFix):
-    # BM_compatible = True
+    BM_compatible = True
 
     # Each derived class should define a dictionary where the key is the name of the nose function to convert,
     # and the value is a pair where the first item is the assertion statement expression, and the second item
-    # is data that will be available in _transform_dest() override as self._arg_paths.
+    # is data that will be available in _transform_dest() override as arg_paths. A single instance of the
+    # derived class handles all the functions in its conversions: its PATTERN matches a call to any of them,
+    # and transform() looks up the called function's name to find the destination tree to use.
     conversions = None
 
     DEFAULT_ARG_PATHS = None
 
-    @classmethod
-    def create_all(cls, *args, **kwargs) -> [fixer_base.BaseFix]:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # (line, column) of the function name -> (nose function name, status), for the current tree:
+        self.call_sites = {}
+
+        # precedence flags of the nodes analyzed by the current transform() (see _find_precedence_flags()):
+        self.precedence_infos = {}
+
+        # map nose function name to (destination tree, arg paths); the trees are shared, transform() clones them:
+        self.dest_trees = self._get_templates()[0]
+        for nose_func_name, (dest_tree, _) in self.dest_trees.items():
+            log.info('%s will convert %s as "%s"', self.__class__.__name__, nose_func_name, dest_tree)
+
+    @override(fixer_base.BaseFix)
+    def compile_pattern(self):
         """
-        Create an instance for each key in cls.conversions, assumed to be defined by derived class.
-        The *args and **kwargs are those of BaseFix.
-        :return: list of instances created
+        The bottom matcher needs the nose function names in the pattern tree so it can dispatch candidate
+        nodes to this fixer, but matching a node is cheaper by looking up its function name in the conversions
+        table, then matching the arguments with a pattern that accepts any name.
         """
-        fixers = []
-        for nose_func in cls.conversions:
-            fixers.append(cls(nose_func, *args, **kwargs))
-        return fixers
+        _, self.pattern_tree, self.pattern = self._get_templates()
 
-    def __init__(self, nose_func_name: str, *args, **kwargs):
-        if self.DEFAULT_ARG_PATHS is None:
-            test_expr, conv_data = self.conversions[nose_func_name]
-            self._arg_paths = conv_data
-        else:
-            test_expr = self.conversions[nose_func_name]
-            self._arg_paths = self.DEFAULT_ARG_PATHS
-
-        self.nose_func_name = nose_func_name
+    def _get_templates(self) -> ({str: (PyNode, object)}, list, object):
+        """
+        Get the destination trees and the compiled patterns of this fixer. They are built the first time a fixer
+        of this class (with these conversions) is created, then shared by all the fixers created after it,
+        including those of tools created later in the process and in worker processes forked from it.
+        :return: triplet (map of nose function name to (destination tree, arg paths), pattern tree for the
+            bottom matcher, pattern used by match())
+        """
+        key = (self.__class__, self.PATTERN, repr(self.conversions), self.DEFAULT_ARG_PATHS)
+        templates = _fixer_templates.get(key)
+        if templates is not None:
+            return templates
+
+        dest_trees = self._build_dest_trees(self.conversions)
+        func_names = ' | '.join("'{}'".format(nose_func_name) for nose_func_name in self.conversions)
+        pattern_compiler = PatternCompiler()
+        _, pattern_tree = pattern_compiler.compile_pattern(self.PATTERN.format(func_names), with_tree=True)
+        pattern = pattern_compiler.compile_pattern(self.PATTERN.format('NAME'))
+
+        templates = _fixer_templates[key] = (dest_trees, pattern_tree, pattern)
+        return templates
+
+    def _build_dest_trees(self, conversions: dict) -> {str: (PyNode, object)}:
+        """Get the map of nose function name to (destination tree, arg paths) of conversions"""
+        dest_trees = {}
+        for nose_func_name in conversions:
+            if self.DEFAULT_ARG_PATHS is None:
+                test_expr, arg_paths = conversions[nose_func_name]
+            else:
+                test_expr = conversions[nose_func_name]
+                arg_paths = self.DEFAULT_ARG_PATHS
+
+            dest_tree = driver.parse_string('assert ' + test_expr + '\n')
+            # remove the \n we added
+            del dest_tree.children[0].children[1]
+            dest_trees[nose_func_name] = (dest_tree, arg_paths)
+        return dest_trees
 
-        self.PATTERN = self.PATTERN.format(nose_func_name)
-        log.info('%s will convert %s as "assert %s"', self.__class__.__name__, nose_func_name, test_expr)
-        super().__init__(*args, **kwargs)
+    @override(fixer_base.BaseFix)
+    def start_tree(self, tree: PyNode, filename: str):
+        super().start_tree(tree, filename)
+        self.call_sites = {}
 
-        self.dest_tree = driver.parse_string('assert ' + test_expr + '\n')
-        # remove the \n we added
-        del self.dest_tree.children[0].children[1]
+    @override(fixer_base.BaseFix)
+    def match(self, node: PyNode) -> {str: PyNode}:
+        func_name_node = node.children[0]
+        if func_name_node.type != token.NAME or func_name_node.value not in self.conversions:
+            return False
+        results = super().match(node)
+        if not results:
+            self._record_call_site(func_name_node, CALL_UNSUPPORTED_ARGS)
+        return results
 
     @override(fixer_base.BaseFix)
     def transform(self, node: PyNode, results: {str: PyNode}) -> PyNode:
         assert results
-        dest_tree = self.dest_tree.clone()
+        nose_func_name = node.children[0].value
+        dest_tree, arg_paths = self.dest_trees[nose_func_name]
+        dest_tree = dest_tree.clone()
+        self.precedence_infos = {}
         assert_arg_test_node = self._get_node(dest_tree, (0, 0, 1))
         assert_args = assert_arg_test_node.parent
 
-        if self._transform_dest(assert_arg_test_node, results):
+        converted = self._transform_dest(assert_arg_test_node, results, arg_paths)
+        self._record_call_site(node.children[0], CALL_CONVERTED if converted else CALL_LEFT_ALONE)
+        if converted:
             assert_arg_test_node = self._get_node(dest_tree, (0, 0, 1))
-            if contains_newline(assert_arg_test_node):
+            if contains_newline(assert_arg_test_node, self.precedence_infos):
                 prefixes = assert_arg_test_node.prefix.split('\n', 1)
                 assert_arg_test_node.prefix = '\n' + prefixes[1] if len(prefixes) > 1 else ''
                 # NOTE: parenthesize(node) needs an unparent node, so give it a clone:
@@ -333,14 +573,19 @@ class FixAssertBase(fixer_base.BaseFix):
             return node
 
     @override_required
-    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}) -> bool:
+    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}, arg_paths) -> bool:
         """
         Transform the given node to use the results.
         :param assert_arg_test_node: the destination node representing the assertion test argument
         :param results: the results of pattern matching
+        :param arg_paths: the conversion data (node paths of the arguments) for the nose function matched
         """
         pass
 
+    def _record_call_site(self, func_name_node: PyLeaf, status: str):
+        # a call site can be matched again after a call that contains it is converted, so the last status wins
+        self.call_sites[func_name_node.lineno, func_name_node.column] = (func_name_node.value, status)
+
     def _get_node(self, from_node, indices_path: None or int or [int]) -> PyLeaf or PyNode:
         """
         Get a node relative to another node.
@@ -394,7 +639,7 @@ class FixAssert1Arg(FixAssertBase):
 
     # the path to arg node is different for every conversion
     # Example: assert_false(a) becomes "assert not a", so the PyNode for assertion expression is 'not a', and
-    # the 'a' is its children[1] so self._arg_paths needs to be 1.
+    # the 'a' is its children[1] so its arg_paths needs to be 1.
     conversions = dict(
         assert_true=('a', None),
         ok_=('a', None),
@@ -404,15 +649,15 @@ class FixAssert1Arg(FixAssertBase):
     )
 
     @override(FixAssertBase)
-    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}) -> bool:
+    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}, arg_paths) -> bool:
         test = results["test"]
         test = test.clone()
-        if test.type == GENERATOR_TYPE:
+        if test.type == ARGUMENT_TYPE:
             test = parenthesize(test)
         test.prefix = " "
 
         # the destination node for 'a' is in conv_data:
-        dest_node = self._get_node(assert_arg_test_node, self._arg_paths)
+        dest_node = self._get_node(assert_arg_test_node, arg_paths)
         dest_node.replace(test)
 
         return True
@@ -442,27 +687,100 @@ class FixAssert2Args(FixAssertBase):
         assert_regex=('re.search(b, a)', ((2, 1, 2), (2, 1, 0))),
     )
 
+    # With the "hoist_regexes" option, the conversions of the calls whose pattern is a string literal: the pattern
+    # is compiled once, in a constant defined at the top of the module (see finish_tree()), whose name replaces
+    # _RE_. The paths info is the pair of node paths of that name and of arg a.
+    hoisted_conversions = dict(
+        assert_not_regex=('not _RE_.search(a)', ((1, 0), (1, 2, 1))),
+        assert_regex=('_RE_.search(a)', ((0,), (2, 1))),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hoisted_dest_trees = None
+        if self.options.get('hoist_regexes') and set(self.hoisted_conversions) & set(self.conversions):
+            key = (self.__class__, repr(self.hoisted_conversions))
+            if key not in _fixer_templates:
+                _fixer_templates[key] = self._build_dest_trees(self.hoisted_conversions)
+            self.hoisted_dest_trees = _fixer_templates[key]
+
+        # source of pattern -> name of its constant, and index of the last constant, for the current tree:
+        self.regex_constants = {}
+        self.regex_index = 0
+        self.used_names = set()
+
+    @override(FixAssertBase)
+    def start_tree(self, tree: PyNode, filename: str):
+        super().start_tree(tree, filename)
+        self.regex_constants = {}
+        self.regex_index = 0
+        self.used_names = getattr(tree, 'used_names', set())
+
+    @override(fixer_base.BaseFix)
+    def finish_tree(self, tree: PyNode, filename: str):
+        super().finish_tree(tree, filename)
+        if self.regex_constants:
+            insert_regex_constants(tree, [(name, pattern) for pattern, name in self.regex_constants.items()])
+
+    @override(FixAssertBase)
+    def transform(self, node: PyNode, results: {str: PyNode}) -> PyNode:
+        nose_func_name = node.children[0].value
+        if (self.hoisted_dest_trees is not None and nose_func_name in self.hoisted_dest_trees
+                and is_string_literal(results["rhs"])):
+            # _transform_dest() will look for this:
+            results["hoisted"] = (self._get_regex_constant(results["rhs"]), self.hoisted_dest_trees[nose_func_name])
+        return super().transform(node, results)
+
+    def _get_regex_constant(self, pattern_node: PyNode or PyLeaf) -> str:
+        """Get the name of the constant of a pattern; the same pattern in a module gets the same constant"""
+        pattern_node = pattern_node.clone()
+        pattern_node.prefix = ''
+        pattern = str(pattern_node)
+        if pattern not in self.regex_constants:
+            # the index only increases, so that names skipped because the module uses them are not given out later:
+            self.regex_index += 1
+            while '_RE_{}'.format(self.regex_index) in self.used_names:
+                self.regex_index += 1
+            self.regex_constants[pattern] = '_RE_{}'.format(self.regex_index)
+        return self.regex_constants[pattern]
+
     @override(FixAssertBase)
-    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}) -> bool:
+    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}, arg_paths) -> bool:
+        if "hoisted" in results:
+            return self._transform_hoisted_dest(assert_arg_test_node, results)
+
         lhs = results["lhs"].clone()
 
         rhs = results["rhs"]
         rhs = rhs.clone()
 
-        dest1 = self._get_node(assert_arg_test_node, self._arg_paths[0])
-        dest2 = self._get_node(assert_arg_test_node, self._arg_paths[1])
+        dest1 = self._get_node(assert_arg_test_node, arg_paths[0])
+        dest2 = self._get_node(assert_arg_test_node, arg_paths[1])
 
-        new_lhs = wrap_parens_for_comparison(lhs) if self.NEED_ARGS_PARENS else lhs
+        new_lhs = wrap_parens_for_comparison(lhs, self.precedence_infos) if self.NEED_ARGS_PARENS else lhs
         dest1.replace(new_lhs)
         adjust_prefix_first_arg(new_lhs, results["lhs"].prefix)
 
-        new_rhs = wrap_parens_for_comparison(rhs) if self.NEED_ARGS_PARENS else rhs
+        new_rhs = wrap_parens_for_comparison(rhs, self.precedence_infos) if self.NEED_ARGS_PARENS else rhs
         dest2.replace(new_rhs)
         if get_prev_sibling(new_rhs).type in NEWLINE_OK_TOKENS:
             new_rhs.prefix = ''
 
         return True
 
+    def _transform_hoisted_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}) -> bool:
+        """Replace the test of the destination by the one of the hoisted conversion"""
+        constant_name, (hoisted_tree, (name_path, arg_path)) = results["hoisted"]
+        test_node = self._get_node(hoisted_tree, (0, 0, 1)).clone()
+        self._get_node(test_node, name_path).value = constant_name
+
+        lhs = results["lhs"].clone()
+        lhs.prefix = ''
+        self._get_node(test_node, arg_path).replace(lhs)
+        test_node.prefix = assert_arg_test_node.prefix
+        assert_arg_test_node.replace(test_node)
+        return True
+
 
 class FixAssertBinOp(FixAssert2Args):
     """
@@ -475,7 +793,7 @@ class FixAssertBinOp(FixAssert2Args):
     # arg a, the second for arg b
     #
     # Example 1: assert_equal(a, b) will convert to "assert a == b" so the PyNode for assertion expression
-    # is 'a == b' and a is that node's children[0], whereas b is that node's children[2], so the self._arg_paths
+    # is 'a == b' and a is that node's children[0], whereas b is that node's children[2], so the arg_paths
     # will be simply (0, 2).
     DEFAULT_ARG_PATHS = (0, 2)
 
@@ -509,6 +827,9 @@ class FixAssertAlmostEq(FixAssertBase):
     """
     Fixer class for any 3-argument assertion function (assert_func(a, b, c)). It supports optional fourth arg
     as the assertion message, ie assert_func(a, b, c, msg) -> assert a op b op c, msg.
+
+    With the "almost_style" option set to ALMOST_STYLE_ABS, the conversions compare the absolute difference with
+    the tolerance, which is faster to run than creating a pytest.approx object, but only works for numbers.
     """
 
     PATTERN = PATTERN_ALMOST_ARGS
@@ -522,26 +843,40 @@ class FixAssertAlmostEq(FixAssertBase):
         assert_not_almost_equal='a != pytest.approx(b, abs=delta)',
     )
 
+    ABS_ARG_PATHS = ((0, 1, 1, 0), (0, 1, 1, 2), 2)
+
+    abs_conversions = dict(
+        assert_almost_equal='abs(a - b) <= delta',
+        assert_not_almost_equal='abs(a - b) > delta',
+    )
+
+    def __init__(self, options, log):
+        if options.get('almost_style') == ALMOST_STYLE_ABS:
+            # before the base class builds the templates from them:
+            self.conversions = self.abs_conversions
+            self.DEFAULT_ARG_PATHS = self.ABS_ARG_PATHS
+        super().__init__(options, log)
+
     @override(FixAssertBase)
-    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}) -> bool:
+    def _transform_dest(self, assert_arg_test_node: PyNode, results: {str: PyNode}, arg_paths) -> bool:
         aaa = results["aaa"].clone()
         bbb = results["bbb"].clone()
 
         # first arg
-        dest1 = self._get_node(assert_arg_test_node, self._arg_paths[0])
-        new_aaa = wrap_parens_for_addsub(aaa)
+        dest1 = self._get_node(assert_arg_test_node, arg_paths[0])
+        new_aaa = wrap_parens_for_addsub(aaa, self.precedence_infos)
         dest1.replace(new_aaa)
         adjust_prefix_first_arg(new_aaa, results["aaa"].prefix)
 
         # second arg
-        dest2 = self._get_node(assert_arg_test_node, self._arg_paths[1])
-        new_bbb = wrap_parens_for_addsub(bbb)
+        dest2 = self._get_node(assert_arg_test_node, arg_paths[1])
+        new_bbb = wrap_parens_for_addsub(bbb, self.precedence_infos)
         if get_prev_sibling(dest2).type in NEWLINE_OK_TOKENS:
             new_bbb.prefix = ''
         dest2.replace(new_bbb)
 
         # third arg (optional)
-        dest3 = self._get_node(assert_arg_test_node, self._arg_paths[2])
+        dest3 = self._get_node(assert_arg_test_node, arg_paths[2])
 
         if "arg3" not in results:
             # then only 2 args so `places` defaults to '7', delta to None and 'msg' to "":
@@ -551,7 +886,7 @@ class FixAssertAlmostEq(FixAssertBase):
         # NOTE: arg3 could be places or delta, or even msg
         arg3 = results["arg3"].clone()
         if "arg4" not in results:
-            if arg3.children[0] == PyLeaf(token.NAME, 'msg'):
+            if self._get_keyword(arg3) == 'msg':
                 self._fix_results_err_msg_arg(results, arg3)
                 self._use_places_default(dest3)
                 return True
@@ -565,7 +900,7 @@ class FixAssertAlmostEq(FixAssertBase):
             return True
 
         # arg3 was not places/delta, try msg:
-        if arg3.children[0] == PyLeaf(token.NAME, 'msg'):
+        if self._get_keyword(arg3) == 'msg':
             self._fix_results_err_msg_arg(results, arg3)
             delta_or_places = results["arg4"].clone()
             return self._process_if_arg_is_places_or_delta(delta_or_places, dest3)
@@ -574,8 +909,16 @@ class FixAssertAlmostEq(FixAssertBase):
             # if arg4 name is not msg, no match:
             return False
 
+    @staticmethod
+    def _get_keyword(arg: PyNode or PyLeaf) -> str or None:
+        """Get the name of a keyword argument, or None if arg is positional (eg places given without its name)"""
+        if arg.type == ARGUMENT_TYPE and len(arg.children) == 3 and arg.children[1].type == token.EQUAL:
+            return arg.children[0].value
+        return None
+
     def _use_places_default(self, abs_dest: PyNode):
-        places_node = PyLeaf(token.NUMBER, '7', prefix="1e-")
+        # the prefix of the destination is the space before it in the conversion, if any:
+        places_node = PyLeaf(token.NUMBER, '7', prefix=abs_dest.prefix + "1e-")
         abs_dest.replace(places_node)
 
     def _fix_results_err_msg_arg(self, results: {str: PyNode}, err_msg_node: PyNode):
@@ -584,16 +927,17 @@ class FixAssertAlmostEq(FixAssertBase):
         results['msg'] = err_msg_node  # the caller will look for this
 
     def _process_if_arg_is_places_or_delta(self, arg3: PyNode, dest3: PyNode) -> bool:
-        if arg3.children[0] == PyLeaf(token.NAME, 'delta'):
+        keyword = self._get_keyword(arg3)
+        if keyword == 'delta':
             arg3_val = arg3.children[2]
-            arg3_val.prefix = ""
-            wrapped_delta_val = wrap_parens_for_comparison(arg3_val)
+            arg3_val.prefix = dest3.prefix
+            wrapped_delta_val = wrap_parens_for_comparison(arg3_val, self.precedence_infos)
             dest3.replace(wrapped_delta_val)
 
-        elif arg3.children[0] == PyLeaf(token.NAME, 'places'):
+        elif keyword == 'places':
             arg3_val = arg3.children[2]
-            arg3_val.prefix = "1e-"
-            wrapped_places_val = wrap_parens_for_comparison(arg3_val)
+            arg3_val.prefix = dest3.prefix + "1e-"
+            wrapped_places_val = wrap_parens_for_comparison(arg3_val, self.precedence_infos)
             dest3.replace(wrapped_places_val)
 
         else:
@@ -604,10 +948,93 @@ class FixAssertAlmostEq(FixAssertBase):
 
 # ------------ Main portion of script -------------------------------
 
+# the pre-filter reads files smaller than this, and memory-maps larger ones
+MMAP_MIN_FILE_SIZE = 64 * 1024
+
+
+def get_nose_names_regex(nose_func_names: [str]) -> re.Pattern:
+    """
+    Get a compiled regular expression that finds any of the given nose function names in the raw bytes of a
+    Python source file. Longest names are listed first so that eg assert_equals is not matched as assert_equal.
+    """
+    alternatives = sorted(nose_func_names, key=len, reverse=True)
+    return re.compile(rb'\b(?:' + b'|'.join(re.escape(name.encode('ascii')) for name in alternatives) + rb')\b')
+
+
+def file_contains_match(filename: str, regex: re.Pattern) -> bool:
+    """
+    Return True if regex is found in the raw bytes of file, False otherwise. Large files are memory-mapped
+    rather than read. Files that cannot be opened are considered to match, so that the error gets reported by
+    whatever attempts to read them next.
+    """
+    try:
+        with open(filename, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return False
+            if size < MMAP_MIN_FILE_SIZE:
+                return regex.search(file.read()) is not None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return regex.search(data) is not None
+
+    except (OSError, ValueError):
+        return True
+
+
 class NoseConversionRefactoringTool(refactor.MultiprocessRefactoringTool):
-    def __init__(self, verbose: bool = False):
-        flags = dict(print_function=True)
+    def __init__(self, verbose: bool = False, cache_dir: str = None, profiler: Profiler = None,
+                 record_call_sites: bool = False, engine: str = ENGINE_FISSIX, file_finder: FileFinder = None,
+                 diff_stream=None, almost_style: str = ALMOST_STYLE_APPROX, hoist_regexes: bool = False):
+        """
+        :param verbose: log at debug level
+        :param cache_dir: folder of the cache of conversion results; if None, no cache is used
+        :param profiler: if not None, the profiler that will record time spent in each phase of conversion
+        :param record_call_sites: if True, record the nose function call sites of each file, for get_report()
+        :param engine: one of ENGINES; with ENGINE_TOKENIZE, modules in which all nose function calls are simple
+            statements on one line are converted without being parsed by fissix (see TokenEngine); with ENGINE_AST,
+            the nose function calls are found by the ast module and converted statement by statement (see AstEngine)
+        :param file_finder: finds the files to convert in the folders given to refactor(); default: a FileFinder
+            that skips the files ignored by git
+        :param diff_stream: if not None, a text stream to which a unified diff of each file changed is written as
+            soon as the file is converted (even if the file is not written)
+        :param almost_style: one of ALMOST_STYLES; with ALMOST_STYLE_ABS, assert_almost_equal(a, b, delta=d) is
+            converted to "assert abs(a - b) <= d" instead of "assert a == pytest.approx(b, abs=d)"
+        :param hoist_regexes: if True, assert_regex(a, 'pattern') is converted to "assert _RE_1.search(a)", with
+            "_RE_1 = re.compile('pattern')" at the top of the module (and assert_not_regex() likewise); modules
+            with such calls are then converted by fissix, whatever the engine
+        """
+        flags = dict(print_function=True, almost_style=almost_style, hoist_regexes=hoist_regexes)
         super().__init__([], flags)
+        self.engine = engine
+        self.file_finder = FileFinder() if file_finder is None else file_finder
+        self.diff_stream = diff_stream
+        # diffs of the files changed, when converting in a worker process (see _refactor_task()):
+        self.pending_diffs = None
+        # if True, the files found after the first file changed are not converted (see refactor()):
+        self.stop_at_first_change = False
+        # the engines other than fissix are TokenEngine and its subclasses:
+        engine_class = {ENGINE_TOKENIZE: TokenEngine, ENGINE_AST: AstEngine}.get(engine)
+        self.token_engine = None if engine_class is None else engine_class(self)
+        nose_func_names = [name for fixer in chain(self.pre_order, self.post_order) for name in fixer.conversions]
+        self.nose_names_regex = get_nose_names_regex(nose_func_names)
+        # the engines other than fissix convert statement by statement, they cannot add constants to a module:
+        self.whole_module_regex = re.compile(r'\bassert_(not_)?regex\b') if hoist_regexes else None
+        self.num_files_scanned = 0
+        self.num_files_skipped = 0
+        # pairs (filename, reason) of the files not converted because they exceeded the time or memory budget:
+        self.files_over_budget = []
+        self.cache = None if cache_dir is None else ConversionCache(cache_dir, self.get_conversions_salt())
+        self.profiler = profiler
+        # pairs (size, arguments of _refactor_file()) when running with multiple processes, see refactor():
+        self.scheduled_files = None
+        # pairs (filename, call sites) if recording call sites, see _get_call_sites():
+        self.call_sites = [] if record_call_sites else None
+        if profiler is not None:
+            self._install_profiler()
+        if not self.bmi_pre_order and not self.bmi_post_order:
+            # all fixers are dispatched by the bottom matcher; without this, refactor_tree() would still walk
+            # every node of the tree twice looking for fixers that are not bottom-matcher compatible
+            self.bmi_pre_order_heads = self.bmi_post_order_heads = {}
         level = logging.DEBUG if verbose else logging.INFO
         logging.basicConfig(format='%(name)s: %(message)s', level=level)
         logger = logging.getLogger('fissix.main')
@@ -616,13 +1043,488 @@ class NoseConversionRefactoringTool(refactor.MultiprocessRefactoringTool):
         pre_fixers = []
         post_fixers = []
 
-        pre_fixers.extend(FixAssert1Arg.create_all(self.options, self.fixer_log))
-        pre_fixers.extend(FixAssert2Args.create_all(self.options, self.fixer_log))
-        pre_fixers.extend(FixAssertBinOp.create_all(self.options, self.fixer_log))
-        pre_fixers.extend(FixAssertAlmostEq.create_all(self.options, self.fixer_log))
+        pre_fixers.append(FixAssert1Arg(self.options, self.fixer_log))
+        pre_fixers.append(FixAssert2Args(self.options, self.fixer_log))
+        pre_fixers.append(FixAssertBinOp(self.options, self.fixer_log))
+        pre_fixers.append(FixAssertAlmostEq(self.options, self.fixer_log))
 
         return pre_fixers, post_fixers
 
+    @override(refactor.RefactoringTool)
+    def log_error(self, msg, *args, **kwds):
+        """
+        Log the error and record it for summarize(), instead of re-raising it as the base class does (which
+        stops the run, or kills the worker process when running with multiple processes). The arguments are
+        recorded as strings so that the record can be sent from a worker process to the main process.
+        """
+        self.errors.append((msg, tuple(str(arg) for arg in args), kwds))
+        self.logger.error(msg, *args, **kwds)
+
+    @override(refactor.RefactoringTool)
+    def refactor_dir(self, dir_name, write=False, doctests_only=False):
+        """Refactor the .py files found under dir_name by the file finder (see FileFinder.find())"""
+        self.log_debug("Descending into %s", dir_name)
+        for filename in self.file_finder.find(dir_name):
+            self.refactor_file(filename, write, doctests_only)
+
+    @override(refactor.MultiprocessRefactoringTool)
+    def refactor_file(self, filename, write=False, doctests_only=False):
+        """
+        Refactor the file, unless a scan of its raw bytes shows that it contains none of the nose function
+        names that can be converted, in which case parsing it would be a waste of time. When running with
+        multiple processes, this is called in the main process, so skipped files are not sent to the workers.
+        """
+        if self.stop_at_first_change and self.files:
+            return
+
+        self.num_files_scanned += 1
+        if not file_contains_match(filename, self.nose_names_regex):
+            self.num_files_skipped += 1
+            self.log_debug("No nose functions in %s, skipped", filename)
+            return
+
+        if self.scheduled_files is not None:
+            # a worker process will call _refactor_file(), the largest files first
+            try:
+                size = os.path.getsize(filename)
+            except OSError:
+                size = 0
+            self.scheduled_files.append((size, (filename, write, doctests_only)))
+            return
+
+        self._refactor_file(filename, write, doctests_only)
+
+    def get_conversions_salt(self) -> str:
+        """Get a string that identifies the conversions done by this tool, used to key cache entries"""
+        parts = [__version__, repr(sorted(self.options.items())), self.engine]
+        for fixer in chain(self.pre_order, self.post_order):
+            parts.append('{}: {!r}'.format(fixer.__class__.__name__, fixer.conversions))
+        return '\n'.join(parts)
+
+    def _refactor_task(self, task: (str, bool, bool)) -> tuple:
+        """
+        Convert a file in a worker process of a WorkerPool.
+        :param task: arguments of _refactor_file()
+        :return: what was recorded while converting the file, for the main process: the list of files changed,
+            the list of errors, the call sites (or None if not recorded), the diffs (empty if no diff_stream), and
+            the profile (or None)
+        """
+        self.files, self.errors, self.pending_diffs = [], [], []
+        if self.call_sites is not None:
+            self.call_sites = []
+        if self.profiler is not None:
+            self.profiler.reset()
+        self._refactor_file(*task)
+        profile = None if self.profiler is None else self.profiler.as_dict()
+        return self.files, self.errors, self.call_sites, self.pending_diffs, profile
+
+    def _install_profiler(self):
+        """
+        Wrap the functions and methods used during conversion so that they record their calls in the profiler.
+        Only done when profiling, so that conversion is not slowed down otherwise.
+        """
+        profiler = self.profiler
+        this_module = sys.modules[__name__]
+        profiler.wrap_attr(this_module, 'file_contains_match', 'phase', 'pre-filter')
+        for helper_name in ('analyze_precedence', 'contains_newline', 'wrap_parens', 'has_weak_op_for_comparison',
+                            'has_weak_op_for_addsub', 'get_prev_sibling'):
+            profiler.wrap_attr(this_module, helper_name, 'phase')
+
+        profiler.wrap_attr(self, '_refactor_file', 'file', key=lambda filename, *args, **kwargs: filename)
+        profiler.wrap_attr(self, '_read_source', 'phase', 'read')
+        profiler.wrap_attr(self.driver, 'parse_string', 'phase', 'parse')
+        profiler.wrap_attr(self, 'refactor_tree', 'phase')
+        profiler.wrap_attr(self.BM, 'run', 'phase', 'bottom matcher')
+        if self.token_engine is not None:
+            profiler.wrap_attr(self.token_engine, 'convert', 'phase', self.engine + ' engine')
+        profiler.wrap_attr(self, 'write_file', 'phase', 'write')
+        if self.cache is not None:
+            profiler.wrap_attr(self.cache, 'get', 'phase', 'cache get')
+            profiler.wrap_attr(self.cache, 'put', 'phase', 'cache put')
+
+        for fixer in chain(self.pre_order, self.post_order):
+            fixer_name = fixer.__class__.__name__
+            profiler.wrap_attr(fixer, 'match', 'fixer', fixer_name + '.match',
+                               extra=lambda *args: [('phase', 'match')])
+            profiler.wrap_attr(fixer, 'transform', 'fixer', fixer_name + '.transform',
+                               extra=lambda node, results: [('phase', 'transform'),
+                                                            ('nose_function', node.children[0].value)])
+
+    def _refactor_file(self, filename, write=False, doctests_only=False):
+        """
+        Refactor a file as done by RefactoringTool.refactor_file(), but if there is a cache, get the result
+        from it when the file was already converted (with the same nose2pytest version and options), and store
+        the result in it otherwise.
+        """
+        if doctests_only:
+            return refactor.RefactoringTool.refactor_file(self, filename, write, doctests_only)
+
+        data, input, encoding = self._read_source(filename)
+        if input is None:
+            # reading failed, already logged
+            return
+
+        converted, output = self._convert_source(data, input, filename)
+        if not converted:
+            # parse error, already logged
+            return
+
+        if output is None:
+            self.log_debug("No changes in %s", filename)
+        else:
+            self.processed_file(output, filename, input, write=write, encoding=encoding)
+
+    @override(refactor.RefactoringTool)
+    def print_output(self, old_text, new_text, filename, equal):
+        """
+        Write the diff of a file changed to the diff stream, if any. In a worker process, the diff is sent to the
+        main process with the other results of the file, which writes it (see refactor()).
+        """
+        if equal or self.diff_stream is None:
+            return
+        diff = format_diff(old_text, new_text, filename)
+        if self.pending_diffs is None:
+            self._write_diff(diff)
+        else:
+            self.pending_diffs.append(diff)
+
+    def _write_diff(self, diff: str):
+        self.diff_stream.write(diff)
+        self.diff_stream.flush()
+
+    @override(refactor.RefactoringTool)
+    def write_file(self, new_text, filename, old_text, encoding=None):
+        """
+        Write the converted source of a file, unless the file already has exactly this content, so that its
+        modification time does not change. The source is written to a temporary file in the same folder, which
+        then replaces the file (or the target of the file if it is a symbolic link) with the same permissions, so
+        that the file is never left with partial content, even if nose2pytest is interrupted.
+        """
+        new_data = new_text.encode(encoding or 'utf-8')
+        path = os.path.realpath(filename)
+        try:
+            with open(path, 'rb') as file:
+                if file.read() == new_data:
+                    self.log_debug("No changes to %s", filename)
+                    return
+        except OSError:
+            pass
+
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            fd, temp_path = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp',
+                                             dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(new_data)
+                os.chmod(temp_path, mode)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        except OSError as err:
+            self.log_error("Can't write %s: %s", filename, err)
+            return
+
+        self.log_debug("Wrote changes to %s", filename)
+        self.wrote = True
+
+    def refactor_stream(self, input_stream, output_stream, name: str = '<stdin>') -> bool:
+        """
+        Convert the Python source read from a binary input stream, and write the result to a binary output
+        stream, in the same encoding; this is the filter mode used for "nose2pytest -". If the source cannot
+        be converted, it is written unchanged.
+        :param name: name of the source in log messages and in the report
+        :return: True if the source could be converted (even if no change was needed), False otherwise
+        """
+        data = input_stream.read()
+        input, encoding = self._decode_source(data, name)
+        converted = False
+        output = None
+        if input is not None:
+            converted, output = self._convert_source(data, input, name)
+
+        if output is None:
+            output_stream.write(data)
+        else:
+            output_stream.write(output.encode(encoding))
+        output_stream.flush()
+        return converted
+
+    def _convert_source(self, data: bytes, input: str, name: str) -> (bool, str or None):
+        """
+        Convert the source of a file, using the cache if any, and record its call sites if requested.
+        :param data: raw content of the file, used as cache key
+        :param input: decoded content of the file
+        :return: pair (converted, output): converted is False if the source could not be parsed; output is
+            the converted source, or None if no change was needed (or parsing failed)
+        """
+        found = False
+        if self.cache is not None:
+            key = self.cache.get_key(data)
+            found, output, call_sites = self.cache.get(key)
+
+        token_result = None
+        if found:
+            self.log_debug("Using cached result for %s", name)
+        else:
+            if self.token_engine is not None and not (self.whole_module_regex is not None
+                                                      and self.whole_module_regex.search(input)):
+                token_result = self.token_engine.convert(input, name)
+            if token_result is not None:
+                changed, output = token_result
+                output = output if changed else None
+            else:
+                tree = self.refactor_string(input + '\n', name)
+                if tree is None:
+                    # parse error, already logged
+                    return False, None
+                # The [:-1] is to take off the \n we added
+                output = str(tree)[:-1] if tree.was_changed else None
+            if output == input:
+                # eg calls left alone: the fixers changed the tree, but not the source
+                output = None
+            call_sites = self._get_call_sites()
+            if self.cache is not None:
+                self.cache.put(key, output, call_sites)
+
+        if self.call_sites is not None:
+            self.call_sites.append((name, call_sites))
+        return True, output
+
+    def _get_call_sites(self) -> [(int, int, str, str)]:
+        """Get the nose function call sites found by the fixers in the last tree, as sorted tuples
+        (line, column, nose function name, status)"""
+        call_sites = []
+        for fixer in chain(self.pre_order, self.post_order):
+            call_sites.extend((line, column, func_name, status)
+                              for (line, column), (func_name, status) in fixer.call_sites.items())
+        return sorted(call_sites)
+
+    def get_report(self) -> dict:
+        """
+        Get statistics about the conversion of the files refactored so far, for the --report option: per nose
+        function, the number of call sites converted or left alone, and for each file, its call sites. Requires
+        the tool to have been created with record_call_sites=True.
+        """
+        functions = {}
+        totals = dict.fromkeys(CALL_STATUSES, 0)
+        files = {}
+        for filename, call_sites in sorted(self.call_sites):
+            files[filename] = [dict(line=line, column=column, function=func_name, status=status)
+                               for line, column, func_name, status in call_sites]
+            for _, _, func_name, status in call_sites:
+                functions.setdefault(func_name, dict.fromkeys(CALL_STATUSES, 0))[status] += 1
+                totals[status] += 1
+
+        return dict(
+            nose2pytest_version=__version__,
+            num_files_scanned=self.num_files_scanned,
+            num_files_skipped=self.num_files_skipped,
+            files_over_budget=dict(self.files_over_budget),
+            files_changed=sorted(self.files),
+            errors=[msg % args for msg, args, _ in self.errors],
+            totals=totals,
+            functions=dict(sorted(functions.items())),
+            call_sites=files,
+        )
+
+    def _read_source(self, filename) -> (bytes, str, str):
+        """
+        Read a Python source file, decoding it the same way as RefactoringTool._read_python_source().
+        :return: triplet (raw content, decoded content, encoding); the last two are None if reading failed
+        """
+        try:
+            with open(filename, 'rb') as file:
+                data = file.read()
+        except OSError as err:
+            self.log_error("Can't read %s: %s", filename, err)
+            return None, None, None
+
+        input, encoding = self._decode_source(data, filename)
+        return data, input, encoding
+
+    def _decode_source(self, data: bytes, name: str) -> (str, str):
+        """
+        Decode the raw content of a Python source file.
+        :return: pair (decoded content, encoding); both are None if decoding failed
+        """
+        try:
+            encoding = tokenize.detect_encoding(io.BytesIO(data).readline)[0]
+            with io.TextIOWrapper(io.BytesIO(data), encoding=encoding, newline='') as text_file:
+                return text_file.read(), encoding
+
+        except (SyntaxError, UnicodeDecodeError) as err:
+            self.log_error("Can't read %s: %s", name, err)
+            return None, None
+
+    @override(refactor.RefactoringTool)
+    def summarize(self):
+        super().summarize()
+        self.log_message("Skipped %d of %d files that contain no nose function to convert.",
+                         self.num_files_skipped, self.num_files_scanned)
+        if self.files_over_budget:
+            self.log_message("Skipped %d files that exceeded the time or memory budget:", len(self.files_over_budget))
+            for filename, reason in self.files_over_budget:
+                self.log_message("    %s (%s)", filename, reason)
+
+    @override(refactor.MultiprocessRefactoringTool)
+    def refactor(self, items, write=False, doctests_only=False, num_processes=1, max_tasks_per_child=None,
+                 max_worker_rss_mb=None, file_timeout=None, max_file_rss_mb=None, fail_fast=False):
+        """
+        Same as base class, but when num_processes > 1, or files have a time or memory budget, the files to convert
+        are first collected, then converted by a WorkerPool, largest first; the files processed, the errors logged,
+        the call sites recorded and the diffs made by the worker processes are sent back as each file is done, so
+        that summarize() and get_report() report them, and the diffs are written right away. The files, errors and
+        call sites are sorted so the summary does not depend on which worker finished first.
+        :param max_tasks_per_child: if not None, each worker process is replaced after converting this many files
+        :param max_worker_rss_mb: if not None, a worker process is replaced after a file that leaves its resident
+            set size above this many MB
+        :param file_timeout: if not None, the conversion of a file that takes more than this many seconds is
+            killed, and the file is recorded in files_over_budget
+        :param max_file_rss_mb: if not None, the conversion of a file during which the resident set size of the
+            worker process goes over this many MB is killed, and the file is recorded in files_over_budget
+        :param fail_fast: if True, stop as soon as a file is changed (eg to only check whether some files would be
+            changed); the files not converted yet are skipped, and with several processes, the other files being
+            converted are dropped
+        """
+        if num_processes == 1 and file_timeout is None and max_file_rss_mb is None:
+            self.stop_at_first_change = fail_fast
+            try:
+                super().refactor(items, write, doctests_only)
+            finally:
+                self.stop_at_first_change = False
+
+        else:
+            self.scheduled_files = []
+            try:
+                refactor.RefactoringTool.refactor(self, items, write, doctests_only)
+                scheduled_files = self.scheduled_files
+            finally:
+                self.scheduled_files = None
+
+            files, errors, call_sites, files_over_budget = [], [], [], []
+            pool = WorkerPool(self._refactor_task, num_processes, max_tasks_per_child, max_worker_rss_mb,
+                              file_timeout, max_file_rss_mb)
+            # closing the results stops the workers if the loop stops early:
+            with closing(pool.run(scheduled_files)) as results:
+                for (filename, _, _), result, failure in results:
+                    if failure is not None and failure.over_budget:
+                        self.logger.warning("Skipped %s: %s", filename, failure.message)
+                        files_over_budget.append((filename, failure.message))
+                        continue
+                    if failure is not None:
+                        self.logger.error("Can't convert %s: %s", filename, failure.message)
+                        errors.append(("Can't convert %s: %s", (filename, failure.message), {}))
+                        continue
+                    task_files, task_errors, task_call_sites, task_diffs, profile = result
+                    files.extend(task_files)
+                    errors.extend(task_errors)
+                    if task_call_sites is not None:
+                        call_sites.extend(task_call_sites)
+                    for diff in task_diffs:
+                        self._write_diff(diff)
+                    if profile is not None:
+                        self.profiler.merge(profile)
+                    if fail_fast and files:
+                        break
+
+            self.files.extend(sorted(files))
+            self.errors.extend(sorted(errors, key=str))
+            self.files_over_budget.extend(sorted(files_over_budget))
+            if self.call_sites is not None:
+                self.call_sites.extend(sorted(call_sites))
+            if write and files:
+                self.wrote = True
+
+        if self.cache is not None:
+            self.cache.evict()
+
+
+def format_diff(old_text: str, new_text: str, filename: str) -> str:
+    """Get the unified diff of the change of a file, in the format understood by patch"""
+    diff_lines = []
+    for line in difflib.unified_diff(old_text.splitlines(keepends=True), new_text.splitlines(keepends=True),
+                                     filename, filename):
+        diff_lines.append(line)
+        if not line.endswith('\n'):
+            diff_lines.append('\n\\ No newline at end of file\n')
+    return ''.join(diff_lines)
+
+
+def get_git_changed_files(dir_name: str, since: str = None, staged: bool = False,
+                          file_finder: FileFinder = None) -> [str]:
+    """
+    Get the .py files under dir_name that git reports as changed, so that only those get converted.
+    :param since: a git ref; the files changed between the merge base of that ref and HEAD, and the working tree,
+        and the untracked files that are not ignored (eg a new test file not added yet)
+    :param staged: if True, the files staged for commit (since is then ignored)
+    :param file_finder: if given, only the files selected by its include and exclude patterns, relative to dir_name
+    :return: paths of the files, sorted (files deleted by the changes are not included)
+    :raise RuntimeError: if git fails, for instance if dir_name is not in a git repository
+    """
+    def run_git(*git_args) -> str:
+        try:
+            result = subprocess.run(['git', '-C', dir_name] + list(git_args),
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        except OSError as exc:
+            raise RuntimeError('could not run git: {}'.format(exc))
+        if result.returncode != 0:
+            raise RuntimeError('git {} failed: {}'.format(' '.join(git_args), result.stderr.strip()))
+        return result.stdout
+
+    # outside of a repository, git diff would compare files instead of reporting an error:
+    run_git('rev-parse', '--git-dir')
+
+    diff_args = ['diff', '--name-only', '-z', '--relative', '--diff-filter=ACMR']
+    if staged:
+        diff_args.append('--cached')
+    else:
+        merge_base = run_git('merge-base', since, 'HEAD').strip()
+        diff_args.append(merge_base)
+
+    paths = set(run_git(*diff_args).split('\0'))
+    if not staged:
+        paths.update(run_git('ls-files', '--others', '--exclude-standard', '-z').split('\0'))
+    return sorted(os.path.normpath(os.path.join(dir_name, path)) for path in paths
+                  if path.endswith('.py') and (file_finder is None or file_finder.is_selected(path)))
+
+
+def parse_jobs(value: str) -> int:
+    """Convert the value of the --jobs option to a number of processes; "auto" means one per CPU."""
+    if value == 'auto':
+        return os.cpu_count() or 1
+
+    try:
+        num_processes = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('must be a positive integer or "auto", not "{}"'.format(value))
+    if num_processes < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer or "auto", not "{}"'.format(value))
+    return num_processes
+
+
+def parse_positive_int(value: str) -> int:
+    """Convert the value of an option that must be a positive integer"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer, not "{}"'.format(value))
+    return number
+
+
+def parse_positive_float(value: str) -> float:
+    """Convert the value of an option that must be a positive number"""
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0.0
+    if not number > 0:
+        raise argparse.ArgumentTypeError('must be a positive number, not "{}"'.format(value))
+    return number
+
 
 def setup():
     # from nose import tools as nosetools
@@ -633,26 +1535,187 @@ def setup():
     #         print(key, argspec)
 
     parser = argparse.ArgumentParser(description='Convert nose assertions to regular assertions for use by pytest')
-    parser.add_argument('dir_name', type=str,
-                        help='folder name from which to start; all .py files under it will be converted')
+    parser.add_argument('paths', type=str, nargs='*', metavar='PATH',
+                        help='files to convert, or folders from which to start; all .py files under them will be '
+                             'converted. Use "-" alone to convert the source read from stdin and write the result '
+                             'to stdout. With --since or --staged, a single folder (default: current folder)')
+    parser.add_argument('-0', '--null', dest='null', action='store_true',
+                        help='read the paths to convert from stdin, separated by NUL characters (as output by '
+                             '"find -print0" or "git ls-files -z"), instead of the command line')
     parser.add_argument('-w', dest='write', action='store_false',
                         help='disable overwriting of original files')
+    parser.add_argument('--check', dest='check', action='store_true',
+                        help='do not write files; exit with status 1 if some files would be changed, and list them '
+                             'on stderr (the status is also 1 whenever some files cannot be read, parsed or '
+                             'converted within their budget)')
+    parser.add_argument('--fail-fast', dest='fail_fast', action='store_true',
+                        help='with --check, stop at the first file that would be changed')
+    parser.add_argument('--diff', dest='diff', action='store_true',
+                        help='do not write files; print a unified diff of each file that would be changed, as soon '
+                             'as it is converted')
+    parser.add_argument('--include', dest='include', metavar='PATTERN', action='append', default=[],
+                        help='in folders (and with --since or --staged), only convert the .py files that match '
+                             'PATTERN or are under a folder that matches it (syntax of .gitignore patterns, relative '
+                             'to the folder); can be repeated')
+    parser.add_argument('--exclude', dest='exclude', metavar='PATTERN', action='append', default=[],
+                        help='in folders (and with --since or --staged), skip the files and folders that match '
+                             'PATTERN (syntax of .gitignore patterns, relative to the folder); can be repeated')
+    parser.add_argument('--no-gitignore', dest='use_gitignore', action='store_false',
+                        help='in folders, do not skip the files and folders ignored by the .gitignore files')
+    parser.add_argument('--list-files', dest='list_files', action='store_true',
+                        help='only print the .py files that would be considered for conversion, and exit')
     parser.add_argument('-v', dest='verbose', action='store_true',
                         help='verbose output (list files changed, etc)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=parse_jobs, default=1,
+                        help='number of processes to use, or "auto" for one per CPU (default: 1)')
+    parser.add_argument('--max-tasks-per-child', dest='max_tasks_per_child', metavar='N', type=parse_positive_int,
+                        default=100, help='with -j, replace each worker process after it has converted N files '
+                                          '(default: %(default)s)')
+    parser.add_argument('--max-worker-rss', dest='max_worker_rss_mb', metavar='MB', type=parse_positive_int,
+                        help='with -j, replace a worker process as soon as its resident set size is above MB '
+                             'megabytes after converting a file')
+    parser.add_argument('--file-timeout', dest='file_timeout', metavar='SECONDS', type=parse_positive_float,
+                        help='stop converting a file that takes more than SECONDS seconds, and report it as '
+                             'skipped; the other files are still converted (uses a worker process even without -j)')
+    parser.add_argument('--max-file-rss', dest='max_file_rss_mb', metavar='MB', type=parse_positive_int,
+                        help='stop converting a file if the memory used by its worker process goes over MB '
+                             'megabytes, and report it as skipped (Linux only; uses a worker process even '
+                             'without -j)')
+    git_group = parser.add_mutually_exclusive_group()
+    git_group.add_argument('--since', dest='since', metavar='REF',
+                           help='only convert the .py files that git reports as changed since the merge base of '
+                                'REF and HEAD (including uncommitted changes and untracked files)')
+    git_group.add_argument('--staged', dest='staged', action='store_true',
+                           help='only convert the .py files that are staged for commit in git')
+    parser.add_argument('--engine', dest='engine', choices=ENGINES, default=ENGINE_FISSIX,
+                        help='"tokenize" converts files in which all nose function calls are simple statements on '
+                             'one line without parsing them with fissix, which is faster, with the same result; '
+                             '"ast" finds nose function calls with the ast module and converts them statement by '
+                             'statement, which is faster still, and supports newer syntax (default: %(default)s)')
+    parser.add_argument('--almost-style', dest='almost_style', choices=ALMOST_STYLES, default=ALMOST_STYLE_APPROX,
+                        help='how to convert assert_almost_equal(a, b, ...) and assert_not_almost_equal(): "approx" '
+                             'gives "a == pytest.approx(b, abs=delta)"; "abs" gives "abs(a - b) <= delta", which '
+                             'runs faster but only works for numbers (not for sequences, nor for infinities) '
+                             '(default: %(default)s)')
+    parser.add_argument('--hoist-regexes', dest='hoist_regexes', action='store_true',
+                        help='convert assert_regex(a, \'pattern\') to "assert _RE_1.search(a)", and define '
+                             '"_RE_1 = re.compile(\'pattern\')" at the top of the module (with "import re" if needed), '
+                             'so the pattern is compiled once; same for assert_not_regex(). Only for patterns that '
+                             'are string literals')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                        help='do not use the cache of conversion results')
+    parser.add_argument('--clear-cache', dest='clear_cache', action='store_true',
+                        help='remove all entries from the cache of conversion results before converting')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=DEFAULT_CACHE_DIR,
+                        help='folder of the cache of conversion results (default: %(default)s)')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='record the time spent in each phase of conversion, per fixer, per nose function and '
+                             'per file; print a summary, and save the details (see --profile-output)')
+    parser.add_argument('--profile-output', dest='profile_output', metavar='JSON_FILE',
+                        help='with --profile, save the details in JSON_FILE (default: {}); implies --profile'
+                        .format(DEFAULT_PROFILE_OUTPUT))
+    parser.add_argument('--report', dest='report', metavar='JSON_FILE',
+                        help='save in JSON_FILE the number of call sites of each nose function converted or left '
+                             'alone, and the line of each call site in each file')
     parser.add_argument('--version', action='version',
                         version='%(prog)s {0}'.format(__version__))
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if '-' in args.paths and (len(args.paths) > 1 or args.null or args.since or args.staged or args.list_files
+                              or args.check or args.diff):
+        parser.error('"-" cannot be combined with other paths, --null, --since, --staged, --list-files, --check '
+                     'or --diff')
+    if args.fail_fast and not args.check:
+        parser.error('--fail-fast requires --check')
+    if args.since or args.staged:
+        if args.null or len(args.paths) > 1:
+            parser.error('--since and --staged take a single folder, and cannot be combined with --null')
+        args.paths = args.paths or ['.']
+    elif args.null:
+        if args.paths:
+            parser.error('paths cannot be given on the command line with --null')
+    elif not args.paths:
+        parser.error('the following arguments are required: PATH')
+
+    return args
+
+
+def read_null_separated_paths(stream) -> [str]:
+    """
+    Get the paths listed in a binary stream, separated by NUL characters; empty paths are ignored. The paths are
+    decoded as the OS does (see os.fsdecode()), so that any path can be given, whatever its encoding.
+    """
+    return [os.fsdecode(path) for path in stream.read().split(b'\0') if path]
 
 
 def main():
     args = setup()
-    if not Path(args.dir_name).exists():
-        print('ERROR: Path "%s" does not exist' % args.dir_name, file=sys.stderr)
+    filter_mode = args.paths == ['-']
+    if args.null:
+        args.paths = read_null_separated_paths(sys.stdin.buffer)
+    for path in ([] if filter_mode else args.paths):
+        if not Path(path).exists():
+            print('ERROR: Path "%s" does not exist' % path, file=sys.stderr)
+            sys.exit(1)
+
+    items = args.paths
+    file_finder = FileFinder(args.include, args.exclude, args.use_gitignore)
+    if args.since or args.staged:
+        try:
+            items = get_git_changed_files(items[0], since=args.since, staged=args.staged, file_finder=file_finder)
+        except RuntimeError as exc:
+            print('ERROR: {}'.format(exc), file=sys.stderr)
+            sys.exit(1)
+
+    if args.list_files:
+        for item in items:
+            for path in (file_finder.find(item) if os.path.isdir(item) else [item]):
+                print(path)
+        return
+
+    profiler = Profiler() if args.profile or args.profile_output else None
+    refac = NoseConversionRefactoringTool(args.verbose, cache_dir=args.cache_dir if args.use_cache else None,
+                                          profiler=profiler, record_call_sites=bool(args.report),
+                                          engine=args.engine, file_finder=file_finder,
+                                          diff_stream=sys.stdout if args.diff else None,
+                                          almost_style=args.almost_style, hoist_regexes=args.hoist_regexes)
+    if args.clear_cache:
+        ConversionCache(args.cache_dir, salt='').clear()
+
+    converted = True
+    if filter_mode:
+        # stdout only gets the converted source, log messages go to stderr
+        converted = refac.refactor_stream(sys.stdin.buffer, sys.stdout.buffer)
+
+    else:
+        write = args.write and not (args.check or args.diff)
+        refac.refactor(items, write=write, num_processes=args.jobs, max_tasks_per_child=args.max_tasks_per_child,
+                       max_worker_rss_mb=args.max_worker_rss_mb, file_timeout=args.file_timeout,
+                       max_file_rss_mb=args.max_file_rss_mb, fail_fast=args.fail_fast)
+
+    if args.verbose:
+        refac.summarize()
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(refac.get_report(), report_file, indent=2)
+
+    if profiler is not None:
+        profiler.restore()
+        print(profiler.format_summary(), file=sys.stderr)
+        profiler.save(args.profile_output or DEFAULT_PROFILE_OUTPUT)
+
+    if not converted:
         sys.exit(1)
 
-    refac = NoseConversionRefactoringTool(args.verbose)
-    refac.refactor_dir(args.dir_name, write=args.write)
+    if args.check:
+        for filename in refac.files:
+            print('Would convert {}'.format(filename), file=sys.stderr)
+    for filename, reason in refac.files_over_budget:
+        print('Could not convert {} ({})'.format(filename, reason), file=sys.stderr)
+    # the errors were logged as they happened; files left unconverted must fail a --check in continuous integration:
+    if (args.check and refac.files) or refac.errors or refac.files_over_budget:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
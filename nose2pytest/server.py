@@ -0,0 +1,272 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides a long-lived conversion server and its client, so that tools that convert a few files at a
+time (eg pre-commit hooks, editors) do not pay for the startup of nose2pytest at each invocation: importing
+fissix, loading the grammar, creating the fixers and compiling their patterns and destination trees. The server
+does this once, then listens on a Unix socket. Each connection is handled by a process forked from the server,
+so requests are handled concurrently, they all start with the warm conversion tool, and a request cannot affect
+the next ones.
+
+The protocol is one JSON object per line: the client sends a request and the server sends back a response.
+Requests are either dict(command='convert_files', paths=[...], write=bool) or dict(command='convert_source',
+source=base64 of the raw source). The client does not import fissix, so it starts quickly.
+
+Usage:
+
+    nose2pytest-server serve [--socket PATH] [--no-cache] [--cache-dir DIR]
+    nose2pytest-server convert [--socket PATH] [-w] PATH [PATH ...]
+    nose2pytest-server convert [--socket PATH] - < source.py > converted.py
+"""
+
+import io
+import os
+import sys
+import json
+import stat
+import base64
+import signal
+import socket
+import argparse
+import tempfile
+import socketserver
+
+
+# the server forks a process per connection and listens on a Unix socket, which not all platforms support (eg Windows)
+SERVER_SUPPORTED = hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')
+
+
+def get_default_socket_path() -> str:
+    """
+    Get the default path of the server's socket: one per user, in a folder of the user (see check_socket_folder()),
+    in the runtime folder if there is one
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime_dir, 'nose2pytest-{}'.format(os.getuid()), 'server.sock')
+
+
+def check_socket_folder(socket_path: str, create: bool = False):
+    """
+    Check that the folder of a socket is owned by the current user and that other users cannot write to it, so that
+    they cannot create, replace or remove the socket (eg to receive the sources sent by the client).
+    :param create: if True, create the folder, accessible only by the current user, if it does not exist
+    :raise PermissionError: if the folder is not safe
+    :raise OSError: if the folder cannot be created or does not exist
+    """
+    folder = os.path.dirname(os.path.abspath(socket_path))
+    if create and not os.path.lexists(folder):
+        os.mkdir(folder, 0o700)
+    info = os.lstat(folder)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError('"{}" must be a folder owned by the current user, that other users cannot write to'
+                              .format(folder))
+
+
+def remove_stale_socket(socket_path: str):
+    """
+    Remove a socket left over by a server that was killed.
+    :raise PermissionError: if the path is not a socket owned by the current user
+    """
+    info = os.lstat(socket_path)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError('"{}" is not a socket owned by the current user'.format(socket_path))
+    os.remove(socket_path)
+
+
+class ConversionRequestHandler(socketserver.StreamRequestHandler):
+    """Handles the requests of one connection, in a process forked from the server"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = self.server.handle_request_data(request)
+            except Exception as exc:
+                response = dict(ok=False, error='{}: {}'.format(exc.__class__.__name__, exc))
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+if SERVER_SUPPORTED:
+    _SERVER_BASES = (socketserver.ForkingMixIn, socketserver.UnixStreamServer)
+else:
+    # the class can be defined, but not used: main() reports that the server is not supported
+    _SERVER_BASES = (socketserver.BaseServer,)
+
+
+class ConversionServer(*_SERVER_BASES):
+    """Unix socket server that converts files or source with a NoseConversionRefactoringTool created once"""
+
+    def __init__(self, socket_path: str, cache_dir: str = None):
+        """
+        :param socket_path: path of the Unix socket to listen on; it must not exist
+        :param cache_dir: folder of the cache of conversion results; if None, no cache is used
+        """
+        from nose2pytest.script import NoseConversionRefactoringTool
+        self.refac = NoseConversionRefactoringTool(cache_dir=cache_dir)
+        super().__init__(socket_path, ConversionRequestHandler)
+
+    def handle_request_data(self, request: dict) -> dict:
+        """Get the response to a request decoded from JSON"""
+        command = request.get('command')
+        refac = self.refac
+        # the results of the previous request of this connection must not be reported again
+        refac.files, refac.errors = [], []
+        if command == 'convert_files':
+            refac.refactor(request['paths'], write=request.get('write', True))
+            return dict(ok=True, files_changed=sorted(refac.files),
+                        errors=[msg % args for msg, args, _ in refac.errors])
+
+        if command == 'convert_source':
+            output = io.BytesIO()
+            converted = refac.refactor_stream(io.BytesIO(base64.b64decode(request['source'])), output,
+                                              request.get('name', '<stdin>'))
+            return dict(ok=True, converted=converted, output=base64.b64encode(output.getvalue()).decode('ascii'),
+                        errors=[msg % args for msg, args, _ in refac.errors])
+
+        return dict(ok=False, error='unknown command: {}'.format(command))
+
+    def serve(self):
+        """Handle requests until the process is interrupted or terminated, then remove the socket"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server_close()
+            os.remove(self.server_address)
+
+
+class ConversionClient:
+    """Client of a ConversionServer; several requests can be sent over the same connection"""
+
+    def __init__(self, socket_path: str = None):
+        """
+        :param socket_path: path of the server's socket (default: see get_default_socket_path())
+        :raise OSError: if the server cannot be reached, or its socket is not in a safe folder
+        """
+        socket_path = socket_path or get_default_socket_path()
+        check_socket_folder(socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._file = self._socket.makefile('rwb')
+
+    def convert_files(self, paths: [str], write: bool = True) -> dict:
+        """
+        Convert the given files, and folders of files, in the server.
+        :return: the response, with list of files changed and list of error messages
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        return self._send(dict(command='convert_files', paths=paths, write=write))
+
+    def convert_source(self, source: bytes, name: str = '<stdin>') -> (bool, bytes):
+        """
+        Convert Python source in the server (see NoseConversionRefactoringTool.refactor_stream()).
+        :return: pair (whether the source could be converted, converted source)
+        """
+        response = self._send(dict(command='convert_source', source=base64.b64encode(source).decode('ascii'),
+                                   name=name))
+        return response['converted'], base64.b64decode(response['output'])
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send(self, request: dict) -> dict:
+        self._file.write(json.dumps(request).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('connection closed by the nose2pytest server')
+        response = json.loads(line.decode('utf-8'))
+        if not response['ok']:
+            raise RuntimeError('nose2pytest server error: {}'.format(response['error']))
+        return response
+
+
+def serve(args: argparse.Namespace):
+    try:
+        check_socket_folder(args.socket, create=True)
+        if os.path.lexists(args.socket):
+            try:
+                ConversionClient(args.socket).close()
+            except OSError:
+                remove_stale_socket(args.socket)
+            else:
+                print('ERROR: a server is already listening on "{}"'.format(args.socket), file=sys.stderr)
+                sys.exit(1)
+    except OSError as exc:
+        print('ERROR: cannot listen on "{}": {}'.format(args.socket, exc), file=sys.stderr)
+        sys.exit(1)
+
+    server = ConversionServer(args.socket, cache_dir=args.cache_dir if args.use_cache else None)
+    print('nose2pytest server listening on {}'.format(args.socket), file=sys.stderr)
+    server.serve()
+
+
+def convert(args: argparse.Namespace):
+    try:
+        client = ConversionClient(args.socket)
+    except OSError as exc:
+        print('ERROR: cannot connect to nose2pytest server on "{}": {}'.format(args.socket, exc), file=sys.stderr)
+        sys.exit(1)
+
+    with client:
+        if args.paths == ['-']:
+            converted, output = client.convert_source(sys.stdin.buffer.read())
+            sys.stdout.buffer.write(output)
+            sys.exit(0 if converted else 1)
+
+        response = client.convert_files(args.paths, write=args.write)
+
+    for path in response['files_changed']:
+        print(path)
+    for error in response['errors']:
+        print('ERROR: {}'.format(error), file=sys.stderr)
+    if response['errors']:
+        sys.exit(1)
+
+
+def main():
+    from nose2pytest.cache import DEFAULT_CACHE_DIR
+
+    if not SERVER_SUPPORTED:
+        print('ERROR: nose2pytest-server needs fork() and Unix sockets, which this platform does not support',
+              file=sys.stderr)
+        sys.exit(1)
+
+    parser = argparse.ArgumentParser(description='Server that keeps nose2pytest loaded, and its client')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    serve_parser = subparsers.add_parser('serve', help='run the server until interrupted')
+    serve_parser.add_argument('--no-cache', dest='use_cache', action='store_false',
+                              help='do not use the cache of conversion results')
+    serve_parser.add_argument('--cache-dir', dest='cache_dir', default=os.path.abspath(DEFAULT_CACHE_DIR),
+                              help='folder of the cache of conversion results (default: %(default)s)')
+    serve_parser.set_defaults(func=serve)
+
+    convert_parser = subparsers.add_parser('convert', help='convert files, or stdin to stdout, with the server')
+    convert_parser.add_argument('paths', nargs='+', metavar='PATH',
+                                help='files or folders to convert, or "-" to convert stdin to stdout')
+    convert_parser.add_argument('-w', dest='write', action='store_false',
+                                help='disable overwriting of original files')
+    convert_parser.set_defaults(func=convert)
+
+    for subparser in (serve_parser, convert_parser):
+        subparser.add_argument('--socket', default=get_default_socket_path(),
+                               help='path of the Unix socket of the server (default: %(default)s)')
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
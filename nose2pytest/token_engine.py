@@ -0,0 +1,382 @@
+"""
+This module is part of the nose2pytest distribution. BSD 3-Clause license (see LICENSE.txt).
+
+This module provides the "tokenize" conversion engine: a fast path that converts the nose function calls of a
+module without parsing the whole module with fissix. The module is split into tokens by the standard library's
+tokenize module, and each statement that starts with a call to a nose function is converted on its own:
+
+- if the call is simple and on one line (eg "assert_equal(x, 3)"), it is given to its fixer as a small tree built
+  from the tokens of the call;
+- otherwise (eg arguments over several lines, keyword arguments, operators), the statement alone is parsed and
+  converted by fissix.
+
+The text of the converted statement replaces the statement in the source. As the fixers do the conversion, the
+result is the same as when the whole module is parsed by fissix. A call is simple when its arguments are
+positional, and each is an atom (name, number, strings, or anything in brackets) followed by attributes, calls or
+subscripts: such arguments never need parentheses, whatever the conversion. A call whose arguments have calls to
+nose functions is not simple, since fissix converts these calls too.
+
+If a module has a call to a nose function that does not start a statement (eg "x = ok_(a)" or "if a: ok_(b)"), or
+cannot be tokenized or compiled, TokenEngine.convert() returns None and the caller converts it with fissix.
+"""
+
+import io
+import re
+import ast
+import keyword
+import tokenize
+
+from fissix import pygram
+from fissix.pytree import Node as PyNode, Leaf as PyLeaf
+from fissix.pgen2 import token
+
+
+_syms = pygram.python_grammar.symbol2number
+
+# tokens that are not part of a logical line
+_NON_LOGICAL_TOKENS = (tokenize.NL, tokenize.COMMENT)
+# tokens after which a new logical line starts
+_LOGICAL_LINE_START_TOKENS = (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT)
+_OPENING_BRACKETS = {'(': ')', '[': ']', '{': '}'}
+# keywords that are atoms
+_CONSTANTS = ('True', 'False', 'None')
+# put before a statement parsed on its own that cannot be parsed outside of an async function; the lines after the
+# first one of a statement are continuation lines, so they do not need to be indented:
+_ASYNC_FUNCTION_HEADER = 'async def _():\n '
+
+
+class TokenEngine:
+    """Converts the statements of a module that start with nose function calls, using the fixers of a tool"""
+
+    def __init__(self, refac):
+        """
+        :param refac: the NoseConversionRefactoringTool whose fixers convert the calls, and whose driver parses
+            the statements that are not simple calls
+        """
+        self.refac = refac
+        self.fixers = refac.pre_order + refac.post_order
+        # nose function name -> fixer that converts it
+        self.fixers_by_name = {name: fixer for fixer in self.fixers for name in fixer.conversions}
+        # number of statements converted from their tokens, and number parsed by fissix:
+        self.num_simple_calls = 0
+        self.num_parsed_statements = 0
+
+    def convert(self, source: str, name: str) -> (bool, str) or None:
+        """
+        Convert the nose function calls of a module, if they all start statements.
+        :param source: source of the module
+        :param name: name of the module, for log messages
+        :return: None if the module must be converted by fissix; otherwise, pair (changed, output) where output
+            is the converted source
+        """
+        try:
+            tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+        except (tokenize.TokenError, SyntaxError):
+            return None
+
+        statements = self._find_statements(tokens)
+        if statements is None:
+            return None
+
+        if statements:
+            # fissix would refuse to convert a module that has syntax errors (the tokenizer does not find all):
+            try:
+                compile(source, name, 'exec', ast.PyCF_ONLY_AST, dont_inherit=True)
+            except (SyntaxError, ValueError):
+                return None
+
+        line_offsets = get_line_offsets(source)
+
+        def get_offset(position: (int, int)) -> int:
+            row, col = position
+            return line_offsets[row - 1] + col
+
+        converted_statements = []
+        for statement_tokens, args in statements:
+            start, end = get_offset(statement_tokens[0].start), get_offset(statement_tokens[-1].end)
+            converted_statements.append((statement_tokens[0].start, start, end, source[start:end],
+                                         statement_tokens[0].string, statement_tokens, args))
+        return self._convert_statements(source, name, converted_statements)
+
+    def _convert_statements(self, source: str, name: str, statements: list) -> (bool, str) or None:
+        """
+        Convert the statements of a module that start with a nose function call, and replace them in the source.
+        :param statements: list of tuples (position, start, end, text, nose function name, tokens, args) in the
+            order of the module, where start and end are the offsets in the source of the text replaced by the
+            converted statement, text is the statement to convert and position is its (row, column), and args
+            is None if the statement must be parsed by fissix, otherwise the arguments of the call as returned
+            by _get_simple_call_args() from the tokens of the statement
+        :return: as for convert()
+        """
+        for fixer in self.fixers:
+            fixer.set_filename(name)
+            fixer.call_sites = {}
+
+        edits = []
+        call_sites = {}
+        for position, start, end, text, func_name, statement_tokens, args in statements:
+            if args is None:
+                new_text = self._convert_statement(text, position, name, call_sites)
+                if new_text is None:
+                    if not self._leave_unparsable_statement(position, func_name, call_sites):
+                        return None
+                    continue
+                self.num_parsed_statements += 1
+            else:
+                fixer = self.fixers_by_name[func_name]
+                new_text = self._convert_simple_call(fixer, statement_tokens, args)
+                self.num_simple_calls += 1
+                call_sites.setdefault(fixer, {}).update(fixer.call_sites)
+                fixer.call_sites.clear()
+            if new_text is not None and new_text != text:
+                edits.append((start, end, new_text))
+
+        # fissix resets the call sites of the fixers for each statement it parses, so they are collected by
+        # statement, then given back to the fixers for the whole module:
+        for fixer in self.fixers:
+            fixer.call_sites = call_sites.get(fixer, {})
+
+        if not edits:
+            return False, source
+
+        parts = []
+        pos = 0
+        for start, end, text in edits:
+            parts.append(source[pos:start])
+            parts.append(text)
+            pos = end
+        parts.append(source[pos:])
+        return True, ''.join(parts)
+
+    def _leave_unparsable_statement(self, position: (int, int), func_name: str, call_sites: dict) -> bool:
+        """
+        Called when a statement cannot be parsed by fissix on its own.
+        :return: True to leave the statement as is and go on with the module, False to have the whole module
+            converted by fissix
+        """
+        return False
+
+    def _find_statements(self, tokens: [tokenize.TokenInfo]) -> [([tokenize.TokenInfo], list or None)] or None:
+        """
+        Find the statements that start with a call to a nose function that fissix would convert.
+        :return: None if a call to a nose function does not start a statement; otherwise, a list of pairs (tokens
+            of the statement, args) where args is None if the statement is not a simple call, and otherwise the
+            list of tokens of each argument (see _get_simple_call_args())
+        """
+        statements = []
+        at_line_start = True
+        prev_tok = None
+        index = 0
+        while index < len(tokens):
+            tok = tokens[index]
+            index += 1
+            if tok.type in _NON_LOGICAL_TOKENS:
+                continue
+
+            if (tok.type == tokenize.NAME and tok.string in self.fixers_by_name
+                    and tokens[index].string == '('
+                    # methods, and definitions of functions with the same name, are not converted by fissix:
+                    and not (prev_tok is not None and prev_tok.string in ('.', 'def', 'class'))):
+                if not at_line_start:
+                    return None
+
+                # the statement ends before the NEWLINE token, or before the comment at the end of its last line
+                end_index = index
+                while tokens[end_index].type != tokenize.NEWLINE:
+                    end_index += 1
+                if tokens[end_index - 1].type == tokenize.COMMENT:
+                    end_index -= 1
+                statement_tokens = tokens[index - 1:end_index]
+                statements.append((statement_tokens, self._get_simple_call_args(statement_tokens)))
+                # the next token is the NEWLINE:
+                index = end_index
+                while tokens[index].type != tokenize.NEWLINE:
+                    index += 1
+                tok = tokens[index]
+                index += 1
+
+            at_line_start = tok.type in _LOGICAL_LINE_START_TOKENS
+            prev_tok = tok
+
+        return statements
+
+    def _get_simple_call_args(self, statement_tokens: [tokenize.TokenInfo]) -> [[tokenize.TokenInfo]] or None:
+        """
+        Get the arguments of a statement that is a call to a nose function, if the call is simple and on one line,
+        and its arguments have no calls to nose functions.
+        :return: list of tokens of each argument, an empty list last being a trailing comma; or None if the
+            statement is not a simple call
+        """
+        row = statement_tokens[0].start[0]
+        if statement_tokens[-1].end[0] != row or statement_tokens[-1].string != ')':
+            return None
+
+        args = [[]]
+        depth = 0
+        for index in range(2, len(statement_tokens) - 1):
+            tok = statement_tokens[index]
+            if tok.type in _NON_LOGICAL_TOKENS or tok.start[0] != row or tok.end[0] != row:
+                return None
+            if (tok.type == tokenize.NAME and tok.string in self.fixers_by_name
+                    and statement_tokens[index + 1].string == '('):
+                # fissix converts the nose function calls in the arguments too (eg "assert_equal(ok_(a), b)")
+                return None
+            if tok.type == tokenize.OP and tok.string in _OPENING_BRACKETS:
+                depth += 1
+            elif tok.type == tokenize.OP and tok.string in ')]}':
+                if depth == 0:
+                    # the call is followed by something else, eg "ok_(a)(b)" or "ok_(a) or b"
+                    return None
+                depth -= 1
+            elif depth == 0 and tok.type == tokenize.OP and tok.string == ',':
+                args.append([])
+                continue
+            args[-1].append(tok)
+
+        if args == [[]]:
+            args = []
+        # an empty last argument is a trailing comma
+        if not all(_is_simple_arg(arg) for arg in (args[:-1] if args and not args[-1] else args)):
+            return None
+        return args
+
+    def _convert_simple_call(self, fixer, call_tokens: [tokenize.TokenInfo],
+                             args: [[tokenize.TokenInfo]]) -> str or None:
+        """Get the text of a simple call converted by the given fixer, or None if the fixer leaves it alone"""
+        node = self._make_call_node(call_tokens, args)
+        results = fixer.match(node)
+        if not results:
+            return None
+        new_node = fixer.transform(node, results)
+        if new_node is node:
+            return None
+        return str(new_node)
+
+    def _convert_statement(self, text: str, position: (int, int), name: str, call_sites: dict) -> str or None:
+        """
+        Convert a statement with fissix.
+        :param text: text of the statement, from its first token
+        :param position: (row, column) of the statement in the module
+        :param call_sites: fixer -> call sites recorded for the module; the call sites recorded for this
+            statement are added to it, with their position in the module
+        :return: the converted text, or None if the statement cannot be parsed
+        """
+        try:
+            tree = self.refac.driver.parse_string(text + '\n')
+            statement_nodes = tree.children
+            # (line, column) where the statement starts in the parsed text:
+            first_line, first_col = 1, 0
+        except Exception:
+            # some statements can only be parsed in an async function, eg "assert_equal(await a, b)":
+            try:
+                tree = self.refac.driver.parse_string(_ASYNC_FUNCTION_HEADER + text + '\n')
+            except Exception:
+                return None
+            # the suite of the function: NEWLINE, INDENT, statement, DEDENT
+            statement_nodes = tree.children[0].children[-1].children[-1].children[2:-1]
+            first_line, first_col = 2, 1
+        tree.future_features = frozenset()
+        self.refac.refactor_tree(tree, name)
+
+        row, col = position
+        for fixer in self.fixers:
+            fixer_call_sites = call_sites.setdefault(fixer, {})
+            for (line, column), call_site in fixer.call_sites.items():
+                fixer_call_sites[line - first_line + row,
+                                 column - first_col + col if line == first_line else column] = call_site
+            fixer.call_sites.clear()
+
+        # The [:-1] is to take off the \n we added
+        return ''.join(str(node) for node in statement_nodes)[:-1]
+
+    def _make_call_node(self, call_tokens: [tokenize.TokenInfo], args: [[tokenize.TokenInfo]]) -> PyNode:
+        """
+        Get the tree that fissix would produce for a simple call, except that each argument is a single leaf,
+        which is equivalent for the fixers since simple arguments never need parentheses
+        """
+        def make_leaf(leaf_type: int, value: str, tok: tokenize.TokenInfo, prev_tok: tokenize.TokenInfo) -> PyLeaf:
+            return PyLeaf(leaf_type, value, context=(tok.line[prev_tok.end[1]:tok.start[1]], tok.start))
+
+        name_tok, open_tok, close_tok = call_tokens[0], call_tokens[1], call_tokens[-1]
+        line = name_tok.line
+        prev_tok = open_tok
+        children = []
+        for arg_index, arg in enumerate(args):
+            if arg_index > 0:
+                comma_tok = _get_token_before(call_tokens, arg[0] if arg else close_tok)
+                children.append(make_leaf(token.COMMA, ',', comma_tok, prev_tok))
+                prev_tok = comma_tok
+            if arg:
+                value = line[arg[0].start[1]:arg[-1].end[1]]
+                children.append(make_leaf(token.NAME, value, arg[0], prev_tok))
+                prev_tok = arg[-1]
+
+        if len(children) == 1:
+            trailer_children = children
+        elif children:
+            trailer_children = [PyNode(_syms['arglist'], children)]
+        else:
+            trailer_children = []
+        trailer = PyNode(_syms['trailer'], [make_leaf(token.LPAR, '(', open_tok, name_tok)] + trailer_children
+                         + [make_leaf(token.RPAR, ')', close_tok, prev_tok)])
+        return PyNode(_syms['power'], [PyLeaf(token.NAME, name_tok.string, context=('', name_tok.start)), trailer])
+
+
+def get_line_offsets(source: str) -> [int]:
+    """Get the offset in source of the start of each line"""
+    return [0] + [match.end() for match in re.finditer('\n', source)]
+
+
+def _get_token_before(tokens: [tokenize.TokenInfo], tok: tokenize.TokenInfo) -> tokenize.TokenInfo:
+    return tokens[tokens.index(tok) - 1]
+
+
+def _skip_brackets(arg: [tokenize.TokenInfo], pos: int) -> int or None:
+    """Get the position after the bracket that closes the one at arg[pos], or None if it is not closed"""
+    depth = 0
+    for end in range(pos, len(arg)):
+        tok = arg[end]
+        if tok.type == tokenize.OP and tok.string in '([{':
+            depth += 1
+        elif tok.type == tokenize.OP and tok.string in ')]}':
+            depth -= 1
+            if depth == 0:
+                return end + 1
+    return None
+
+
+def _is_simple_arg(arg: [tokenize.TokenInfo]) -> bool:
+    """Test if the tokens of an argument are an atom followed by trailers (attributes, calls or subscripts)"""
+    if not arg:
+        return False
+
+    tok = arg[0]
+    if tok.type == tokenize.NAME:
+        if keyword.iskeyword(tok.string) and tok.string not in _CONSTANTS:
+            return False
+        pos = 1
+    elif tok.type == tokenize.NUMBER:
+        pos = 1
+    elif tok.type == tokenize.STRING:
+        pos = 1
+        while pos < len(arg) and arg[pos].type == tokenize.STRING:
+            pos += 1
+    elif tok.type == tokenize.OP and tok.string in _OPENING_BRACKETS:
+        pos = _skip_brackets(arg, 0)
+    else:
+        return False
+
+    while pos is not None and pos < len(arg):
+        tok = arg[pos]
+        if tok.type != tokenize.OP:
+            return False
+        if tok.string == '.':
+            if pos + 1 == len(arg) or arg[pos + 1].type != tokenize.NAME:
+                return False
+            pos += 2
+        elif tok.string in '([':
+            pos = _skip_brackets(arg, pos)
+        else:
+            return False
+
+    return pos is not None
@@ -10,6 +10,7 @@ setup(
         entry_points={
             'console_scripts': [
                 'nose2pytest = nose2pytest.script:main',
+                'nose2pytest-server = nose2pytest.server:main',
             ],
             'pytest11': ['pytest_nose_assert_tools = nose2pytest.assert_tools'],
         },
@@ -1,11 +1,28 @@
+import io
+import json
 import logging
+import os
+import socket
+import subprocess
 import sys
+import time
+from decimal import Decimal
+from fractions import Fraction
 from logging import StreamHandler
+from pathlib import Path
 from textwrap import dedent
 
 import pytest
-
-from nose2pytest.script import NoseConversionRefactoringTool
+from fissix import refactor
+
+from nose2pytest.script import NoseConversionRefactoringTool, parse_jobs
+from nose2pytest.script import file_contains_match, MMAP_MIN_FILE_SIZE, get_git_changed_files
+from nose2pytest.script import read_null_separated_paths
+from nose2pytest import script
+from nose2pytest.cache import ConversionCache
+from nose2pytest.discovery import FileFinder
+from nose2pytest.profiling import Profiler
+from nose2pytest.scheduler import WorkerPool, TaskFailure, get_rss_mb
 from nose2pytest.assert_tools import _supported_nose_name
 
 log = logging.getLogger('nose2pytest')
@@ -34,6 +51,26 @@ def setup_log():
     pytesttools['pytest'] = pytest
 
 
+# tasks of the WorkerPool tests, at module level so that they can be pickled where workers cannot be forked:
+
+def double_task(task):
+    if task == 'die':
+        os._exit(3)
+    if task == 'fail':
+        raise ValueError('bad task')
+    return task * 2
+
+
+def budget_task(task):
+    if task == 'slow':
+        time.sleep(30)
+    if task == 'big':
+        data = b'x' * (100 * 2 ** 20)
+        time.sleep(30)
+        del data
+    return task
+
+
 def check_transformation(input, expect):
     result = refac.refactor_string(dedent(input + '\n'), 'script')
     assert dedent(expect + '\n') == str(result)
@@ -317,6 +354,10 @@ class Test3Args:
         check_fails(refac, 'assert_almost_equal(123.456, 124, delta=0.1)',
                     'assert 123.456 == pytest.approx(124, abs=0.1)')
 
+    def test_positional_places_left_alone(self):
+        check_transformation('assert_almost_equal(a, b, 3)', 'assert_almost_equal(a, b, 3)')
+        check_transformation('assert_almost_equal(a, b, 3, "reason")', 'assert_almost_equal(a, b, 3, "reason")')
+
     def test_not_almost_equal(self):
         check_transformation('assert_not_almost_equal(123.456, 124, msg="reason")',
                              'assert 123.456 != pytest.approx(124, abs=1e-7), "reason"')
@@ -362,6 +403,125 @@ class Test3Args:
                      'assert 123.456 == pytest.approx(123.450, abs=1e-1)')
 
 
+class TestAbsAlmostStyle:
+
+    abs_refac = NoseConversionRefactoringTool(almost_style='abs')
+
+    def test_parens(self):
+        def check(statement_in, expect_out):
+            assert str(self.abs_refac.refactor_string(statement_in + '\n', 'script')) == expect_out + '\n'
+
+        check('assert_almost_equal(a, b)', 'assert abs(a - b) <= 1e-7')
+        check('assert_almost_equal(a + 1, b - 1, places=3)', 'assert abs((a + 1) - (b - 1)) <= 1e-3')
+        check('assert_almost_equal(a, b if c else d, delta=x or y)', 'assert abs(a - (b if c else d)) <= (x or y)')
+        check('assert_not_almost_equal(a, not b, msg="m", delta=0.1)', 'assert abs(a - (not b)) > 0.1, "m"')
+
+    def test_same_results(self):
+        check_passes(self.abs_refac, 'assert_almost_equal(123.456, 123.5, delta=0.1)',
+                     'assert abs(123.456 - 123.5) <= 0.1')
+        check_fails(self.abs_refac, 'assert_almost_equal(123.456, 124, places=1)', 'assert abs(123.456 - 124) <= 1e-1')
+        check_passes(self.abs_refac, 'assert_almost_equal(1 - 0.1, 1 - 0.1 - 1e-9)',
+                     'assert abs((1 - 0.1) - (1 - 0.1 - 1e-9)) <= 1e-7')
+        check_passes(self.abs_refac, 'assert_not_almost_equal(1, 2, places=3)', 'assert abs(1 - 2) > 1e-3')
+
+    def test_cache_key(self):
+        assert self.abs_refac.get_conversions_salt() != refac.get_conversions_salt()
+
+
+class TestHoistRegexes:
+
+    hoist_refac = NoseConversionRefactoringTool(hoist_regexes=True)
+
+    def check(self, source, expected):
+        assert str(self.hoist_refac.refactor_string(dedent(source), 'script')) == dedent(expected)
+
+    def test_module(self):
+        source = r'''
+            #!/usr/bin/env python
+            def test(name, pattern):
+                assert_regex(name, r"^\w+$")
+                assert_not_regex(name,
+                                 'a' "b", "msg")
+                assert_regex(name.upper(), r"^\w+$")
+                assert_regex(name, pattern)
+                assert_regex(name, f"{pattern}")
+            '''
+        expected = r'''
+            #!/usr/bin/env python
+            import re
+
+            _RE_1 = re.compile(r"^\w+$")
+            _RE_2 = re.compile('a' "b")
+
+            def test(name, pattern):
+                assert _RE_1.search(name)
+                assert not _RE_2.search(name), "msg"
+                assert _RE_1.search(name.upper())
+                assert re.search(pattern,name)
+                assert re.search(f"{pattern}",name)
+            '''
+        self.check(source.lstrip('\n'), expected.lstrip('\n'))
+
+        namespace = {}
+        exec(dedent(expected), namespace)
+        namespace['test']('xyz', 'y')
+        with pytest.raises(AssertionError, match='msg'):
+            namespace['test']('xaby', 'y')
+
+    def test_imports(self):
+        self.check('''
+            """Docstring."""
+            from __future__ import annotations
+            import os, re
+
+            _RE_1 = 1
+            assert_regex(a, 'x')
+            ''', '''
+            """Docstring."""
+            from __future__ import annotations
+            import os, re
+
+            _RE_2 = re.compile('x')
+
+            _RE_1 = 1
+            assert _RE_2.search(a)
+            ''')
+        self.check('''
+            import re as regex
+            assert_regex(a, 'x')
+            ''', '''
+            import re as regex
+            import re
+
+            _RE_1 = re.compile('x')
+
+            assert _RE_1.search(a)
+            ''')
+
+    def test_used_names(self):
+        self.check('''
+            _RE_1 = None
+            assert_regex(x, "a")
+            assert_regex(y, "b")
+            ''', '''
+            import re
+
+            _RE_2 = re.compile("a")
+            _RE_3 = re.compile("b")
+
+            _RE_1 = None
+            assert _RE_2.search(x)
+            assert _RE_3.search(y)
+            ''')
+
+    @pytest.mark.parametrize('engine', ['tokenize', 'ast'])
+    def test_engines(self, engine):
+        source = 'import os\n\ndef test():\n    assert_regex(a, "x")\n    ok_(b)\n'
+        tool = NoseConversionRefactoringTool(hoist_regexes=True, engine=engine)
+        assert tool._convert_source(source.encode(), source, 'script') == (
+            True, str(self.hoist_refac.refactor_string(source, 'script')))
+
+
 class TestAssertTools:
 
     def test_dict_keys_subset(self):
@@ -387,3 +547,978 @@ class TestAssertTools:
         dict2['a'] = 4
         pytest.raises(AssertionError, pytest.assert_dict_contains_subset, dict1, dict2)
         # assert_dict_contains_subset(dict1, dict2)
+
+    def test_dict_subset_messages(self):
+        subset = {key: key for key in range(10)}
+        pytest.assert_dict_contains_subset(subset, dict(subset, other=[1]))
+        pytest.assert_dict_contains_subset({'a': [1]}, {'a': [1], 'b': {}})
+
+        with pytest.raises(AssertionError, match=r'^Missing keys = \[0, 1, 2\] \(and 7 more\)$'):
+            pytest.assert_dict_contains_subset(subset, {}, max_reported=3)
+        with pytest.raises(AssertionError, match=r'^Mismatched values \(s, d\) = \{1: \(1, -1\)\} \(and 8 more\)$'):
+            pytest.assert_dict_contains_subset(subset, {key: -key for key in subset}, max_reported=1)
+        with pytest.raises(AssertionError, match=r"^Mismatched values \(s, d\) = \{'a': \(1, 2\)\}$"):
+            pytest.assert_dict_contains_subset({'a': 1}, {'a': 2}, max_reported=1)
+        with pytest.raises(AssertionError, match='^reason$'):
+            pytest.assert_dict_contains_subset({'a': 1}, {'a': 2}, 'reason')
+
+        # the same NaN is equal to itself, as for the fast path; only the real mismatch is reported:
+        nan = float('nan')
+        pytest.assert_dict_contains_subset({'a': nan}, {'a': nan, 'b': 1})
+        with pytest.raises(AssertionError, match=r"^Mismatched values \(s, d\) = \{'b': \(1, 2\)\}$"):
+            pytest.assert_dict_contains_subset({'a': nan, 'b': 1}, {'a': nan, 'b': 2})
+
+    @pytest.mark.parametrize('use_numpy', [False, True])
+    def test_all_almost_equal(self, monkeypatch, use_numpy):
+        from nose2pytest import assert_tools
+        if use_numpy:
+            numpy = pytest.importorskip('numpy')
+            array = numpy.array
+        else:
+            monkeypatch.setattr(assert_tools, '_get_numpy', lambda: None)
+            array = list
+
+        first = array([0.5, 1.0, float('inf'), 2.0])
+        pytest.assert_all_almost_equal(first, array([0.50000001, 1.0, float('inf'), 2.0]))
+        pytest.assert_all_almost_equal(first, array([0.6, 1.0, float('inf'), 1.95]), delta=0.1)
+        with pytest.raises(AssertionError, match=r'^Values not almost equal \(first, second\) = '
+                                                 r'\{0: \(0.5, 0.6\)\} \(and 1 more\)$'):
+            pytest.assert_all_almost_equal(first, array([0.6, 1.0, float('inf'), 2.1]), places=2, max_reported=1)
+        with pytest.raises(AssertionError, match='^reason$'):
+            pytest.assert_all_almost_equal(first, array([0.5, 1.0, float('inf'), 2.1]), msg='reason')
+        with pytest.raises(TypeError):
+            pytest.assert_all_almost_equal(first, first, places=2, delta=0.1)
+
+        # a result of the wrong length fails the test instead of erroring:
+        expected = (r'^Lengths differ \(first, second\) = \(4, 3\)$' if array is list else
+                    r'^Shapes differ \(first, second\) = \(\(4,\), \(3,\)\)$')
+        with pytest.raises(AssertionError, match=expected):
+            pytest.assert_all_almost_equal(first, array([0.5, 1.0, 2.0]))
+        with pytest.raises(AssertionError, match='^reason$'):
+            pytest.assert_all_almost_equal(first, array([0.5, 1.0, 2.0]), msg='reason')
+
+    def test_all_almost_equal_numpy_dtypes(self):
+        numpy = pytest.importorskip('numpy')
+        from nose2pytest import assert_tools
+        # sequences are checked one by one even once NumPy is imported, so Fraction and Decimal support rounding:
+        assert assert_tools._get_numeric_arrays([0.5], [0.5]) is None
+        pytest.assert_all_almost_equal([Fraction(1, 3)], [Fraction(1, 3) + Fraction(1, 10 ** 9)])
+        pytest.assert_all_almost_equal([Decimal('1.0')], [Decimal('1.00000000001')])
+        # unsigned integers do not wrap around, and bools are subtracted as Python bools:
+        uint8s = numpy.array([1, 2], dtype=numpy.uint8)
+        pytest.assert_all_almost_equal(uint8s, uint8s[::-1], delta=2)
+        bools = numpy.array([True, False])
+        pytest.assert_all_almost_equal(bools, numpy.array([True, True]), delta=1)
+        with pytest.raises(AssertionError, match=r'^Values not almost equal \(first, second\) = '
+                                                 r'\{1: \(False, True\)\}$'):
+            pytest.assert_all_almost_equal(bools, numpy.array([True, True]))
+
+    def test_dict_of_arrays_subset(self):
+        numpy = pytest.importorskip('numpy')
+        subset = dict(a=numpy.arange(5), b=1)
+        pytest.assert_dict_contains_subset(subset, dict(a=numpy.arange(5), b=1, c=numpy.arange(2)))
+        with pytest.raises(AssertionError, match=r"^Mismatched values \(s, d\) = \{'a': "):
+            pytest.assert_dict_contains_subset(subset, dict(a=numpy.arange(1, 6), b=1))
+
+    def test_lazy_unittest_functions(self):
+        # pytest itself may import unittest, depending on its version, so the probe checks that the plugin does not:
+        probe = dedent("""\
+            import sys, pytest
+            imported_before = 'unittest' in sys.modules
+            import nose2pytest.assert_tools as tools
+            tools.pytest_configure()
+            print(imported_before or 'unittest' not in sys.modules, tools._test_case is None,
+                  'assert_raises_regex' in vars(tools), 'assert_raises_regex' in vars(pytest))
+            pytest.assert_raises_regex
+            print(tools._test_case is None, 'assert_raises_regex' in vars(tools), 'assert_raises_regex' in vars(pytest))
+            """)
+        result = subprocess.run([sys.executable, '-c', probe], stdout=subprocess.PIPE, universal_newlines=True)
+        assert result.stdout == 'True True False False\nFalse True True\n'
+
+        from nose2pytest import assert_tools
+        from nose2pytest.assert_tools import assert_raises_regex
+        assert 'assert_warns_regex' in dir(assert_tools)
+        with assert_raises_regex(ValueError, 'bad'):
+            raise ValueError('bad value')
+        pytest.assert_regexp_matches('abc', 'b')
+        pytest.raises(AssertionError, pytest.assert_regexp_matches, 'abc', 'd')
+        with pytest.raises(AttributeError):
+            assert_tools.assert_nothing
+
+
+class TestRefactoringTool:
+
+    def test_all_fixers_use_bottom_matcher(self):
+        assert refac.BM.fixers
+        assert refac.bmi_pre_order == []
+        assert refac.bmi_post_order == []
+
+    def test_one_fixer_per_class(self):
+        fixer_classes = [fixer.__class__ for fixer in refac.BM.fixers]
+        assert sorted(cls.__name__ for cls in fixer_classes) == [
+            'FixAssert1Arg', 'FixAssert2Args', 'FixAssertAlmostEq', 'FixAssertBinOp']
+        for fixer in refac.BM.fixers:
+            assert set(fixer.dest_trees) == set(fixer.conversions)
+
+    def test_templates_shared(self):
+        other = NoseConversionRefactoringTool()
+        for fixer, other_fixer in zip(refac.BM.fixers, other.BM.fixers):
+            assert fixer.dest_trees is other_fixer.dest_trees
+            assert fixer.pattern is other_fixer.pattern
+        # the shared destination trees are not modified by conversions
+        for _ in range(2):
+            assert str(other.refactor_string('assert_equal(a, b)\n', 'script')) == 'assert a == b\n'
+
+    def test_unknown_name_not_converted(self):
+        check_transformation('assert_something(a, b)', 'assert_something(a, b)')
+        check_transformation('(assert_equal)(a, b)', '(assert_equal)(a, b)')
+
+    def test_nested_calls(self):
+        check_transformation('assert_equal(len(assert_true), 1)', 'assert len(assert_true) == 1')
+        check_transformation('assert_true(a); assert_false(b)', 'assert a; assert not b')
+        check_transformation('obj.assert_true(a)', 'obj.assert_true(a)')
+
+
+def make_test_dir(dir_path):
+    (dir_path / 'sub').mkdir()
+    for index in range(6):
+        (dir_path / 'test_{}.py'.format(index)).write_text('assert_equal(a, {})\n'.format(index))
+        (dir_path / 'sub' / 'other_{}.py'.format(index)).write_text('x = {}\n'.format(index))
+    (dir_path / 'sub' / 'test_bad.py').write_text('assert_true(\n')
+
+
+class TestParallel:
+
+    def test_parse_jobs(self):
+        assert parse_jobs('3') == 3
+        assert parse_jobs('auto') >= 1
+        with pytest.raises(Exception):
+            parse_jobs('0')
+        with pytest.raises(Exception):
+            parse_jobs('many')
+
+    def test_same_summary_as_serial(self, tmp_path):
+        serial_dir, parallel_dir = tmp_path / 'serial', tmp_path / 'parallel'
+        serial_dir.mkdir()
+        parallel_dir.mkdir()
+        make_test_dir(serial_dir)
+        make_test_dir(parallel_dir)
+
+        serial = NoseConversionRefactoringTool()
+        serial.refactor([str(serial_dir)], write=True)
+        parallel = NoseConversionRefactoringTool()
+        parallel.refactor([str(parallel_dir)], write=True, num_processes=3)
+
+        def relative_paths(files, dir_path):
+            return [str(Path(path).relative_to(dir_path)) for path in files]
+
+        assert relative_paths(parallel.files, parallel_dir) == relative_paths(serial.files, serial_dir)
+        assert len(parallel.files) == 6
+        assert parallel.wrote
+        assert len(parallel.errors) == len(serial.errors) == 1
+        assert (parallel_dir / 'test_4.py').read_text() == 'assert a == 4\n'
+        assert (parallel_dir / 'sub' / 'other_4.py').read_text() == 'x = 4\n'
+
+    def test_recycled_workers(self, tmp_path):
+        make_test_dir(tmp_path)
+        tool = NoseConversionRefactoringTool(record_call_sites=True)
+        tool.refactor([str(tmp_path)], num_processes=2, max_tasks_per_child=1, max_worker_rss_mb=10000)
+        assert len(tool.files) == 6
+        assert len(tool.errors) == 1
+        assert len(tool.call_sites) == 6
+
+    def test_worker_pool(self):
+        pool = WorkerPool(double_task, 1)
+        assert list(pool.run([(1, 'a'), (3, 'c'), (2, 'b')])) == [('c', 'cc', None), ('b', 'bb', None),
+                                                                   ('a', 'aa', None)]
+        assert pool.num_workers_started == 1
+
+        pool = WorkerPool(double_task, 1, max_tasks_per_child=2)
+        results = pool.run([(5, 'a'), (4, 'die'), (3, 'b'), (2, 'fail'), (1, 'c')])
+        assert sorted(results) == [('a', 'aa', None), ('b', 'bb', None), ('c', 'cc', None),
+                                   ('die', None, TaskFailure('worker process died (exit code 3)', False)),
+                                   ('fail', None, TaskFailure('ValueError: bad task', False))]
+        assert pool.num_workers_started == 3
+
+        pool = WorkerPool(double_task, 1, max_rss_mb=0.001)
+        assert len(list(pool.run([(1, 'a'), (2, 'b')]))) == 2
+        assert pool.num_workers_started == 2
+
+    @pytest.mark.skipif(get_rss_mb(os.getpid()) is None, reason='the RSS of other processes is only available on Linux')
+    def test_worker_pool_budget(self):
+        max_rss_mb = get_rss_mb() + 50
+        pool = WorkerPool(budget_task, 2, task_timeout=1, max_task_rss_mb=max_rss_mb)
+        start = time.monotonic()
+        results = pool.run([(1, 'a'), (2, 'slow'), (3, 'big'), (4, 'b')])
+        assert sorted(results) == [('a', 'a', None), ('b', 'b', None),
+                                   ('big', None, TaskFailure('used more than {} MB'.format(max_rss_mb), True)),
+                                   ('slow', None, TaskFailure('took more than 1 s', True))]
+        assert time.monotonic() - start < 10
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='the patched method of the tool must be forked')
+    def test_file_budget(self, tmp_path):
+        make_test_dir(tmp_path)
+        tool = NoseConversionRefactoringTool(record_call_sites=True)
+        refactor_file = tool._refactor_file
+
+        def slow_refactor_file(filename, *args):
+            if filename.endswith('test_2.py'):
+                time.sleep(30)
+            refactor_file(filename, *args)
+
+        tool._refactor_file = slow_refactor_file
+        tool.refactor([str(tmp_path)], file_timeout=1)
+        slow_path = str(tmp_path / 'test_2.py')
+        assert tool.files_over_budget == [(slow_path, 'took more than 1 s')]
+        assert len(tool.files) == 5 and slow_path not in tool.files
+        assert tool.get_report()['files_over_budget'] == {slow_path: 'took more than 1 s'}
+
+
+class TestDiscovery:
+
+    def make_tree(self, dir_path, files):
+        for path in files:
+            (dir_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (dir_path / path).write_text('')
+
+    def find(self, dir_path, **kwargs):
+        return [str(Path(path).relative_to(dir_path)) for path in FileFinder(**kwargs).find(str(dir_path))]
+
+    def test_same_as_fissix_walk(self, tmp_path):
+        make_test_dir(tmp_path)
+        self.make_tree(tmp_path, ['.hidden.py', '.hidden/a.py', 'sub/notes.txt', 'sub/deeper/a.py', 'b.py'])
+        walked = []
+        tool = NoseConversionRefactoringTool()
+        tool.refactor_file = lambda filename, *args: walked.append(filename)
+        refactor.RefactoringTool.refactor_dir(tool, str(tmp_path))
+        assert [str(Path(path).relative_to(tmp_path)) for path in walked] == self.find(tmp_path)
+
+    def test_gitignore(self, tmp_path):
+        self.make_tree(tmp_path, ['a.py', 'x.gen.py', 'keep.gen.py', 'build/b.py', 'venv/pyvenv.cfg', 'venv/lib/c.py',
+                                  'sub/local_d.py', 'sub/e.py', 'other/local_f.py', 'node_modules/g.py',
+                                  'sub/build.py', 'sub/more/h.py'])
+        (tmp_path / '.gitignore').write_text('# comment\nbuild/\n*.gen.py\n!keep.gen.py\n/sub/local_*.py\n')
+        (tmp_path / 'sub' / '.gitignore').write_text('more\n')
+        assert self.find(tmp_path, exclude=['node_modules']) == [
+            'a.py', 'keep.gen.py', 'other/local_f.py', 'sub/build.py', 'sub/e.py']
+        assert self.find(tmp_path, use_gitignore=False) == [
+            'a.py', 'keep.gen.py', 'x.gen.py', 'build/b.py', 'node_modules/g.py', 'other/local_f.py',
+            'sub/build.py', 'sub/e.py', 'sub/local_d.py', 'sub/more/h.py']
+        found = self.find(tmp_path, include=['local_*.py', 'sub/**/*.py'], exclude=['sub/e.py'], use_gitignore=False)
+        assert found == ['other/local_f.py', 'sub/build.py', 'sub/local_d.py', 'sub/more/h.py']
+
+    def test_include_folders(self, tmp_path):
+        self.make_tree(tmp_path, ['a.py', 'tests/b.py', 'tests/sub/c.py', 'pkg/tests/d.py', 'pkg/e.py'])
+        expected = ['pkg/tests/d.py', 'tests/b.py', 'tests/sub/c.py']
+        assert self.find(tmp_path, include=['tests']) == expected
+        assert self.find(tmp_path, include=['tests/']) == expected
+        assert self.find(tmp_path, include=['/tests']) == ['tests/b.py', 'tests/sub/c.py']
+        assert self.find(tmp_path, include=['tests/'], exclude=['sub']) == ['pkg/tests/d.py', 'tests/b.py']
+
+        finder = FileFinder(include=['tests/'], exclude=['sub'])
+        assert [path for path in ['a.py', 'tests/b.py', 'tests/sub/c.py', 'pkg/tests/d.py', 'pkg/e.py']
+                if finder.is_selected(path)] == ['tests/b.py', 'pkg/tests/d.py']
+
+    def test_gitignore_above(self, tmp_path):
+        self.make_tree(tmp_path, ['.git/info/exclude', 'pkg/a.py', 'pkg/generated/b.py', 'pkg/c_local.py', 'd.py'])
+        (tmp_path / '.gitignore').write_text('pkg/generated/\n')
+        (tmp_path / '.git' / 'info' / 'exclude').write_text('*_local.py\n')
+        assert self.find(tmp_path / 'pkg') == ['a.py']
+        assert self.find(tmp_path) == ['d.py', 'pkg/a.py']
+
+    def test_list_files(self, tmp_path):
+        self.make_tree(tmp_path, ['a.py', 'b.py', 'c.txt'])
+        result = subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--list-files', '--exclude', 'b.py',
+                                 str(tmp_path), str(tmp_path / 'b.py')],
+                                stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        assert result.stdout.splitlines() == [str(tmp_path / 'a.py'), str(tmp_path / 'b.py')]
+
+
+class TestPreFilter:
+
+    def test_file_contains_match(self, tmp_path):
+        regex = refac.nose_names_regex
+        path = tmp_path / 'test.py'
+        path.write_text('')
+        assert not file_contains_match(str(path), regex)
+
+        path.write_text('x = assert_equality(a, b)\nassert_raises(Exception, f)\n# assert_equal\n')
+        assert file_contains_match(str(path), regex)
+        path.write_text('x = assert_equality(a, b)\nassert_raises(Exception, f)\n')
+        assert not file_contains_match(str(path), regex)
+
+        filler = 'x = 1\n' * (MMAP_MIN_FILE_SIZE // 6 + 1)
+        path.write_text(filler)
+        assert not file_contains_match(str(path), regex)
+        path.write_text(filler + 'eq_(a, b)\n')
+        assert file_contains_match(str(path), regex)
+
+        assert file_contains_match(str(tmp_path / 'missing.py'), regex)
+
+    def test_skipped_files_not_parsed(self, tmp_path):
+        (tmp_path / 'test_nose.py').write_text('ok_(a)\n')
+        (tmp_path / 'test_pytest.py').write_text('assert a\n')
+        (tmp_path / 'test_bad.py').write_text('assert (\n')
+
+        tool = NoseConversionRefactoringTool()
+        tool.refactor([str(tmp_path)], write=True)
+        assert tool.num_files_scanned == 3
+        assert tool.num_files_skipped == 2
+        assert tool.errors == []
+        assert (tmp_path / 'test_nose.py').read_text() == 'assert a\n'
+
+
+class TestCache:
+
+    def test_get_put(self, tmp_path):
+        cache = ConversionCache(str(tmp_path / 'cache'), salt='1')
+        key = cache.get_key(b'ok_(a)\n')
+        assert key != ConversionCache(str(tmp_path / 'cache'), salt='2').get_key(b'ok_(a)\n')
+        assert cache.get(key) == (False, None, [])
+
+        cache.put(key, 'assert a\n', [(1, 0, 'ok_', 'converted')])
+        assert cache.get(key) == (True, 'assert a\n', [(1, 0, 'ok_', 'converted')])
+        cache.put(key, None)
+        assert cache.get(key) == (True, None, [])
+
+        cache.clear()
+        assert cache.get(key) == (False, None, [])
+
+    def test_evict_least_recently_used(self, tmp_path):
+        cache = ConversionCache(str(tmp_path / 'cache'), salt='', max_size=25)
+        keys = [cache.get_key(str(index).encode()) for index in range(3)]
+        for mtime, key in enumerate(keys):
+            cache.put(key, 'x' * 9)
+            os.utime(str(tmp_path / 'cache' / key), (mtime, mtime))
+
+        cache.evict()
+        assert [cache.get(key)[0] for key in keys] == [False, True, True]
+
+    def test_rerun_uses_cache(self, tmp_path, monkeypatch):
+        src_dir, cache_dir = tmp_path / 'src', str(tmp_path / 'cache')
+        src_dir.mkdir()
+        (src_dir / 'test_a.py').write_text('ok_(a)\n')
+        (src_dir / 'test_b.py').write_text('ok = assert_true\n')
+
+        tool = NoseConversionRefactoringTool(cache_dir=cache_dir)
+        tool.refactor([str(src_dir)])
+        assert [Path(path).name for path in tool.files] == ['test_a.py']
+
+        tool = NoseConversionRefactoringTool(cache_dir=cache_dir)
+        monkeypatch.setattr(tool, 'refactor_string', None)
+        tool.refactor([str(src_dir)], write=True)
+        assert [Path(path).name for path in tool.files] == ['test_a.py']
+        assert (src_dir / 'test_a.py').read_text() == 'assert a\n'
+        assert (src_dir / 'test_b.py').read_text() == 'ok = assert_true\n'
+
+
+class TestGitChangedFiles:
+
+    @staticmethod
+    def git(repo_dir, *args):
+        subprocess.run(['git', '-C', str(repo_dir), '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+                       + list(args), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def test_since_and_staged(self, tmp_path):
+        self.git(tmp_path, 'init', '-q')
+        (tmp_path / 'sub').mkdir()
+        for name in ('sub/test_a.py', 'sub/test_b.py', 'test_c.py', 'test_d.py', 'notes.txt'):
+            (tmp_path / name).write_text('ok_(a)\n')
+        self.git(tmp_path, 'add', '.')
+        self.git(tmp_path, 'commit', '-q', '-m', 'initial')
+
+        (tmp_path / 'sub' / 'test_a.py').write_text('ok_(b)\n')
+        (tmp_path / 'sub' / 'test_new.py').write_text('ok_(c)\n')
+        (tmp_path / 'notes.txt').write_text('ok_(d)\n')
+        self.git(tmp_path, 'add', 'sub/test_new.py', 'notes.txt')
+        self.git(tmp_path, 'rm', '-q', 'test_d.py')
+        (tmp_path / 'sub' / 'test_untracked.py').write_text('ok_(e)\n')
+        (tmp_path / '.gitignore').write_text('test_ignored.py\n')
+        (tmp_path / 'test_ignored.py').write_text('ok_(f)\n')
+
+        def names(paths):
+            return [str(Path(path).relative_to(tmp_path)) for path in paths]
+
+        changed = get_git_changed_files(str(tmp_path), since='HEAD')
+        assert names(changed) == [os.path.join('sub', 'test_a.py'), os.path.join('sub', 'test_new.py'),
+                                  os.path.join('sub', 'test_untracked.py')]
+        in_sub = get_git_changed_files(str(tmp_path / 'sub'), since='HEAD')
+        assert names(in_sub) == names(changed)
+        staged = get_git_changed_files(str(tmp_path), staged=True)
+        assert names(staged) == [os.path.join('sub', 'test_new.py')]
+        in_sub = get_git_changed_files(str(tmp_path / 'sub'), staged=True)
+        assert names(in_sub) == [os.path.join('sub', 'test_new.py')]
+
+        # the include and exclude patterns apply to the files reported by git too:
+        filtered = get_git_changed_files(str(tmp_path), since='HEAD', file_finder=FileFinder(exclude=['test_new.py']))
+        assert names(filtered) == [os.path.join('sub', 'test_a.py'), os.path.join('sub', 'test_untracked.py')]
+        filtered = get_git_changed_files(str(tmp_path), since='HEAD', file_finder=FileFinder(include=['sub/']))
+        assert names(filtered) == names(changed)
+        assert get_git_changed_files(str(tmp_path), since='HEAD', file_finder=FileFinder(exclude=['sub'])) == []
+
+    def test_not_a_repo(self, tmp_path):
+        with pytest.raises(RuntimeError):
+            get_git_changed_files(str(tmp_path), staged=True)
+
+
+class TestProfiler:
+
+    def test_recursive_calls_timed_once(self):
+        profiler = Profiler()
+
+        def countdown(n):
+            return n if n == 0 else wrapped(n - 1)
+
+        wrapped = profiler.wrap(countdown, 'phase', 'countdown')
+        wrapped(3)
+        wrapped(2)
+        assert profiler.as_dict()['phase']['countdown']['calls'] == 7
+        other = Profiler()
+        other.merge(profiler.as_dict())
+        other.merge(profiler.as_dict())
+        assert other.as_dict()['phase']['countdown']['calls'] == 14
+
+    def test_profile_conversion(self, tmp_path):
+        make_test_dir(tmp_path)
+        profiler = Profiler()
+        tool = NoseConversionRefactoringTool(profiler=profiler)
+        try:
+            tool.refactor([str(tmp_path)], write=False)
+        finally:
+            profiler.restore()
+        assert script.contains_newline.__name__ == 'contains_newline'
+        assert not hasattr(script.contains_newline, '__wrapped__')
+
+        profile = profiler.as_dict()
+        # the other_*.py files are skipped by the pre-filter, so they are neither read nor parsed
+        assert len(profile['file']) == 7
+        assert profile['phase']['pre-filter']['calls'] == 13
+        assert profile['phase']['parse']['calls'] == 7
+        assert profile['fixer']['FixAssertBinOp.transform']['calls'] == 6
+        assert profile['nose_function']['assert_equal']['calls'] == 6
+        assert 'nose_function' in profiler.format_summary()
+
+    def test_profile_options(self, tmp_path):
+        (tmp_path / 't1.py').write_text('ok_(a)\n')
+        (tmp_path / 'sub').mkdir()
+        (tmp_path / 'sub' / 't2.py').write_text('ok_(b)\n')
+
+        def run(*args):
+            subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--no-cache'] + list(args), check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=str(tmp_path))
+
+        # the file after --profile is converted, not overwritten by the profile:
+        run('--profile', 't1.py', 'sub')
+        assert (tmp_path / 't1.py').read_text() == 'assert a\n'
+        assert (tmp_path / 'sub' / 't2.py').read_text() == 'assert b\n'
+        assert 'phase' in json.loads((tmp_path / 'nose2pytest-profile.json').read_text())
+
+        run('--profile-output', 'profile.json', 't1.py')
+        assert 'phase' in json.loads((tmp_path / 'profile.json').read_text())
+
+
+class TestReport:
+
+    def test_call_sites(self, tmp_path):
+        (tmp_path / 'test_a.py').write_text(dedent("""\
+            assert_equal(a, b)
+            assert_almost_equal(a, b, 3)
+            assert_equal(a, b, c, d)
+            """))
+        (tmp_path / 'test_b.py').write_text('ok_(a); ok_(b)\n')
+        tool = NoseConversionRefactoringTool(cache_dir=str(tmp_path / 'cache'), record_call_sites=True)
+        tool.refactor([str(tmp_path)])
+        report = tool.get_report()
+
+        assert report['totals'] == dict(converted=3, unsupported_args=1, left_alone=1)
+        assert report['functions']['assert_equal'] == dict(converted=1, unsupported_args=1, left_alone=0)
+        assert report['functions']['assert_almost_equal'] == dict(converted=0, unsupported_args=0, left_alone=1)
+        call_sites = report['call_sites'][str(tmp_path / 'test_a.py')]
+        assert [(site['line'], site['status']) for site in call_sites] == [
+            (1, 'converted'), (2, 'left_alone'), (3, 'unsupported_args')]
+        assert [site['column'] for site in report['call_sites'][str(tmp_path / 'test_b.py')]] == [0, 8]
+
+        # same report when the results come from the cache
+        cached_tool = NoseConversionRefactoringTool(cache_dir=str(tmp_path / 'cache'), record_call_sites=True)
+        cached_tool.refactor_string = None
+        cached_tool.refactor([str(tmp_path)])
+        assert cached_tool.get_report() == report
+
+
+class TestStreams:
+
+    def test_refactor_stream(self):
+        output = io.BytesIO()
+        source = '# -*- coding: latin-1 -*-\nassert_equal(a, "\xe9")\n'.encode('latin-1')
+        assert NoseConversionRefactoringTool().refactor_stream(io.BytesIO(source), output)
+        assert output.getvalue() == '# -*- coding: latin-1 -*-\nassert a == "\xe9"\n'.encode('latin-1')
+
+        output = io.BytesIO()
+        assert not NoseConversionRefactoringTool().refactor_stream(io.BytesIO(b'ok_(\n'), output)
+        assert output.getvalue() == b'ok_(\n'
+
+    def test_filter_mode(self, tmp_path):
+        result = subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--no-cache', '-'],
+                                input=b'ok_(a)\nx = 1\n', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                cwd=str(tmp_path))
+        assert result.returncode == 0
+        assert result.stdout == b'assert a\nx = 1\n'
+
+    def test_null_separated_paths(self, tmp_path):
+        assert read_null_separated_paths(io.BytesIO(b'a.py\0sub dir/b.py\0')) == ['a.py', 'sub dir/b.py']
+        assert read_null_separated_paths(io.BytesIO('\u00e9.py'.encode())) == [os.fsdecode('\u00e9.py'.encode())]
+
+        for name in ('test_a.py', 'test_b.py', 'test_c.py'):
+            (tmp_path / name).write_text('ok_(a)\n')
+        paths = b'\0'.join(os.fsencode(tmp_path / name) for name in ('test_a.py', 'test_b.py'))
+        result = subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--no-cache', '-0'],
+                                input=paths, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        assert result.returncode == 0
+        assert [(tmp_path / name).read_text() for name in ('test_a.py', 'test_b.py', 'test_c.py')] == [
+            'assert a\n', 'assert a\n', 'ok_(a)\n']
+
+    @pytest.mark.skipif(sys.platform != 'linux', reason='needs a file system that accepts any bytes in file names')
+    def test_null_separated_undecodable_paths(self, tmp_path):
+        # a name that is not valid UTF-8, nor in the locale encoding given to the script:
+        path = os.fsencode(tmp_path) + b'/test_\xff.py'
+        with open(path, 'w') as file:
+            file.write('ok_(a)\n')
+        result = subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--no-cache', '-0'],
+                                input=path + b'\0', stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                env=dict(os.environ, LC_ALL='C', PYTHONIOENCODING='ascii'))
+        assert result.returncode == 0, result.stderr
+        with open(path) as file:
+            assert file.read() == 'assert a\n'
+
+
+class TestWrites:
+
+    def test_unchanged_files_not_written(self, tmp_path):
+        # left alone: the fixers change the tree, but not the source
+        left_alone = tmp_path / 'test_left_alone.py'
+        left_alone.write_text('assert_almost_equal(a, b, 3)\n')
+        converted = tmp_path / 'test_converted.py'
+        converted.write_text('assert_equal(a, b)\n')
+        for path in (left_alone, converted):
+            os.utime(str(path), (1000000000, 1000000000))
+
+        tool = NoseConversionRefactoringTool()
+        tool.refactor([str(tmp_path)], write=True)
+        assert tool.files == [str(converted)]
+        assert left_alone.stat().st_mtime == 1000000000
+        assert converted.read_text() == 'assert a == b\n'
+        assert converted.stat().st_mtime > 1000000000
+
+        os.utime(str(converted), (1000000000, 1000000000))
+        tool = NoseConversionRefactoringTool()
+        tool.refactor([str(tmp_path)], write=True)
+        assert tool.files == []
+        assert not tool.wrote
+        assert converted.stat().st_mtime == 1000000000
+
+        tool.write_file('assert a == b\n', str(converted), 'assert_equal(a, b)\n', 'utf-8')
+        assert not tool.wrote
+        assert converted.stat().st_mtime == 1000000000
+
+    def test_atomic_write(self, tmp_path):
+        target = tmp_path / 'target.py'
+        target.write_text('ok_(a)\n')
+        target.chmod(0o750)
+        link = tmp_path / 'test_link.py'
+        link.symlink_to(target.name)
+
+        tool = NoseConversionRefactoringTool()
+        tool.refactor([str(link)], write=True)
+        assert tool.wrote
+        assert link.is_symlink()
+        assert target.read_text() == 'assert a\n'
+        assert target.stat().st_mode & 0o777 == 0o750
+        # no temporary file left behind:
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['target.py', 'test_link.py']
+
+
+class TestCheck:
+
+    @pytest.mark.parametrize('num_processes', [1, 2])
+    def test_diff_stream(self, tmp_path, num_processes):
+        make_test_dir(tmp_path)
+        diff_stream = io.StringIO()
+        tool = NoseConversionRefactoringTool(diff_stream=diff_stream)
+        tool.refactor([str(tmp_path)], num_processes=num_processes)
+        diff = diff_stream.getvalue()
+        assert diff.count('--- ') == 6
+        path = str(tmp_path / 'test_3.py')
+        assert '--- {0}\n+++ {0}\n@@ -1 +1 @@\n-assert_equal(a, 3)\n+assert a == 3\n'.format(path) in diff
+        assert (tmp_path / 'test_3.py').read_text() == 'assert_equal(a, 3)\n'
+
+    @pytest.mark.parametrize('num_processes', [1, 2])
+    def test_fail_fast(self, tmp_path, num_processes):
+        make_test_dir(tmp_path)
+        tool = NoseConversionRefactoringTool()
+        tool.refactor([str(tmp_path)], num_processes=num_processes, fail_fast=True)
+        assert len(tool.files) == 1
+
+    def test_check_mode(self, tmp_path):
+        (tmp_path / 'test_a.py').write_text('ok_(a)\n')
+        (tmp_path / 'test_b.py').write_text('assert a\n')
+
+        def run(*args):
+            return subprocess.run([sys.executable, '-m', 'nose2pytest.script', '--no-cache'] + list(args),
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                  cwd=str(tmp_path))
+
+        result = run('--check', '--diff', '.')
+        assert result.returncode == 1
+        assert result.stdout == '--- ./test_a.py\n+++ ./test_a.py\n@@ -1 +1 @@\n-ok_(a)\n+assert a\n'
+        assert 'Would convert ./test_a.py' in result.stderr
+        assert (tmp_path / 'test_a.py').read_text() == 'ok_(a)\n'
+
+        assert run('--check', '--fail-fast', 'test_b.py').returncode == 0
+        assert run('--fail-fast', '.').returncode == 2
+
+        # a file that cannot be parsed is not converted, which must fail the check:
+        (tmp_path / 'test_c.py').write_text('assert_equal(a, b)\nx = = 1\n')
+        result = run('--check', 'test_b.py', 'test_c.py')
+        assert result.returncode == 1
+        assert "Can't parse test_c.py" in result.stderr
+        assert run('-w', 'test_c.py').returncode == 1
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'fork'),
+                    reason='the server needs fork() and Unix sockets')
+class TestServer:
+
+    @pytest.fixture
+    def socket_path(self, tmp_path):
+        socket_path = str(tmp_path / 'server.sock')
+        server = subprocess.Popen([sys.executable, '-m', 'nose2pytest.server', 'serve', '--no-cache',
+                                   '--socket', socket_path], stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 30
+            while not os.path.exists(socket_path):
+                assert server.poll() is None and time.monotonic() < deadline
+                time.sleep(0.05)
+            yield socket_path
+        finally:
+            server.terminate()
+            server.wait()
+        assert not os.path.exists(socket_path)
+
+    def test_convert(self, tmp_path, socket_path):
+        from nose2pytest.server import ConversionClient
+        (tmp_path / 'test_a.py').write_text('ok_(a)\n')
+        (tmp_path / 'test_b.py').write_text('ok_(\n')
+        with ConversionClient(socket_path) as client, ConversionClient(socket_path) as other_client:
+            assert other_client.convert_source(b'assert_equal(a, b)\n') == (True, b'assert a == b\n')
+            response = client.convert_files([str(tmp_path)])
+            assert response['files_changed'] == [str(tmp_path / 'test_a.py')]
+            assert len(response['errors']) == 1
+            assert client.convert_source(b'ok_(\n') == (False, b'ok_(\n')
+            assert other_client.convert_source(b'x = 1\n') == (True, b'x = 1\n')
+
+        assert (tmp_path / 'test_a.py').read_text() == 'assert a\n'
+
+    def test_socket_folder(self, tmp_path):
+        from nose2pytest.server import ConversionClient, check_socket_folder
+        folder = tmp_path / 'sockets'
+        socket_path = str(folder / 'server.sock')
+        check_socket_folder(socket_path, create=True)
+        assert folder.stat().st_mode & 0o077 == 0
+
+        folder.chmod(0o777)
+        with pytest.raises(PermissionError):
+            check_socket_folder(socket_path)
+        with pytest.raises(PermissionError):
+            ConversionClient(socket_path)
+
+        # a file that is not a socket is not removed as if left over by a killed server
+        folder.chmod(0o700)
+        Path(socket_path).write_text('x = 1\n')
+        result = subprocess.run([sys.executable, '-m', 'nose2pytest.server', 'serve', '--no-cache',
+                                 '--socket', socket_path], stderr=subprocess.PIPE, universal_newlines=True)
+        assert result.returncode == 1
+        assert 'not a socket' in result.stderr
+        assert Path(socket_path).read_text() == 'x = 1\n'
+
+
+class TestPrecedenceAnalysis:
+
+    # the recursive implementations that analyze_precedence() replaced, as reference
+    @staticmethod
+    def contains_newline(node):
+        for child in node.children:
+            if child.type in script.NEWLINE_OK_TOKENS:
+                return False
+            if '\n' in child.prefix:
+                return True
+            if isinstance(child, script.PyNode) and TestPrecedenceAnalysis.contains_newline(child):
+                return True
+        return False
+
+    @staticmethod
+    def has_weak_op_for_comparison(node):
+        if script.is_if_else_op(node):
+            return True
+        for child in node.children:
+            if child.type in script.NEWLINE_OK_TOKENS:
+                return False
+            if child.type in script.COMPARISON_TOKENS:
+                return True
+            if (node.type, child.type, str(child).strip()) in script.WEAK_OP_SYMBOLS:
+                return True
+            if isinstance(child, script.PyNode) and TestPrecedenceAnalysis.has_weak_op_for_comparison(child):
+                return True
+        return False
+
+    @staticmethod
+    def has_weak_op_for_addsub(node, check_comparison=True):
+        if check_comparison and TestPrecedenceAnalysis.has_weak_op_for_comparison(node):
+            return True
+        for child in node.children:
+            if child.type in script.NEWLINE_OK_TOKENS:
+                return False
+            if child.type in script.ADD_SUB_GROUP_TOKENS:
+                return True
+            if isinstance(child, script.PyNode) and TestPrecedenceAnalysis.has_weak_op_for_addsub(child, False):
+                return True
+        return False
+
+    def test_same_as_recursive(self):
+        source = dedent("""\
+            x = a + b * c - d[e, f + g] if h else i
+            y = (a
+                 + b) or not c and d in e and f not in g is not h is i
+            z = a << b | c & d ^ e >> f < g <= h == i != j >= k > l
+            w = -a ** b // c % d @ e, [a in b for a in c], {a: b or c}, lambda a: a
+            v = f(a, b=c + d)(e\
+                ).g[h + i] is None
+            u = a if (b
+                      and c) else d
+            """)
+        tree = refac.driver.parse_string(source)
+        num_checked = 0
+        # shared by the nodes, so the analysis of each node reuses the ones of the nodes it contains:
+        infos = {}
+        for node in tree.pre_order():
+            if isinstance(node, script.PyNode):
+                assert script.analyze_precedence(node, infos) == (
+                    self.has_weak_op_for_comparison(node), self.has_weak_op_for_addsub(node, False),
+                    self.contains_newline(node)), str(node)
+                assert script.contains_newline(node) == self.contains_newline(node), str(node)
+                assert script.has_weak_op_for_comparison(node) == self.has_weak_op_for_comparison(node), str(node)
+                assert script.has_weak_op_for_addsub(node) == self.has_weak_op_for_addsub(node), str(node)
+                assert (script.has_weak_op_for_addsub(node, check_comparison=False)
+                        == self.has_weak_op_for_addsub(node, False)), str(node)
+                num_checked += 1
+        assert num_checked > 50
+
+    def test_early_exit_and_reuse(self):
+        source = 'x = a == {}\n'.format(' + '.join('b{}'.format(index) for index in range(100)))
+        node = refac.driver.parse_string(source).children[0].children[0].children[2]
+        infos = {}
+        assert script.has_weak_op_for_comparison(node, infos)
+        # the pass stopped at ==, before visiting the right operand:
+        assert not infos
+
+        rhs = node.children[2]
+        assert not script.contains_newline(rhs, infos)
+        assert id(rhs) in infos
+        # the analysis of rhs is reused, and is still valid after its prefix changes:
+        rhs.prefix = '\n'
+        assert script.contains_newline(rhs, infos)
+        assert script.analyze_precedence(node, infos) == (True, True, True)
+
+    def test_deeply_nested(self):
+        factor = script.py_grammar_symbols['factor']
+        node = script.PyLeaf(script.token.NAME, 'a')
+        for _ in range(sys.getrecursionlimit() * 2):
+            node = script.PyNode(factor, [script.PyLeaf(script.token.MINUS, '-'), node])
+        node = script.PyNode(script.py_grammar_symbols['comparison'],
+                             [node, script.PyLeaf(script.token.EQEQUAL, '=='), script.PyLeaf(script.token.NAME, 'b')])
+        assert script.analyze_precedence(node) == (True, True, False)
+        assert script.get_prev_sibling(node.children[0]) is None
+
+
+class TestTokenEngine:
+
+    class DifferentialTool:
+        """Converts with fissix, and checks that another engine gives the same result when it can convert"""
+
+        def __init__(self, engine):
+            self.fissix_tool = NoseConversionRefactoringTool()
+            self.token_engine = NoseConversionRefactoringTool(engine=engine).token_engine
+            self.num_fallbacks = 0
+
+        def refactor_string(self, source, name):
+            tree = self.fissix_tool.refactor_string(source, name)
+            result = self.token_engine.convert(source, name)
+            if result is None:
+                self.num_fallbacks += 1
+            else:
+                assert result[1] == str(tree)
+            return tree
+
+        def __getattr__(self, name):
+            return getattr(self.fissix_tool, name)
+
+    @pytest.mark.parametrize('engine', ['tokenize', 'ast'])
+    def test_same_as_fissix(self, monkeypatch, engine):
+        tool = self.DifferentialTool(engine)
+        monkeypatch.setitem(globals(), 'refac', tool)
+        for test_class in (Test1Arg, Test2Args, Test3Args, TestRefactoringTool):
+            test_case = test_class()
+            for name in dir(test_case):
+                if name.startswith('test_'):
+                    getattr(test_case, name)()
+        assert tool.num_fallbacks == 0
+        assert tool.token_engine.num_simple_calls > 30 and tool.token_engine.num_parsed_statements > 30
+
+    @pytest.mark.parametrize('engine', ['tokenize', 'ast'])
+    def test_nested_calls(self, engine):
+        source = dedent("""\
+            assert_equal(ok_(a), b)
+            assert_in(f(assert_true(a)), x.ok_(b))
+            ok_(eq_(a, b))
+            assert_equal(a, b)
+            """)
+        fissix_tool = NoseConversionRefactoringTool(record_call_sites=True)
+        engine_tool = NoseConversionRefactoringTool(engine=engine, record_call_sites=True)
+        expected = fissix_tool._convert_source(b'', source, 'script')
+        assert engine_tool._convert_source(b'', source, 'script') == expected
+        assert expected[1].startswith('assert assert a == b\n')
+        assert engine_tool.token_engine.num_simple_calls == 1 and engine_tool.token_engine.num_parsed_statements == 3
+        assert sorted(engine_tool.call_sites[0][1]) == sorted(fissix_tool.call_sites[0][1])
+        assert len(engine_tool.call_sites[0][1]) == 7
+
+    def test_statements_parsed_by_fissix(self):
+        tool = NoseConversionRefactoringTool(engine='tokenize', record_call_sites=True)
+        source = dedent("""\
+            def test():
+                ok_(a)  # comment
+                assert_equal(a,
+                             b + c)  # comment
+                ok_(a); ok_(b)
+                assert_equal(a, b, msg="text")
+            """)
+        assert tool._convert_source(b'', source, 'script') == (True, dedent("""\
+            def test():
+                assert a  # comment
+                assert (a ==
+                             b + c)  # comment
+                assert a; assert b
+                assert a == b, "text"
+            """))
+        assert tool.token_engine.num_simple_calls == 1 and tool.token_engine.num_parsed_statements == 3
+        assert [call_site[:2] for call_site in tool.call_sites[0][1]] == [(2, 4), (3, 4), (5, 4), (5, 12), (6, 4)]
+
+    def test_fallback(self):
+        engine = NoseConversionRefactoringTool(engine='tokenize').token_engine
+        assert engine.convert('f(ok_(a))\n', 'script') is None
+        assert engine.convert('if a: ok_(b)\n', 'script') is None
+        assert engine.convert('ok_(a)\nx = = 1\n', 'script') is None
+        assert engine.convert('ok_(a\n', 'script') is None
+        assert engine.convert('from nose.tools import ok_\nself.ok_(a)\nok_ = 1\n', 'script') == (
+            False, 'from nose.tools import ok_\nself.ok_(a)\nok_ = 1\n')
+
+
+class TestAstEngine:
+
+    def test_statements(self):
+        tool = NoseConversionRefactoringTool(engine='ast', record_call_sites=True)
+        source = dedent("""\
+            def test():
+                if a: ok_(b)
+                ok_(a); assert_equal(a,
+                                     b + c)  # comment
+                (ok_(a))
+                x = ok_(a)
+                f(lambda: eq_(a, b))
+                é = 1; assert_equal('é', é)
+                assert_equal(*a)
+            """)
+        assert tool._convert_source(b'', source, 'script') == (True, dedent("""\
+            def test():
+                if a: assert b
+                assert a; assert (a ==
+                                     b + c)  # comment
+                assert a
+                x = ok_(a)
+                f(lambda: eq_(a, b))
+                é = 1; assert 'é' == é
+                assert_equal(*a)
+            """))
+        assert tool.token_engine.num_simple_calls == 4 and tool.token_engine.num_parsed_statements == 2
+        assert tool.call_sites[0][1] == [
+            (2, 10, 'ok_', 'converted'),
+            (3, 4, 'ok_', 'converted'),
+            (3, 12, 'assert_equal', 'converted'),
+            (5, 5, 'ok_', 'converted'),
+            (6, 8, 'ok_', 'left_alone'),
+            (7, 14, 'eq_', 'left_alone'),
+            (8, 11, 'assert_equal', 'converted'),
+            (9, 4, 'assert_equal', 'unsupported_args'),
+        ]
+
+    @pytest.mark.parametrize('engine', ['tokenize', 'ast'])
+    def test_await(self, engine):
+        source = dedent("""\
+            async def test():
+                assert_equal(await a,
+                             b)
+                ok_(await y)  # comment
+                ok_([x async for x in y]); ok_(a)
+            """)
+        tool = NoseConversionRefactoringTool(engine=engine, record_call_sites=True)
+        fissix_tool = NoseConversionRefactoringTool(record_call_sites=True)
+        assert tool.token_engine.convert(source, 'script') is not None
+        assert tool._convert_source(b'', source, 'script') == fissix_tool._convert_source(b'', source, 'script') == (
+            True, dedent("""\
+            async def test():
+                assert (await a ==
+                             b)
+                assert await y  # comment
+                assert [x async for x in y]; assert a
+            """))
+        assert tool.call_sites == fissix_tool.call_sites
+        assert [call_site[:2] for call_site in tool.call_sites[0][1]] == [(2, 4), (4, 4), (5, 4), (5, 31)]
+
+    @pytest.mark.skipif(sys.version_info < (3, 11), reason='match needs Python 3.10, except* needs Python 3.11')
+    def test_newer_syntax(self):
+        tool = NoseConversionRefactoringTool(engine='ast', record_call_sites=True)
+        source = dedent("""\
+            match x:
+                case [a, *rest]:
+                    assert_equal(a, rest[0])
+                case _:
+                    assert_true(x,
+                                "text")
+            try:
+                ok_(y)
+            except* ValueError:
+                assert_in(a[*b], c)
+                assert_in(a[*b],
+                          c)
+            """)
+        assert refac.refactor_string(source, 'script') is None
+        assert tool._convert_source(b'', source, 'script') == (True, dedent("""\
+            match x:
+                case [a, *rest]:
+                    assert a == rest[0]
+                case _:
+                    assert x, "text"
+            try:
+                assert y
+            except* ValueError:
+                assert a[*b] in c
+                assert_in(a[*b],
+                          c)
+            """))
+        # fissix cannot parse the last statement:
+        assert tool.call_sites[0][1][-1] == (11, 4, 'assert_in', 'left_alone')
+
+    def test_fallback(self):
+        engine = NoseConversionRefactoringTool(engine='ast').token_engine
+        assert engine.convert('ok_(a)\nx = = 1\n', 'script') is None
+        assert engine.convert('ok_(a\n', 'script') is None
+        assert engine.convert('from nose.tools import ok_\nself.ok_(a)\nok_ = 1\n', 'script') == (
+            False, 'from nose.tools import ok_\nself.ok_(a)\nok_ = 1\n')